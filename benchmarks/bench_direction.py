@@ -0,0 +1,62 @@
+# Benchmark for the vectorized bow direction engine.
+# Run from the repository root: python -m benchmarks.bench_direction
+import time
+import numpy as np
+import pandas as pd
+from collections import Counter
+from src.bow_direction_pca import directions_by_keypoint, direction_codes, majority_smooth, DIRECTION_LABELS
+
+num_frames = 1_000_000  # Frames per keypoint trajectory
+num_keypoints = 3
+window_sizes = [5, 51, 501]
+reference_frames = 100_000  # The per-element Counter loop is only timed on a prefix
+
+def synthetic_trajectories(num_frames, num_keypoints, seed=0):
+    """Bow-like back-and-forth strokes along a tilted axis with jitter, one trajectory per keypoint."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(num_frames)
+    tables = []
+    for keypoint_index in range(num_keypoints):
+        stroke = 100 * np.sin(2 * np.pi * t / rng.uniform(40, 90))
+        tables.append(pd.DataFrame({
+            'Frame': t,
+            'Keypoint Index': keypoint_index,
+            'X': 640 + stroke + rng.normal(0, 1, num_frames),
+            'Y': 360 + 0.3 * stroke + rng.normal(0, 1, num_frames)
+        }))
+    return pd.concat(tables, ignore_index=True)
+
+def counter_smooth(directions, window_size):
+    """The original per-element sliding-window majority, kept here as the baseline."""
+    smoothed = []
+    for i in range(len(directions)):
+        start = max(0, i - window_size // 2)
+        end = min(len(directions), i + window_size // 2 + 1)
+        smoothed.append(Counter(directions[start:end]).most_common(1)[0][0])
+    return smoothed
+
+def main():
+    df = synthetic_trajectories(num_frames, num_keypoints)
+    print(f"{num_keypoints} keypoints x {num_frames} frames")
+
+    for window_size in window_sizes:
+        start = time.perf_counter()
+        directions_by_keypoint(df, window_size)
+        elapsed = time.perf_counter() - start
+        print(f"window={window_size:4d}  engine: {elapsed:.3f}s  ({num_keypoints * num_frames / elapsed:,.0f} frames/s)")
+
+    # Compare the smoothing step alone against the Counter loop on a prefix
+    codes = direction_codes(df['X'].values[:reference_frames], 'X')
+    labels = DIRECTION_LABELS[codes].tolist()
+    for window_size in window_sizes:
+        start = time.perf_counter()
+        majority_smooth(codes, window_size)
+        vectorized = time.perf_counter() - start
+        start = time.perf_counter()
+        counter_smooth(labels, window_size)
+        baseline = time.perf_counter() - start
+        print(f"window={window_size:4d}  smoothing {reference_frames} steps: "
+              f"vectorized {vectorized:.4f}s, Counter loop {baseline:.3f}s ({baseline / vectorized:.0f}x)")
+
+if __name__ == "__main__":
+    main()
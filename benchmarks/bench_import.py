@@ -0,0 +1,58 @@
+# Measures how long each entry point takes to import, i.e. the startup cost before any work is done.
+# Run from the repository root: python -m benchmarks.bench_import
+import os
+import subprocess
+import sys
+
+entry_points = [
+    'script_direction',
+    'script_sync',
+    'script_visualization',
+    'script_pitch',
+    'script_keypoint',
+    'script_metrabs',
+    'script_pipeline',
+]
+repeats = 5
+fast_entry_points = ['script_direction', 'script_sync', 'script_visualization']
+fast_limit = 1.0  # Seconds
+
+# Each measurement runs in a fresh interpreter so nothing is already imported
+timing_code = '''
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+'''
+
+def import_time(module):
+    """Returns the wall-clock import time of a module in a fresh interpreter, or the error it raised."""
+    result = subprocess.run([sys.executable, '-c', timing_code.format(module=module)],
+                            capture_output=True, text=True, cwd=os.getcwd())
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1]
+    return float(result.stdout.strip().splitlines()[-1]), None
+
+def main():
+    print(f"{'entry point':<22}{'min':>9}{'median':>9}")
+    slow = []
+    for module in entry_points:
+        times = []
+        for _ in range(repeats):
+            seconds, error = import_time(module)
+            if error:
+                break
+            times.append(seconds)
+        if not times:
+            print(f"{module:<22}  FAILED: {error}")
+            continue
+        times.sort()
+        print(f"{module:<22}{times[0]:>8.3f}s{times[len(times) // 2]:>8.3f}s")
+        if module in fast_entry_points and times[len(times) // 2] > fast_limit:
+            slow.append(module)
+
+    if slow:
+        print(f"Slower than {fast_limit:.1f}s to start: {', '.join(slow)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# Compares CSV against the binary table formats for the hand-offs between pipeline stages.
+# Run from the repository root: python -m benchmarks.bench_io
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from src.columnar_io import save_table, load_table
+
+take_minutes = 60  # Length of the synthetic take
+fps = 30
+num_joints = 24  # METRABS smpl_24 keypoints per frame
+formats = ['csv', 'npz']
+
+def synthetic_tables(num_frames, seed=0):
+    """Keypoint, direction and annotation tables shaped like the real stage outputs of one take."""
+    rng = np.random.default_rng(seed)
+    frames = np.arange(num_frames)
+    keypoints = pd.DataFrame({
+        'Frame': np.repeat(frames, num_joints),
+        'Keypoint Index': np.tile(np.arange(num_joints), num_frames),
+        'X': rng.uniform(0, 1920, num_frames * num_joints),
+        'Y': rng.uniform(0, 1080, num_frames * num_joints)
+    })
+    directions = pd.DataFrame({
+        'Frame Start': frames[:-1],
+        'Frame End': frames[1:],
+        'Direction': rng.choice(['Up', 'Down', 'Stationary'], num_frames - 1)
+    })
+    annotations = pd.DataFrame({
+        'Frame': frames,
+        'Time (s)': frames / fps,
+        'Note': rng.choice(['C2', 'G2', 'D3', 'A3', None], num_frames),
+        'Event': rng.choice(['change', 'sustain', 'silence'], num_frames),
+        'Annotation': rng.choice(['Up', 'Down', 'silence'], num_frames)
+    })
+    return {'keypoints': keypoints, 'directions': directions, 'annotations': annotations}
+
+def main():
+    num_frames = take_minutes * 60 * fps
+    tables = synthetic_tables(num_frames)
+    print(f"{take_minutes}-minute take ({num_frames} frames)")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, df in tables.items():
+            for table_format in formats:
+                path = os.path.join(tmp_dir, f"{name}.{table_format}")
+                start = time.perf_counter()
+                save_table(df, path)
+                write_time = time.perf_counter() - start
+                start = time.perf_counter()
+                load_table(path)
+                read_time = time.perf_counter() - start
+                size_mb = os.path.getsize(path) / 1e6
+                print(f"{name:12s} {table_format:4s} {len(df):9d} rows  write {write_time:6.2f}s  "
+                      f"read {read_time:6.2f}s  size {size_mb:8.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Speedup and joint error of METRABS keyframe modes against running the model on every frame.
+# Run from the repository root: python -m benchmarks.bench_metrabs_keyframes VIDEO [--intervals 3 5 10] [--fill linear flow]
+#     [--motion-threshold T] [--bowing-joints] [--store models] [--json PATH]
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from src.columnar_io import load_table
+from src.metrabs_keypoint_tracking import BOWING_JOINTS, load_model, process_video, process_video_keyframes
+
+def keypoint_error(reference_table, table):
+    """Pixel distance per (frame, joint) of the first detected pose, between a table and the every-frame reference."""
+    columns = ['Frame', 'Keypoint Index']
+    merged = reference_table.drop_duplicates(columns).merge(table.drop_duplicates(columns), on=columns,
+                                                            suffixes=('_reference', ''))
+    distances = np.hypot(merged['X'] - merged['X_reference'], merged['Y'] - merged['Y_reference']).values
+    return {
+        'compared': len(distances),
+        'mean_px': float(distances.mean()) if len(distances) else float('nan'),
+        'p95_px': float(np.percentile(distances, 95)) if len(distances) else float('nan'),
+        'within_10px': float((distances <= 10).mean()) if len(distances) else float('nan'),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Speedup and joint error of the METRABS keyframe modes.')
+    parser.add_argument('video', help='Input video')
+    parser.add_argument('--intervals', type=int, nargs='*', default=[3, 5, 10], help='Keyframe intervals to test')
+    parser.add_argument('--fill', nargs='*', default=['linear', 'flow'], help="Fill methods ('linear', 'flow')")
+    parser.add_argument('--motion-threshold', type=float, help='Also test adaptive keyframes with this threshold')
+    parser.add_argument('--bowing-joints', action='store_true', help='Keep only the bowing-arm joints')
+    parser.add_argument('--model-type', default='metrabs_mob3l_y4t')
+    parser.add_argument('--store', default='models', help='Model store directory')
+    parser.add_argument('--json', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    model = load_model(args.model_type, store_dir=args.store)
+    joints = BOWING_JOINTS if args.bowing_joints else None
+    settings = [(interval, fill, None) for interval in args.intervals for fill in args.fill]
+    if args.motion_threshold is not None:
+        settings += [(max(args.intervals), fill, args.motion_threshold) for fill in args.fill]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reference_path = os.path.join(tmp_dir, 'reference.csv')
+        start = time.perf_counter()
+        process_video(model, args.video, None, reference_path)
+        reference_seconds = time.perf_counter() - start
+        reference_table = load_table(reference_path)
+        if joints is not None:
+            reference_table = reference_table[reference_table['Keypoint Index'].isin(joints)]
+
+        print(f"\n{'interval':>9}{'fill':>8}{'motion':>8}{'calls':>8}{'speedup':>10}{'mean px':>10}{'p95 px':>9}{'<=10px':>9}")
+        print(f"{1:>9}{'-':>8}{'-':>8}{'all':>8}{1.0:>9.1f}x{0.0:>10.2f}{0.0:>9.2f}{1.0:>9.3f}")
+        for interval, fill, motion_threshold in settings:
+            table_path = os.path.join(tmp_dir, f"keyframes_{interval}_{fill}.csv")
+            stats = process_video_keyframes(model, args.video, None, table_path, keyframe_interval=interval,
+                                            motion_threshold=motion_threshold, fill=fill, joints=joints)
+            error = keypoint_error(reference_table, load_table(table_path))
+            speedup = reference_seconds / stats['seconds']
+            motion = f"{motion_threshold:g}" if motion_threshold is not None else '-'
+            print(f"{interval:>9}{fill:>8}{motion:>8}{stats['keyframes']:>8}{speedup:>9.1f}x"
+                  f"{error['mean_px']:>10.2f}{error['p95_px']:>9.2f}{error['within_10px']:>9.3f}")
+            results.append(dict(error, **stats, interval=interval, fill=fill, motion_threshold=motion_threshold,
+                                speedup=speedup, reference_seconds=reference_seconds))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to: {args.json}")
+
+if __name__ == '__main__':
+    main()
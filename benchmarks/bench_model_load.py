@@ -0,0 +1,104 @@
+# Cold- and warm-load times of the models, from their original files and from the local model store.
+# Run from the repository root: python -m benchmarks.bench_model_load [--tapir-checkpoint PATH] [--metrabs MODEL]
+# Without a TAPIR checkpoint, a synthetic one of the same size (about 31M float32 parameters) is used.
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+from src.model_store import MANIFEST_NAME, tapir_model_dir
+
+repeats = 3
+
+# Each load runs in a fresh interpreter and prints its own elapsed time
+load_code = {
+    'npy': '''
+import time, numpy as np
+start = time.perf_counter()
+ckpt = np.load({path!r}, allow_pickle=True).item()
+print(time.perf_counter() - start)
+''',
+    'store': '''
+import time
+from src.model_store import load_tapir_params, _flatten
+start = time.perf_counter()
+params, state = load_tapir_params({path!r})
+for _, array in _flatten({{'params': params, 'state': state}}):
+    array.sum()  # Touch every page, as the first inference does
+print(time.perf_counter() - start)
+''',
+    'metrabs': '''
+import time, tensorflow as tf
+start = time.perf_counter()
+model = tf.saved_model.load({path!r})
+print(time.perf_counter() - start)
+''',
+}
+
+def synthetic_checkpoint(path, num_params=31_000_000, num_arrays=250, seed=0):
+    """Writes a pickled checkpoint with TAPIR's nested params/state layout and roughly its size."""
+    rng = np.random.default_rng(seed)
+    sizes = rng.dirichlet(np.ones(num_arrays)) * num_params
+    params = {}
+    for i, size in enumerate(sizes):
+        module = params.setdefault(f"tapir/~/module_{i // 4}", {})
+        module[f"w{i % 4}"] = rng.standard_normal(max(int(size), 1)).astype(np.float32)
+    np.save(path, {'params': params, 'state': {}}, allow_pickle=True)
+
+def evict(path):
+    """Drops a file (or every file under a directory) from the page cache, so the next read is cold."""
+    paths = [path] if os.path.isfile(path) else [os.path.join(root, name) for root, _, names in os.walk(path) for name in names]
+    for file_path in paths:
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+def timed_load(kind, path):
+    result = subprocess.run([sys.executable, '-c', load_code[kind].format(path=path)], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout.strip().splitlines()[-1])
+
+def measure(label, kind, path):
+    try:
+        cold = []
+        for _ in range(repeats):
+            evict(path)
+            cold.append(timed_load(kind, path))
+        warm = [timed_load(kind, path) for _ in range(repeats)]
+    except RuntimeError as e:
+        print(f"{label:<34}  FAILED: {e}")
+        return
+    print(f"{label:<34}{min(cold):>9.3f}s{min(warm):>9.3f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold- and warm-load times of the models.')
+    parser.add_argument('--tapir-checkpoint', help='Pickled TAPIR .npy checkpoint (default: synthetic)')
+    parser.add_argument('--metrabs', help='METRABS model name already fetched into the store')
+    parser.add_argument('--store', default=None, help='Model store directory (default: a temporary directory)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store_dir = args.store or os.path.join(tmp_dir, 'models')
+        checkpoint_path = args.tapir_checkpoint
+        if not checkpoint_path:
+            checkpoint_path = os.path.join(tmp_dir, 'tapir_checkpoint_synthetic.npy')
+            synthetic_checkpoint(checkpoint_path)
+        model_dir = tapir_model_dir(checkpoint_path, store_dir)
+
+        print(f"{'model':<34}{'cold':>10}{'warm':>10}")
+        measure('tapir: pickled .npy', 'npy', checkpoint_path)
+        measure('tapir: model store (mmap)', 'store', model_dir)
+        if args.metrabs:
+            metrabs_dir = os.path.join(store_dir, args.metrabs)
+            if os.path.exists(os.path.join(metrabs_dir, MANIFEST_NAME)):
+                measure(f'metrabs: {args.metrabs} (store)', 'metrabs', metrabs_dir)
+            else:
+                print(f"metrabs: {args.metrabs} is not in {store_dir}; run script_metrabs.py once to fetch it")
+
+if __name__ == '__main__':
+    main()
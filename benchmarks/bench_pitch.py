@@ -0,0 +1,73 @@
+# Speed and note accuracy of the CREPE settings (model capacity, silence gate, CPU precision) against the full fp32 run.
+# Run from the repository root: python -m benchmarks.bench_pitch [AUDIO ...] [--seconds N] [--precision int8 bf16] [--threads N] [--json PATH]
+# Without audio files, a synthetic tone-plus-silence recording is used (two thirds playing).
+import argparse
+import json
+import os
+import tempfile
+import time
+from src.audio_frontend import AudioBuffer, CREPE_SAMPLE_RATE
+from src.pitch_detection import load_torchcrepe_model, pitch_detect_crepe, infer_note_positions_with_silence, note_agreement
+from benchmarks.synthetic import make_wav
+
+# (model, silence_gate, precision); the first entry is the reference
+settings = [('full', False, 'fp32'), ('full', True, 'fp32'), ('tiny', False, 'fp32'), ('tiny', True, 'fp32')]
+
+def run_setting(audio, model, silence_gate, precision, num_threads, output_dir):
+    """Returns the CREPE time and the inferred notes of one setting."""
+    load_torchcrepe_model(model, precision, num_threads)  # Keep weight loading out of the timing
+    start = time.perf_counter()
+    pitch_results, silence = pitch_detect_crepe('torch', f"{model}_{precision}_{'gated' if silence_gate else 'full'}", 0, 1, 1,
+                                                output_dir=output_dir, audio=audio, plot=False,
+                                                model=model, silence_gate=silence_gate, return_silence=True)
+    elapsed = time.perf_counter() - start
+    return elapsed, infer_note_positions_with_silence(pitch_results, None, audio=audio, silence=silence)
+
+def benchmark_file(audio_path, output_dir, settings, num_threads=None):
+    import librosa
+    y, sr = librosa.load(audio_path, sr=CREPE_SAMPLE_RATE, mono=True)
+    audio = AudioBuffer(y, sr)
+    print(f"\n{audio_path} ({audio.duration:.0f} s)")
+    print(f"{'model':<8}{'gate':<8}{'precision':<11}{'time':>10}{'speedup':>10}{'agreement':>12}{'on notes':>10}")
+
+    results = []
+    reference_time, reference_notes = None, None
+    for model, silence_gate, precision in settings:
+        elapsed, notes = run_setting(audio, model, silence_gate, precision, num_threads, output_dir)
+        if reference_notes is None:
+            reference_time, reference_notes = elapsed, notes
+        agreement = note_agreement(reference_notes, notes)
+        speedup = reference_time / elapsed
+        print(f"{model:<8}{'on' if silence_gate else 'off':<8}{precision:<11}{elapsed:>9.2f}s{speedup:>9.1f}x"
+              f"{agreement['agreement']:>12.3f}{agreement['note_agreement']:>10.3f}")
+        results.append(dict(agreement, audio=audio_path, model=model, silence_gate=silence_gate,
+                            precision=precision, seconds=elapsed, speedup=speedup))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Speed and note accuracy of the CREPE settings.')
+    parser.add_argument('audio', nargs='*', help='Audio files (default: a synthetic recording)')
+    parser.add_argument('--seconds', type=float, default=60, help='Length of the synthetic recording')
+    parser.add_argument('--precision', nargs='*', default=['int8'], help='Reduced CPU precisions to add (int8, bf16); int8 only quantizes the final linear layer')
+    parser.add_argument('--threads', type=int, help='Torch intra-op threads')
+    parser.add_argument('--json', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    run_settings = settings + [(model, silence_gate, precision) for precision in args.precision
+                               for model, silence_gate in (('full', False), ('full', True))]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        audio_paths = args.audio
+        if not audio_paths:
+            audio_paths = [os.path.join(tmp_dir, 'synthetic.wav')]
+            make_wav(audio_paths[0], args.seconds)
+        for audio_path in audio_paths:
+            results += benchmark_file(audio_path, tmp_dir, run_settings, args.threads)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to: {args.json}")
+
+if __name__ == '__main__':
+    main()
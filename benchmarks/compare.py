@@ -0,0 +1,25 @@
+# Compares two benchmark result files written by benchmarks.run_benchmarks.
+# Run from the repository root: python -m benchmarks.compare before.json after.json
+import json
+import sys
+
+def load_results(path):
+    with open(path, 'r') as f:
+        report = json.load(f)
+    return {(r['stage'], r['seconds_of_input']): r for r in report['results'] if 'error' not in r}
+
+def compare(before_path, after_path):
+    before, after = load_results(before_path), load_results(after_path)
+    print(f"{'stage':14s} {'input':>7s} {'before':>9s} {'after':>9s} {'speedup':>8s} {'RSS before':>11s} {'RSS after':>10s}")
+    for key in sorted(before.keys() & after.keys()):
+        b, a = before[key], after[key]
+        print(f"{key[0]:14s} {key[1]:6g}s {b['elapsed']:8.2f}s {a['elapsed']:8.2f}s "
+              f"{b['elapsed'] / max(a['elapsed'], 1e-9):7.2f}x {b['peak_rss_mb']:9.1f}MB {a['peak_rss_mb']:8.1f}MB")
+    for key in sorted(before.keys() ^ after.keys()):
+        print(f"{key[0]:14s} {key[1]:6g}s only in {'before' if key in before else 'after'}")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python -m benchmarks.compare before.json after.json")
+        sys.exit(1)
+    compare(sys.argv[1], sys.argv[2])
@@ -0,0 +1,186 @@
+# CPU benchmark suite for the pipeline stages on synthetic inputs.
+# Run from the repository root, e.g.:
+#   python -m benchmarks.run_benchmarks --stub-models --seconds 10 30 60 --output bench.json
+#   python -m benchmarks.compare before.json after.json
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from benchmarks.synthetic import make_inputs
+
+STAGES = ['tapir', 'pitch', 'silence', 'direction', 'sync', 'visualization']
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MB (ru_maxrss is in KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def stub_tapir():
+    """TAPIR tracker whose inference returns the query points unchanged, to time everything around the model."""
+    from src.tapir_keypoint_tracking import TapirKeypointTracking
+
+    class StubTapirKeypointTracking(TapirKeypointTracking):
+        def __init__(self):
+            self._compiled = {}
+            self._compilation_cache_dir = None
+
+        def run_inference(self, frames, query_points):
+            num_frames = frames.shape[0]
+            tracks = np.repeat(query_points[:, None, [2, 1]], num_frames, axis=1).astype(np.float32)
+            visibles = np.ones((len(query_points), num_frames), dtype=bool)
+            return tracks, visibles, {'bucket': num_frames, 'compile_time': 0.0, 'cache': 'stub'}
+
+    return StubTapirKeypointTracking()
+
+def stub_torchcrepe():
+    """Replaces torchcrepe.predict with constant output of the right shape."""
+    import torch
+    import torchcrepe
+
+    def predict(audio, sample_rate, hop_length=None, return_periodicity=False, **kwargs):
+        hop_16k = int(hop_length * torchcrepe.SAMPLE_RATE / sample_rate)
+        num_frames = 1 + int(audio.shape[-1] * torchcrepe.SAMPLE_RATE / sample_rate) // hop_16k
+        frequency = torch.full((1, num_frames), 220.0)
+        periodicity = torch.ones((1, num_frames))
+        return (frequency, periodicity) if return_periodicity else frequency
+
+    torchcrepe.predict = predict
+
+# Each stage runs on the synthetic inputs and returns the number of frames it processed
+
+def run_tapir(inputs, out_dir, stub, checkpoint_path):
+    if stub:
+        tracker = stub_tapir()
+    else:
+        from src.tapir_keypoint_tracking import TapirKeypointTracking
+        tracker = TapirKeypointTracking(checkpoint_path)
+    # The marker starts at (0.25 * width, 0.5 * height), i.e. (64, 128) in 256x256 coordinates
+    keypoints = np.array([(0, 128, 64)], dtype=np.float32)
+    tracker.track_keypoints(inputs['video'], keypoints, os.path.join(out_dir, 'tapir.mp4'), os.path.join(out_dir, 'tapir.csv'))
+    return inputs['num_frames']
+
+def run_pitch(inputs, out_dir, stub, checkpoint_path):
+    if stub:
+        stub_torchcrepe()
+    from src.pitch_detection import pitch_detect_crepe
+    pitch_detect_crepe('torch', 'bench', 0, inputs['num_frames'], inputs['seconds'], audio_path=inputs['audio'], output_dir=out_dir)
+    return inputs['num_frames']
+
+def run_silence(inputs, out_dir, stub, checkpoint_path):
+    from src.pitch_detection import detect_silence
+    detect_silence(inputs['audio'], fps=inputs['fps'])
+    return inputs['num_frames']
+
+def run_direction(inputs, out_dir, stub, checkpoint_path):
+    from src.bow_direction_pca import compute_movement_directions
+    compute_movement_directions(inputs['keypoints'], os.path.join(out_dir, 'direction.csv'))
+    return inputs['num_frames']
+
+def run_sync(inputs, out_dir, stub, checkpoint_path):
+    from src.frame_sync import annotate_frames
+    annotate_frames(inputs['events'], inputs['directions'], os.path.join(out_dir, 'annotated.csv'))
+    return inputs['num_frames']
+
+def run_visualization(inputs, out_dir, stub, checkpoint_path):
+    from src.visualization import annotate_video
+    annotate_video(inputs['video'], inputs['annotations'], os.path.join(out_dir, 'annotated.mp4'))
+    return inputs['num_frames']
+
+STAGE_FUNCTIONS = {
+    'tapir': run_tapir,
+    'pitch': run_pitch,
+    'silence': run_silence,
+    'direction': run_direction,
+    'sync': run_sync,
+    'visualization': run_visualization,
+}
+
+# Modules imported before timing starts, so that import cost is not counted as stage time. The src/
+# modules load their model and plotting backends lazily, so those are listed explicitly
+STAGE_MODULES = {
+    'tapir': ('src.tapir_keypoint_tracking', 'mediapy', 'tapnet.utils.transforms'),
+    'pitch': ('src.pitch_detection', 'librosa', 'matplotlib.pyplot', 'torchcrepe'),
+    'silence': ('src.pitch_detection', 'librosa'),
+    'direction': ('src.bow_direction_pca', 'sklearn.decomposition'),
+    'sync': ('src.frame_sync',),
+    'visualization': ('src.visualization',),
+}
+
+def measure_stage(stage, inputs, out_dir, stub, checkpoint_path):
+    """Runs one stage in the current (fresh) process and returns its timing and memory figures."""
+    for module in STAGE_MODULES[stage]:
+        importlib.import_module(module)
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    num_frames = STAGE_FUNCTIONS[stage](inputs, out_dir, stub, checkpoint_path)
+    elapsed = time.perf_counter() - start
+    return {
+        'stage': stage,
+        'seconds_of_input': inputs['seconds'],
+        'frames': num_frames,
+        'elapsed': elapsed,
+        'frames_per_second': num_frames / max(elapsed, 1e-9),
+        'peak_rss_mb': peak_rss_mb(),
+        'rss_before_mb': rss_before,
+        'stub': stub and stage in ('tapir', 'pitch'),
+    }
+
+def run_suite(stages, lengths, width, height, stub, checkpoint_path):
+    """Generates inputs for each length and runs every stage in its own process, so peak RSS is per stage."""
+    results = []
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for seconds in lengths:
+            input_dir = os.path.join(tmp_dir, f"{seconds}s")
+            inputs = make_inputs(input_dir, seconds, width=width, height=height)
+            for stage in stages:
+                out_dir = os.path.join(input_dir, stage)
+                os.makedirs(out_dir, exist_ok=True)
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    try:
+                        result = executor.submit(measure_stage, stage, inputs, out_dir, stub, checkpoint_path).result()
+                    except Exception as e:
+                        result = {'stage': stage, 'seconds_of_input': seconds, 'error': repr(e)}
+                results.append(result)
+                if 'error' in result:
+                    print(f"{stage:14s} {seconds:6g}s  FAILED: {result['error']}")
+                else:
+                    print(f"{stage:14s} {seconds:6g}s  {result['elapsed']:8.2f}s  "
+                          f"{result['frames_per_second']:10.1f} frames/s  peak RSS {result['peak_rss_mb']:8.1f} MB")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--seconds', nargs='+', type=float, default=[10, 30], help='Input lengths to test scaling with')
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=360)
+    parser.add_argument('--stub-models', action='store_true', help='Replace TAPIR and CREPE inference with stubs')
+    parser.add_argument('--checkpoint', default='data/tapir_checkpoint_panning.npy', help='TAPIR checkpoint (without --stub-models)')
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args()
+
+    results = run_suite(args.stages, args.seconds, args.width, args.height, args.stub_models, args.checkpoint)
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'resolution': [args.width, args.height],
+            'stub_models': args.stub_models,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark results saved to: {args.output}")
+
+if __name__ == "__main__":
+    main()
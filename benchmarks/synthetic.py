@@ -0,0 +1,78 @@
+# Synthetic inputs for the benchmark suite: a video with a moving bow-like marker, a
+# tone-plus-silence recording, and the intermediate tables the later stages consume.
+import os
+import cv2
+import numpy as np
+import pandas as pd
+from scipy.io import wavfile
+
+def marker_positions(num_frames, width, height, stroke_frames=45):
+    """X, Y pixel positions of the marker: back-and-forth bow strokes along a slightly tilted line."""
+    t = np.arange(num_frames)
+    phase = np.abs((t / stroke_frames) % 2 - 1)  # Triangle wave in [0, 1]
+    x = width * (0.25 + 0.5 * phase)
+    y = height * (0.5 + 0.1 * (phase - 0.5))
+    return x, y
+
+def make_video(path, num_frames, width=640, height=360, fps=30):
+    """Writes a video of a bow-like bar with a marker dot at the tracked point."""
+    x, y = marker_positions(num_frames, width, height)
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    writer = cv2.VideoWriter(path, fourcc, fps, (width, height))
+    background = np.full((height, width, 3), 40, dtype=np.uint8)
+    for frame_idx in range(num_frames):
+        frame = background.copy()
+        center = (int(x[frame_idx]), int(y[frame_idx]))
+        cv2.line(frame, (center[0] - width // 4, center[1] + 10), (center[0] + width // 4, center[1] - 10), (200, 180, 140), 4)
+        cv2.circle(frame, center, 6, (0, 0, 255), -1)
+        writer.write(frame)
+    writer.release()
+
+def tone_mask(num_samples, sample_rate, tone_seconds=2.0, silence_seconds=1.0):
+    """True where the recording plays the tone, alternating tone and silence."""
+    t = np.arange(num_samples) / sample_rate
+    return (t % (tone_seconds + silence_seconds)) < tone_seconds
+
+def make_wav(path, seconds, sample_rate=22050, tone_hz=220.0):
+    """Writes a 16-bit WAV alternating a harmonic tone with silence."""
+    num_samples = int(seconds * sample_rate)
+    t = np.arange(num_samples) / sample_rate
+    tone = sum(np.sin(2 * np.pi * tone_hz * k * t) / k for k in (1, 2, 3))
+    signal = 0.3 * tone * tone_mask(num_samples, sample_rate)
+    wavfile.write(path, sample_rate, (signal * 32767).astype(np.int16))
+
+def make_tables(output_dir, num_frames, width=640, height=360, fps=30, frame_offset=300):
+    """Writes keypoints, direction, events and annotation tables matching the synthetic video and audio."""
+    x, y = marker_positions(num_frames, width, height)
+    frames = np.arange(num_frames)
+    paths = {name: os.path.join(output_dir, f"{name}.csv") for name in ('keypoints', 'directions', 'events', 'annotations')}
+
+    pd.DataFrame({'Frame': frames, 'Keypoint Index': 0, 'X': x, 'Y': y}).to_csv(paths['keypoints'], index=False)
+
+    step = np.sign(np.diff(x))
+    directions = np.where(step > 0, 'Up', np.where(step < 0, 'Down', 'Stationary'))
+    pd.DataFrame({'Frame Start': frames[:-1], 'Frame End': frames[1:], 'Direction': directions}).to_csv(paths['directions'], index=False)
+
+    # One pitch event per frame, silent where the tone is off
+    playing = tone_mask(num_frames, fps)
+    pd.DataFrame({
+        'Frame': frames + frame_offset + 0.5,
+        'Time (s)': frames / fps,
+        'Note': np.where(playing, 'A3', None),
+        'Event': np.where(playing, 'sustain', 'silence')
+    }).to_csv(paths['events'], index=False)
+
+    annotations = np.where(playing[:-1], directions, 'silence')
+    pd.DataFrame({'Frame': frames[:-1], 'Annotation': annotations}).to_csv(paths['annotations'], index=False)
+    return paths
+
+def make_inputs(output_dir, seconds, width=640, height=360, fps=30, sample_rate=22050):
+    """Generates every synthetic input for one input length and returns their paths."""
+    os.makedirs(output_dir, exist_ok=True)
+    num_frames = int(seconds * fps)
+    paths = {'video': os.path.join(output_dir, 'video.mp4'), 'audio': os.path.join(output_dir, 'audio.wav')}
+    make_video(paths['video'], num_frames, width, height, fps)
+    make_wav(paths['audio'], seconds, sample_rate)
+    paths.update(make_tables(output_dir, num_frames, width, height, fps))
+    paths.update({'num_frames': num_frames, 'seconds': seconds, 'width': width, 'height': height, 'fps': fps})
+    return paths
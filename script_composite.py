@@ -0,0 +1,20 @@
+from src.batch_executor import atomic_output
+from src.compositor import composite_outputs
+
+# Source video and the stage outputs to overlay on it (set a path to None to leave that layer out)
+base_video_path = 'data/cello/input_video/cello01.avi'
+points_path = 'result/cello/output_csv/cello01_keypoints.csv'  # TAPIR tracked points
+pose_path = None  # METRABS keypoints table, drawn as smpl_24 skeletons
+annotations_path = 'result/cello/annotated_output/cello01_annotated.csv'  # Directions, silences and notes from script_sync.py
+output_video_path = 'result/cello/cello01_composite.mp4'
+
+# Layers drawn from the annotations table
+show_arrows = True
+show_silence = True
+show_notes = True
+
+if __name__ == "__main__":
+    # Decode the source once, draw every layer and encode once
+    with atomic_output(output_video_path) as tmp_output_path:
+        composite_outputs(base_video_path, tmp_output_path, points_path=points_path, pose_path=pose_path,
+                          annotations_path=annotations_path, arrows=show_arrows, silence=show_silence, notes=show_notes)
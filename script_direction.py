@@ -1,58 +1,70 @@
 import os
-import matplotlib.pyplot as plt
+import numpy as np
+from src.batch_executor import atomic_output, run_batch
 from src.bow_direction_pca import compute_movement_directions
+from src.columnar_io import TABLE_EXTENSIONS
+from src.plotting import new_figure, save_figure, submit_plot, wait_for_plots
 
-def plot_trajectory_with_pca(csv_path, output_csv_path, plot_output_path):
-    # Compute movement directions and PCA coordinates
-    pca_coords, smoothed_directions = compute_movement_directions(csv_path, output_csv_path)
+table_format = 'csv'  # Output format: 'csv', or 'npz'/'parquet' for typed binary tables
+num_workers = None  # Worker processes (None for one per CPU)
+make_plots = True  # Save trajectory plots, rendered in the background after each direction table is written
 
-    # Visualize the trajectory with PCA applied
-    plt.figure(figsize=(1280 / 100, 720 / 100))  # Set figure size to 1280x720 pixels
+# Colors of the trajectory segments by smoothed direction
+DIRECTION_COLORS = {"Up": 'green', "Down": 'red'}
 
-    # Mark the first and last points
-    plt.scatter(pca_coords[0, 0], pca_coords[0, 1], color='red', s=150, label='Start Point')
-    plt.scatter(pca_coords[-1, 0], pca_coords[-1, 1], color='red', s=150, label='End Point')
+def plot_trajectory_with_pca(pca_coords, smoothed_directions, plot_output_path):
+    from matplotlib.collections import LineCollection
 
-    # Plot the transformed trajectory
-    for i in range(len(smoothed_directions)):
-        start_x, start_y = pca_coords[i, 0], pca_coords[i, 1]
-        end_x, end_y = pca_coords[i + 1, 0], pca_coords[i + 1, 1]
+    # Visualize the trajectory with PCA applied
+    fig = new_figure(figsize=(1280 / 100, 720 / 100))  # Set figure size to 1280x720 pixels
+    ax = fig.subplots()
 
-        # Assign colors based on smoothed direction
-        if smoothed_directions[i] == "Up":
-            color = 'green'
-        elif smoothed_directions[i] == "Down":
-            color = 'red'
-        else:
-            color = 'yellow'
+    # Mark the first and last points
+    ax.scatter(pca_coords[0, 0], pca_coords[0, 1], color='red', s=150, label='Start Point')
+    ax.scatter(pca_coords[-1, 0], pca_coords[-1, 1], color='red', s=150, label='End Point')
 
-        # Plot the segment with color-coded direction
-        plt.plot([start_x, end_x], [start_y, end_y], color=color, linewidth=2)
+    # Plot the transformed trajectory as one collection of segments, color-coded by smoothed direction
+    segments = np.stack((pca_coords[:-1, :2], pca_coords[1:, :2]), axis=1)
+    colors = [DIRECTION_COLORS.get(direction, 'yellow') for direction in smoothed_directions]
+    ax.add_collection(LineCollection(segments, colors=colors, linewidths=2))
+    ax.autoscale_view()
 
-    plt.gca().invert_yaxis()  # Invert Y-axis to match image coordinate systems
+    ax.invert_yaxis()  # Invert Y-axis to match image coordinate systems
 
-    plt.title('Trajectory of Keypoint 1 (PCA Transformed with Smoothed Directions)')
-    plt.xlabel('Principal Component 1')
-    plt.ylabel('Principal Component 2')
-    plt.grid()
-    plt.legend()
+    ax.set_title('Trajectory of Keypoint 1 (PCA Transformed with Smoothed Directions)')
+    ax.set_xlabel('Principal Component 1')
+    ax.set_ylabel('Principal Component 2')
+    ax.grid()
+    ax.legend()
 
     # Save the plot to a file
-    plt.savefig(plot_output_path, dpi=100, bbox_inches='tight')
-    plt.show()
+    save_figure(fig, plot_output_path, dpi=100, bbox_inches='tight')
 
     print(f"Trajectory plot with PCA and smoothed directions saved to {plot_output_path}")
 
+def process_file(model, paths):
+    csv_path, output_csv_path, plot_output_path = paths
+    print(f"Processing {os.path.basename(csv_path)}...")
+
+    # Compute movement directions and PCA coordinates; the table is in place before plotting starts
+    with atomic_output(output_csv_path) as tmp_csv_path:
+        pca_coords, smoothed_directions = compute_movement_directions(csv_path, tmp_csv_path)
+    if make_plots:
+        submit_plot(plot_trajectory_with_pca, pca_coords, smoothed_directions, plot_output_path)
+
 def process_folder(input_folder, output_folder):
-    # Iterate over all CSV files in the folder
-    for file_name in os.listdir(input_folder):
-        if file_name.endswith(".csv"):
+    # Iterate over all keypoint tables (CSV or binary) in the folder
+    tasks = []
+    for file_name in sorted(os.listdir(input_folder)):
+        base_name, extension = os.path.splitext(file_name)
+        if extension in TABLE_EXTENSIONS:
             csv_path = os.path.join(input_folder, file_name)
-            output_csv_path = os.path.join(output_folder, f"{file_name.replace('.csv', '_direction.csv')}")
-            plot_output_path = os.path.join(output_folder, f"{file_name.replace('.csv', '_trajectory_plot.png')}")
+            output_csv_path = os.path.join(output_folder, f"{base_name}_direction.{table_format}")
+            plot_output_path = os.path.join(output_folder, f"{base_name}_trajectory_plot.png")
+            tasks.append((csv_path, output_csv_path, plot_output_path))
 
-            print(f"Processing {file_name}...")
-            plot_trajectory_with_pca(csv_path, output_csv_path, plot_output_path)
+    run_batch(tasks, process_file, num_workers=num_workers)
+    wait_for_plots()
 
 # Example usage
 if __name__ == "__main__":
@@ -1,19 +1,23 @@
 import os
+from contextlib import ExitStack
 import numpy as np
+from src.batch_executor import atomic_output, run_batch
+from src.model_store import tapir_model_dir
 from src.tapir_keypoint_tracking import TapirKeypointTracking
 
 # Define paths
 checkpoint_path = 'data/tapir_checkpoint_panning.npy'
+model_store_dir = 'models'  # Checkpoint is converted here once for memory-mapped loading (None to load the .npy directly)
 input_folder = 'data/cello/input_video/'  # Folder containing input videos
 output_folder = 'result/cello/output_video/'  # Folder for saving output videos
 keypoints_folder = 'result/cello/output_csv/'  # Folder for saving keypoints CSV files
-
-# Create output folders if they don't exist
-os.makedirs(output_folder, exist_ok=True)
-os.makedirs(keypoints_folder, exist_ok=True)
-
-# Initialize TAPIR keypoint tracking
-tapir_tracker = TapirKeypointTracking(checkpoint_path)
+compilation_cache_dir = 'result/jax_cache'  # On-disk JAX compilation cache shared across runs (None to disable)
+table_format = 'csv'  # 'csv', or 'npz'/'parquet' for typed binary keypoint tables
+chunk_size = None  # Set to a frame count (e.g. 64) to track long videos chunk by chunk with bounded memory
+num_workers = 1  # Worker processes, each keeping one TAPIR model loaded (None for one per CPU)
+clips_per_task = None  # Set to a video count (e.g. 32) to track short clips together in batched TAPIR calls
+batch_size = None  # Clips per batched TAPIR call (None to choose from the available memory)
+write_overlay_video = True  # False to only write keypoint tables and draw the overlay with script_composite.py (not in chunked mode)
 
 # Define a mapping of video file names to their respective keypoints
 video_keypoints_map = {
@@ -22,28 +26,76 @@ video_keypoints_map = {
     # Add more mappings for other videos
 }
 
-# Process all videos in the input folder
-for video_file in os.listdir(input_folder):
-    video_path = os.path.join(input_folder, video_file)
-
-    # Check if the file is a valid video file
-    if not video_file.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
-        print(f"Skipping non-video file: {video_file}")
-        continue
+def load_tracker(model_path):
+    """Initializes TAPIR keypoint tracking once per worker."""
+    return TapirKeypointTracking(model_path, compilation_cache_dir=compilation_cache_dir)
 
-    # Retrieve the keypoints for the video
-    if video_file not in video_keypoints_map:
-        print(f"No keypoints defined for video: {video_file}. Skipping.")
-        continue
+def output_paths(video_file):
+    """Output paths for the video (None if no overlay video is written) and keypoints table of one input video."""
+    output_video_path = None
+    if write_overlay_video or chunk_size:
+        output_video_path = os.path.join(output_folder, f"{os.path.splitext(video_file)[0]}_keypoints.mp4")
+    keypoints_file_path = os.path.join(keypoints_folder, f"{os.path.splitext(video_file)[0]}_keypoints.{table_format}")
+    return output_video_path, keypoints_file_path
 
+def track_video(tapir_tracker, video_file):
+    """Runs keypoint tracking on one video, writing its outputs atomically."""
+    video_path = os.path.join(input_folder, video_file)
     keypoints = video_keypoints_map[video_file]
 
-    # Define output paths for the video and keypoints CSV
-    output_video_path = os.path.join(output_folder, f"{os.path.splitext(video_file)[0]}_keypoints.mp4")
-    keypoints_file_path = os.path.join(keypoints_folder, f"{os.path.splitext(video_file)[0]}_keypoints.csv")
+    output_video_path, keypoints_file_path = output_paths(video_file)
 
     # Run keypoint tracking on the video
     print(f"Processing video: {video_file} with keypoints: {keypoints}")
-    tapir_tracker.track_keypoints(video_path, keypoints, output_video_path, keypoints_file_path)
+    with ExitStack() as stack:
+        tmp_video_path = stack.enter_context(atomic_output(output_video_path)) if output_video_path else None
+        tmp_keypoints_path = stack.enter_context(atomic_output(keypoints_file_path))
+        if chunk_size:
+            tapir_tracker.track_keypoints_chunked(video_path, keypoints, tmp_video_path, tmp_keypoints_path, chunk_size=chunk_size)
+        else:
+            tapir_tracker.track_keypoints(video_path, keypoints, tmp_video_path, tmp_keypoints_path)
+
+def track_videos(tapir_tracker, video_files):
+    """Runs keypoint tracking on a group of short videos in batched TAPIR calls, writing all outputs atomically."""
+    print(f"Processing {len(video_files)} videos in batches: {', '.join(video_files)}")
+    with ExitStack() as stack:
+        jobs = []
+        for video_file in video_files:
+            output_video_path, keypoints_file_path = output_paths(video_file)
+            jobs.append((os.path.join(input_folder, video_file), video_keypoints_map[video_file],
+                         stack.enter_context(atomic_output(output_video_path)) if output_video_path else None,
+                         stack.enter_context(atomic_output(keypoints_file_path))))
+        tapir_tracker.track_keypoints_batch(jobs, batch_size=batch_size)
+
+def main():
+    # Create output folders if they don't exist
+    os.makedirs(output_folder, exist_ok=True)
+    os.makedirs(keypoints_folder, exist_ok=True)
+
+    # Collect all videos in the input folder that have keypoints defined
+    video_files = []
+    for video_file in sorted(os.listdir(input_folder)):
+        # Check if the file is a valid video file
+        if not video_file.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
+            print(f"Skipping non-video file: {video_file}")
+            continue
+
+        # Retrieve the keypoints for the video
+        if video_file not in video_keypoints_map:
+            print(f"No keypoints defined for video: {video_file}. Skipping.")
+            continue
+
+        video_files.append(video_file)
+
+    # Convert the checkpoint before starting workers, so they all map the same store files
+    model_path = tapir_model_dir(checkpoint_path, model_store_dir) if model_store_dir else checkpoint_path
+
+    if clips_per_task and not chunk_size:
+        groups = [tuple(video_files[i:i + clips_per_task]) for i in range(0, len(video_files), clips_per_task)]
+        run_batch(groups, track_videos, init_fn=load_tracker, init_args=(model_path,), num_workers=num_workers)
+    else:
+        run_batch(video_files, track_video, init_fn=load_tracker, init_args=(model_path,), num_workers=num_workers)
+    print("Processing complete. Check the output folders for results.")
 
-print("Processing complete. Check the output folders for results.")
+if __name__ == "__main__":
+    main()
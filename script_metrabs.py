@@ -1,5 +1,17 @@
 import os
-from src.metrabs_keypoint_tracking import load_model, process_video
+from src.metrabs_keypoint_tracking import BOWING_JOINTS, load_model, process_video, process_video_batched, process_video_keyframes
+
+batch_size = 8  # Frames per model call; set to 1 for the original frame-by-frame loop
+model_store_dir = 'models'  # Local model store; the model is downloaded only if it is not stored yet
+offline = False  # Fail instead of downloading when the model is missing from the store
+model_sha256 = None  # SHA-256 of the model archive, checked before it is stored (default: src.model_store.METRABS_SHA256)
+write_overlay_video = True  # False to only write the keypoints table and draw the poses with script_composite.py
+
+# Keyframe mode: run the model every keyframe_interval frames (1 runs it on every frame) and fill the frames in between
+keyframe_interval = 1
+motion_threshold = None  # Mean grey-level change that triggers an earlier keyframe (None for fixed intervals)
+keyframe_fill = 'linear'  # 'linear' interpolation or 'flow' (optical-flow propagation)
+tracked_joints = None  # smpl_24 joints to keep, e.g. BOWING_JOINTS for the bowing arm (None for all)
 
 def main():
     # Define the paths for input and output files
@@ -7,11 +19,20 @@ def main():
     output_video_path = '/content/drive/MyDrive/Violin/segmentation/metrabs_output.mp4'
     csv_output_path = '/content/drive/MyDrive/Violin/segmentation/keypoints.csv'
 
+    if not write_overlay_video:
+        output_video_path = None
+
     # Load the model
-    model = load_model()
+    model = load_model(store_dir=model_store_dir, offline=offline, sha256=model_sha256)
 
     # Process the video and track keypoints
-    process_video(model, video_path, output_video_path, csv_output_path)
+    if keyframe_interval > 1:
+        process_video_keyframes(model, video_path, output_video_path, csv_output_path, keyframe_interval=keyframe_interval,
+                                motion_threshold=motion_threshold, fill=keyframe_fill, joints=tracked_joints)
+    elif batch_size > 1:
+        process_video_batched(model, video_path, output_video_path, csv_output_path, batch_size=batch_size)
+    else:
+        process_video(model, video_path, output_video_path, csv_output_path)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,46 @@
+import json
+import cv2
+from src.columnar_io import save_table
+from src.online_direction import camera_frames, realtime_frames, run_online
+from src.visualization import ANNOTATION_CODES, draw_annotation
+
+# Frame source: a camera index for live use, or a video file read at real-time pace as a stand-in
+source = 'data/cello/input_video/cello_trial.avi'
+fps = 30  # Frame rate of the source (used for pacing files and for the keeps-up check)
+
+# Initial (x, y) pixel position of the tracked bow point in the first frame
+bow_point = (640, 360)
+
+window_size = 5  # Majority smoothing window (odd)
+latency_frames = 2  # Look-ahead frames before a direction is shown (window_size // 2 matches the offline labels)
+show_window = True  # Show the live direction arrow in a window
+
+output_csv_path = 'result/cello/online_directions.csv'
+summary_path = 'result/cello/online_latency.json'
+
+def main():
+    frames = camera_frames(source) if isinstance(source, int) else realtime_frames(source, fps)
+
+    def show(frame, frame_idx, direction):
+        if not show_window:
+            return
+        height, width = frame.shape[:2]
+        display = draw_annotation(frame.copy(), ANNOTATION_CODES.get(direction, 0), (width - 150, height // 2), 300)
+        cv2.imshow('Bow direction', display)
+        cv2.waitKey(1)
+
+    table, summary = run_online(frames, bow_point, fps=fps, window_size=window_size,
+                                latency_frames=latency_frames, on_direction=show)
+    if show_window:
+        cv2.destroyAllWindows()
+
+    save_table(table, output_csv_path)
+    with open(summary_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"Online directions saved to: {output_csv_path}")
+    print(f"Latency: mean {summary.get('latency_mean_ms', 0):.1f} ms, p95 {summary.get('latency_p95_ms', 0):.1f} ms; "
+          f"processing p95 {summary.get('processing_p95_ms', 0):.1f} ms per frame "
+          f"({'keeps up' if summary.get('keeps_up') else 'does NOT keep up'} with {fps} fps)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+import numpy as np
+from src.pipeline import Pipeline, Stage
+
+# Take to process
+proj_name = 'cello01'
+video_path = 'data/cello/input_video/cello01.avi'
+audio_path = 'data/cello/input_audio/cello01.wav'
+checkpoint_path = 'data/tapir_checkpoint_panning.npy'
+output_dir = f'result/cello/pipeline/{proj_name}'
+cache_dir = os.path.join(output_dir, '.cache')
+
+# Stage parameters; changing one reruns only the stages that depend on it
+params = {
+    'keypoints': {'query_points': [(0, 183, 106)], 'chunk_size': None, 'model_type': 'tapir'},  # 'tapir' or 'bootstapir'
+    # Frames and duration from the take's _summary.json; None uses the video's frame count and the audio's duration
+    'pitch': {'instrument': 'cello', 'silence_threshold': 0.005, 'crepe_model': 'full',
+              'frame_start': 0, 'frame_end': None, 'total_time': None},
+    'direction': {'window_size': 5},
+    'sync': {'frame_offset': 300},
+}
+
+# Stage outputs
+keypoints_video_path = os.path.join(output_dir, f"{proj_name}_keypoints.mp4")
+keypoints_path = os.path.join(output_dir, f"{proj_name}_keypoints.csv")
+notes_path = os.path.join(output_dir, f"{proj_name}_inferred_notes_with_silence.csv")
+direction_path = os.path.join(output_dir, f"{proj_name}_keypoints_direction.csv")
+annotated_path = os.path.join(output_dir, f"{proj_name}_annotated.csv")
+annotated_video_path = os.path.join(output_dir, f"{proj_name}_annotated.mp4")
+
+def run_keypoints(query_points, chunk_size, model_type):
+    from src.tapir_keypoint_tracking import TapirKeypointTracking
+    tracker = TapirKeypointTracking(checkpoint_path, model_type=model_type)
+    keypoints = np.array(query_points, dtype=np.float32)
+    if chunk_size:
+        tracker.track_keypoints_chunked(video_path, keypoints, keypoints_video_path, keypoints_path, chunk_size=chunk_size)
+    else:
+        tracker.track_keypoints(video_path, keypoints, keypoints_video_path, keypoints_path)
+
+def run_pitch(instrument, silence_threshold, frame_start, frame_end, total_time, crepe_model):
+    from src.audio_frontend import decode_audio
+    from src.pitch_detection import pitch_detect_crepe, infer_note_positions_with_silence, save_inferred_notes_to_csv
+    from src.video_frontend import frame_count
+    if frame_end is None:
+        frame_end = frame_start + frame_count(video_path)
+    audio = decode_audio(audio_path)  # Decoded once for pitch and silence detection
+    if not total_time:
+        total_time = audio.duration
+    pitch_results = pitch_detect_crepe('torch', proj_name, frame_start=frame_start, frame_end=frame_end,
+                                       total_time=total_time, instrument=instrument, audio_path=audio_path,
+                                       output_dir=output_dir, audio=audio, model=crepe_model)
+    inferred_notes = infer_note_positions_with_silence(pitch_results, audio_path, audio=audio,
+                                                       silence_threshold=silence_threshold)
+    save_inferred_notes_to_csv(inferred_notes, proj_name, output_dir)
+
+def run_direction(window_size):
+    from src.bow_direction_pca import compute_movement_directions
+    compute_movement_directions(keypoints_path, direction_path, window_size=window_size)
+
+def run_sync(frame_offset):
+    from src.frame_sync import annotate_frames
+    annotate_frames(notes_path, direction_path, annotated_path, frame_offset=frame_offset)
+
+def run_visualization():
+    from src.visualization import annotate_video
+    annotate_video(video_path, annotated_path, annotated_video_path)
+
+def build_pipeline():
+    stages = [
+        # Video branch
+        Stage('keypoints', run_keypoints, inputs=[video_path, checkpoint_path],
+              outputs=[keypoints_video_path, keypoints_path],
+              params=params['keypoints']),
+        Stage('direction', run_direction, inputs=[keypoints_path], outputs=[direction_path],
+              params=params['direction'], deps=['keypoints']),
+        # Audio branch, runs concurrently with the video branch
+        Stage('pitch', run_pitch, inputs=[audio_path, video_path], outputs=[notes_path],  # The video gives the default frame_end
+              params=params['pitch']),
+        # Joined branches
+        Stage('sync', run_sync, inputs=[notes_path, direction_path], outputs=[annotated_path],
+              params=params['sync'], deps=['pitch', 'direction']),
+        Stage('visualization', run_visualization, inputs=[video_path, annotated_path],
+              outputs=[annotated_video_path], deps=['sync']),
+    ]
+    return Pipeline(stages, cache_dir, max_workers=2)
+
+if __name__ == "__main__":
+    os.makedirs(output_dir, exist_ok=True)
+    status = build_pipeline().run()
+    print("Pipeline complete:", ", ".join(f"{name}={result}" for name, result in status.items()))
@@ -1,33 +1,79 @@
 import os
 import json
-from src.pitch_detection import pitch_detect_crepe, infer_note_positions_with_silence, save_inferred_notes_to_csv, plot_note_positions_with_silence
+from src.audio_frontend import decode_audio, write_wav
+from src.batch_executor import atomic_outputs_in, run_batch
+from src.pitch_detection import compare_precision, load_torchcrepe_model, pitch_detect_crepe, pitch_detect_crepe_streaming, infer_note_positions_with_silence, save_inferred_notes_to_csv, draw_fundamental_curve, plot_note_positions_with_silence
+from src.plotting import submit_plot, wait_for_plots
 
 # Directory for saving output
 output_dir = 'result/cello/output_pitch'
-os.makedirs(output_dir, exist_ok=True)
 
-def process_audio_file(audio_path, proj_name, output_dir, frame_start, frame_end, total_time):
-    """Processes a single audio file for pitch detection and note inference."""
+streaming = False  # Process audio block by block with flat memory (for hours-long recordings; no plots)
+table_format = 'csv'  # 'csv', or 'npz'/'parquet' for typed binary tables (streaming mode always writes CSV)
+save_wav = False  # For video inputs, also write the decoded audio track as an intermediate .wav file
+num_workers = 1  # Worker processes, each keeping one CREPE model loaded (None for one per CPU)
+make_plots = True  # Save pitch curve and note plots, rendered in the background after the tables are written
+crepe_model = 'full'  # CREPE capacity: 'full', or 'tiny' for a much faster, slightly less accurate pitch track
+silence_gate = False  # Run CREPE only on the voiced parts found by the silence detector (silent frames get NaN pitch)
+crepe_precision = 'fp32'  # CPU precision: 'fp32', 'int8' (quantizes only the final linear layer, not expected to be faster) or 'bf16'
+crepe_threads = None  # Torch intra-op threads per worker (None for the default)
+check_precision = True  # With reduced precision, first compare its notes and speed against fp32 on one recording
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+def process_audio_file(audio_path, proj_name, output_dir, frame_start, frame_end, total_time, audio=None, plot_dir=None):
+    """
+    Processes a single audio file (or already decoded audio) for pitch detection and note inference.
+
+    Plots are submitted to the background plotting thread and saved to `plot_dir` (no plots if None).
+    """
+    # Streaming mode detects pitch, silence and notes block by block and writes both tables as it goes;
+    # the whole-recording plots are skipped, since they would need every row in memory
+    if streaming:
+        pitch_detect_crepe_streaming(proj_name, frame_start=frame_start, frame_end=frame_end, total_time=total_time,
+                                     instrument='cello', audio_path=audio_path, output_dir=output_dir, model=crepe_model)
+        return
+
     # Step 1: Perform pitch detection with CREPE
-    pitch_results = pitch_detect_crepe('torch', proj_name, frame_start=frame_start, 
-                                       frame_end=frame_end, total_time=total_time, instrument='cello', audio_path=audio_path, 
-                                       output_dir=output_dir)
+    pitch_results, silence = pitch_detect_crepe('torch', proj_name, frame_start=frame_start, 
+                                                frame_end=frame_end, total_time=total_time, instrument='cello', audio_path=audio_path, 
+                                                output_dir=output_dir, audio=audio, output_format=table_format, plot=False,
+                                                model=crepe_model, silence_gate=silence_gate, return_silence=True)
 
-    # Step 2: Infer note positions with silence detection
-    inferred_notes = infer_note_positions_with_silence(pitch_results, audio_path)
+    # Step 2: Infer note positions with silence detection (reusing the silence gate's, if it ran)
+    inferred_notes = infer_note_positions_with_silence(pitch_results, audio_path, audio=audio, silence=silence)
 
     # Step 3: Save inferred notes to CSV
-    save_inferred_notes_to_csv(inferred_notes, proj_name, output_dir)
+    save_inferred_notes_to_csv(inferred_notes, proj_name, output_dir, output_format=table_format)
+
+    # Step 4: Plot and save the pitch curve and note positions with silence events
+    if plot_dir:
+        time, frequency, confidence = pitch_results[:, 0], pitch_results[:, 1], pitch_results[:, 2]
+        submit_plot(draw_fundamental_curve, time, frequency, confidence, proj_name, 'crepe', plot_dir)
+        submit_plot(plot_note_positions_with_silence, inferred_notes, proj_name, plot_dir)
 
-    # Step 4: Plot and save note positions with silence events
-    plot_note_positions_with_silence(inferred_notes, proj_name, output_dir)
+def process_file(model, task):
+    """Batch worker entry point: decodes the audio once (WAV or video track) and writes all tables atomically."""
+    audio_path, proj_name, output_dir, frame_start, frame_end, total_time = task
+    with atomic_outputs_in(output_dir) as tmp_output_dir:
+        # Pitch detection and silence detection share one decode; streaming mode reads blocks from disk instead
+        audio = None if streaming else decode_audio(audio_path)
+        if save_wav and audio is not None and audio_path.lower().endswith(VIDEO_EXTENSIONS):
+            write_wav(audio, os.path.join(tmp_output_dir, f"{proj_name}.wav"))
+
+        # Process the audio file with extracted values
+        # Plots are saved straight into the final directory, since they may finish after the temporary one is gone
+        process_audio_file(audio_path, proj_name, tmp_output_dir, frame_start, frame_end, total_time, audio=audio,
+                           plot_dir=output_dir if make_plots else None)
 
 def main(input_folder, json_folder, output_dir):
-    """Processes all .wav files in the specified folder using information from JSON files."""
+    """Processes all .wav (or video) files in the specified folder using information from JSON files."""
     # Iterate through all files in the input folder
-    for file_name in os.listdir(input_folder):
-        # Process only .wav files
-        if file_name.lower().endswith('.wav'):
+    tasks = []
+    for file_name in sorted(os.listdir(input_folder)):
+        is_video = file_name.lower().endswith(VIDEO_EXTENSIONS)
+        # Process only .wav files, or videos whose audio track is decoded once in memory
+        if file_name.lower().endswith('.wav') or (is_video and not streaming):
             audio_path = os.path.join(input_folder, file_name)
             
             # Use the file name (without extension) as the project name
@@ -49,17 +95,29 @@ def main(input_folder, json_folder, output_dir):
 
                 print(f"Processing: {file_name} with project name: {proj_name}")
                 print(f"Using JSON info - StartFrame: {frame_start}, EndFrame: {frame_end}, Duration: {total_time}")
-
-                # Process the audio file with extracted values
-                process_audio_file(audio_path, proj_name, output_dir, frame_start, frame_end, total_time)
+                tasks.append((audio_path, proj_name, output_dir, frame_start, frame_end, total_time))
             else:
                 print(f"JSON file not found for: {file_name}. Skipping.")
         else:
             print(f"Skipping non-audio file: {file_name}")
 
+    if check_precision and crepe_precision != 'fp32' and tasks:
+        audio_path = tasks[0][0]
+        audio = decode_audio(audio_path)
+        check = compare_precision(audio, crepe_precision, model=crepe_model, num_threads=crepe_threads, silence_gate=silence_gate)
+        print(f"Precision check on {audio_path}: {crepe_precision} is {check['speedup']:.2f}x faster than fp32 "
+              f"({check['seconds']:.1f}s vs {check['fp32_seconds']:.1f}s), notes agree on {100 * check['agreement']:.1f}% "
+              f"of frames ({100 * check['note_agreement']:.1f}% of played frames)")
+
+    run_batch(tasks, process_file, init_fn=load_torchcrepe_model, init_args=(crepe_model, crepe_precision, crepe_threads),
+              num_workers=num_workers)
+    wait_for_plots()
+
 # Specify the folder containing .wav files and JSON files
 input_folder = 'data/cello/input_audio'  # Folder with input audio files
 json_folder = 'data/cello/input_json'  # Folder with JSON files
 
 # Run the main function
-main(input_folder, json_folder, output_dir)
+if __name__ == "__main__":
+    os.makedirs(output_dir, exist_ok=True)
+    main(input_folder, json_folder, output_dir)
@@ -1,27 +1,66 @@
 import os
+from src.batch_executor import atomic_output, run_batch
+from src.av_sync import estimate_sync, save_sync
 from src.frame_sync import annotate_frames
 
+table_format = 'csv'  # Format of the input and output tables: 'csv', 'npz' or 'parquet'
+num_workers = None  # Worker processes (None for one per CPU)
+
+# Estimate each take's audio/video offset from bow speed and audio energy instead of assuming 300 frames
+auto_sync = True
+keypoints_folder = 'result/cello/output_csv'  # Keypoint tables from script_keypoint.py
+audio_folder = 'data/cello/input_audio'  # Audio files used by script_pitch.py
+max_lag_seconds = 60  # Largest offset searched
+default_frame_offset = 300  # Used when a take cannot be synced or its sync confidence is too low
+min_sync_confidence = 0.3
+
+def sync_take(keypoints_path, audio_path, events_csv_path, sync_path):
+    """Estimates and saves a take's sync, returning the frame offset to use."""
+    result = estimate_sync(keypoints_path, audio_path, events_csv_path, max_lag_seconds=max_lag_seconds)
+    with atomic_output(sync_path) as tmp_sync_path:
+        save_sync(result, tmp_sync_path)
+    print(f"{os.path.basename(audio_path)}: lag {result['lag_seconds']:+.2f}s, frame offset {result['frame_offset']}, "
+          f"confidence {result['confidence']:.2f}")
+    if result['confidence'] < min_sync_confidence:
+        print(f"Sync confidence below {min_sync_confidence}; using frame offset {default_frame_offset}")
+        return default_frame_offset
+    return result['frame_offset']
+
+def process_take(model, paths):
+    events_csv_path, frames_csv_path, output_csv_path, keypoints_path, audio_path, sync_path = paths
+    frame_offset = default_frame_offset
+    if auto_sync and os.path.exists(keypoints_path) and os.path.exists(audio_path):
+        frame_offset = sync_take(keypoints_path, audio_path, events_csv_path, sync_path)
+    with atomic_output(output_csv_path) as tmp_output_path:
+        annotate_frames(events_csv_path, frames_csv_path, tmp_output_path, frame_offset=frame_offset)
+
 def process_folders(events_csv_folder, frames_csv_folder, output_folder):
     # Iterate through events CSV files in events_csv_folder
-    for event_file in os.listdir(events_csv_folder):
-        if event_file.endswith("_inferred_notes_with_silence.csv"):
+    tasks = []
+    for event_file in sorted(os.listdir(events_csv_folder)):
+        if event_file.endswith(f"_inferred_notes_with_silence.{table_format}"):
             # Extract the base name (e.g., cello01)
             base_name = event_file.split('_')[0]  # This will give "cello01", "cello02", etc.
             
             # Match corresponding frames CSV file
-            frames_csv_file = f"cello_{base_name.split('cello')[1]}_keypoints_direction.csv"
+            take_name = f"cello_{base_name.split('cello')[1]}"
+            frames_csv_file = f"{take_name}_keypoints_direction.{table_format}"
             frames_csv_path = os.path.join(frames_csv_folder, frames_csv_file)
             
             if os.path.exists(frames_csv_path):
                 events_csv_path = os.path.join(events_csv_folder, event_file)
-                output_csv_path = os.path.join(output_folder, f"{base_name}_annotated.csv")
+                output_csv_path = os.path.join(output_folder, f"{base_name}_annotated.{table_format}")
+                keypoints_path = os.path.join(keypoints_folder, f"{take_name}_keypoints.{table_format}")
+                audio_path = os.path.join(audio_folder, f"{base_name}.wav")
+                sync_path = os.path.join(output_folder, f"{base_name}_sync.json")
                 
-                # Call the function to process and annotate frames
+                # Queue the take for annotation
                 print(f"Processing {base_name}...")
-                annotate_frames(events_csv_path, frames_csv_path, output_csv_path)
+                tasks.append((events_csv_path, frames_csv_path, output_csv_path, keypoints_path, audio_path, sync_path))
             else:
                 print(f"Frames CSV file for {base_name} not found. Skipping...")
-                
+
+    run_batch(tasks, process_take, num_workers=num_workers)
 
 # Example usage
 if __name__ == "__main__":
@@ -1,9 +1,33 @@
-from src.visualization import annotate_video
+import os
+import cv2
+from src.columnar_io import load_table
+from src.visualization import annotate_clips, annotate_video, bow_change_ranges
 
 # File paths
 base_video_path = '/content/drive/MyDrive/Violin/segmentation/cello_trial.avi'  # Replace with your base video path
 output_video_path = '/content/drive/MyDrive/Violin/segmentation/combined_video.mp4'
 movement_csv = '/content/drive/MyDrive/Violin/segmentation/annotated.csv'
 
-# Call the function to annotate the video
-annotate_video(base_video_path, movement_csv, output_video_path)
+# Clips: render only these (start, end) ranges instead of the whole video, e.g. [(12.0, 22.0)]
+clip_ranges = None
+clip_unit = 'seconds'  # Unit of clip_ranges: 'seconds' or 'frames'
+highlight_bow_changes = False  # Cut clips centered on the bow changes instead
+highlight_seconds = 10  # Length of each highlight clip
+max_highlights = 20
+
+if __name__ == "__main__":
+    if clip_ranges or highlight_bow_changes:
+        ranges, unit = clip_ranges, clip_unit
+        if highlight_bow_changes:
+            capture = cv2.VideoCapture(base_video_path)
+            fps = capture.get(cv2.CAP_PROP_FPS)
+            capture.release()
+            ranges, unit = bow_change_ranges(load_table(movement_csv), fps, highlight_seconds, max_highlights), 'frames'
+
+        # All clips are cut from one decoder session, seeking past the frames in between
+        base, extension = os.path.splitext(output_video_path)
+        clip_paths = [f"{base}_clip{i:02d}{extension}" for i in range(len(ranges))]
+        annotate_clips(base_video_path, movement_csv, ranges, clip_paths, unit=unit)
+    else:
+        # Call the function to annotate the video
+        annotate_video(base_video_path, movement_csv, output_video_path)
@@ -0,0 +1,73 @@
+import subprocess
+import numpy as np
+from scipy.io import wavfile
+
+# Sample rate librosa.load resamples to by default, used by the CREPE stage
+CREPE_SAMPLE_RATE = 22050
+
+class AudioBuffer:
+    """Mono audio decoded once into memory, with resampled copies made on demand and cached."""
+
+    def __init__(self, samples, sample_rate):
+        self.sample_rate = sample_rate
+        self._by_rate = {sample_rate: np.asarray(samples, dtype=np.float32)}
+
+    @property
+    def duration(self):
+        return len(self._by_rate[self.sample_rate]) / self.sample_rate
+
+    def at_rate(self, sample_rate=None):
+        """
+        Returns the audio at the requested sample rate.
+
+        Parameters:
+        - sample_rate (int, optional): Target rate; None returns the decoded rate.
+
+        Returns:
+        - samples (np.ndarray): float32 mono samples.
+        - sample_rate (int): Their sample rate.
+        """
+        sample_rate = sample_rate or self.sample_rate
+        if sample_rate not in self._by_rate:
+            import librosa
+            self._by_rate[sample_rate] = librosa.resample(
+                self._by_rate[self.sample_rate], orig_sr=self.sample_rate, target_sr=sample_rate)
+        return self._by_rate[sample_rate], sample_rate
+
+def probe_sample_rate(media_path):
+    """Returns the sample rate of the first audio stream of a media file, using ffprobe."""
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'a:0', '-show_entries', 'stream=sample_rate',
+         '-of', 'default=noprint_wrappers=1:nokey=1', media_path],
+        capture_output=True, text=True)
+    if result.returncode != 0 or not result.stdout.strip():
+        raise RuntimeError(f"No audio stream found in {media_path}: {result.stderr.strip()}")
+    return int(result.stdout.split()[0])
+
+def decode_audio(media_path, sample_rate=None):
+    """
+    Decodes the audio track of a video (or audio file) once, straight into memory.
+
+    ffmpeg downmixes to mono and pipes raw float32 samples, so no intermediate WAV is written.
+
+    Parameters:
+    - media_path (str): Path to the video or audio file.
+    - sample_rate (int, optional): Rate to decode at (default: the stream's native rate).
+
+    Returns:
+    - AudioBuffer: The decoded audio.
+    """
+    sample_rate = sample_rate or probe_sample_rate(media_path)
+    result = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-i', media_path, '-vn', '-ac', '1', '-ar', str(sample_rate),
+         '-f', 'f32le', '-'],
+        capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to decode audio from {media_path}: {result.stderr.decode(errors='replace').strip()}")
+    return AudioBuffer(np.frombuffer(result.stdout, dtype=np.float32), sample_rate)
+
+def write_wav(audio, wav_path):
+    """Writes an AudioBuffer at its decoded rate as a 16-bit PCM WAV file."""
+    samples, sample_rate = audio.at_rate()
+    wavfile.write(wav_path, sample_rate, (np.clip(samples, -1, 1) * 32767).astype(np.int16))
+    print(f"Audio saved to: {wav_path}")
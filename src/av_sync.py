@@ -0,0 +1,178 @@
+import json
+import numpy as np
+from src.columnar_io import load_table
+from src.instrumentation import span
+
+def bow_speed(keypoints_table, num_frames=None):
+    """
+    Returns the bow speed per video frame, averaged over the tracked keypoints.
+
+    Frames where a keypoint is not visible are filled by linear interpolation of its position.
+
+    Parameters:
+    - keypoints_table (pd.DataFrame): Frame/Keypoint Index/X/Y table from keypoint tracking.
+    - num_frames (int, optional): Length of the output (default: up to the last tracked frame).
+
+    Returns:
+    - np.ndarray: Pixels moved since the previous frame, one value per video frame.
+    """
+    num_frames = num_frames or int(keypoints_table['Frame'].max()) + 1
+    frames = np.arange(num_frames)
+    speed = np.zeros(num_frames)
+    keypoint_ids = np.unique(keypoints_table['Keypoint Index'].values)
+    for keypoint_id in keypoint_ids:
+        rows = keypoints_table[keypoints_table['Keypoint Index'] == keypoint_id].sort_values('Frame')
+        x = np.interp(frames, rows['Frame'].values, rows['X'].values)
+        y = np.interp(frames, rows['Frame'].values, rows['Y'].values)
+        speed[1:] += np.hypot(np.diff(x), np.diff(y))
+    return speed / max(len(keypoint_ids), 1)
+
+def _standardize(signal):
+    signal = np.asarray(signal, dtype=np.float64)
+    std = signal.std()
+    return (signal - signal.mean()) / std if std > 0 else np.zeros_like(signal)
+
+def cross_correlate(video_signal, audio_signal, max_lag=None, min_overlap=0.5):
+    """
+    Normalized cross-correlation of two frame-rate signals at every lag, computed with one FFT product.
+
+    corr[lag] is the mean product of the standardized signals over their overlap when audio frame k is
+    paired with video frame k - lag, so it is close to the Pearson correlation at that lag.
+
+    Parameters:
+    - video_signal (np.ndarray): Per-frame signal from the video (e.g. bow speed).
+    - audio_signal (np.ndarray): Per-frame signal from the audio (e.g. energy envelope).
+    - max_lag (int, optional): Largest absolute lag to consider, in frames.
+    - min_overlap (float): Lags where the signals overlap on less than this share of the shorter one are skipped.
+
+    Returns:
+    - lags (np.ndarray): Lags in frames (audio frame minus video frame).
+    - corr (np.ndarray): Correlation at each lag.
+    """
+    a, b = _standardize(video_signal), _standardize(audio_signal)
+    size = 1 << int(np.ceil(np.log2(len(a) + len(b))))
+    full = np.fft.irfft(np.conj(np.fft.rfft(a, size)) * np.fft.rfft(b, size), size)
+
+    # Positive lags sit at the start of the circular result, negative lags wrap around to the end
+    lags = np.arange(-(len(a) - 1), len(b))
+    corr = full[lags % size]
+    overlap = np.minimum(len(b), len(a) + lags) - np.maximum(0, lags)
+    keep = overlap >= max(min_overlap * min(len(a), len(b)), 1)
+    if max_lag is not None:
+        keep &= np.abs(lags) <= max_lag
+    return lags[keep], corr[keep] / overlap[keep]
+
+def estimate_lag(video_signal, audio_signal, fps=30, max_lag=None, exclusion_seconds=1.0):
+    """
+    Finds the lag that best aligns the video signal with the audio signal, with a confidence score.
+
+    The confidence compares the correlation peak with the runner-up: the highest other local maximum
+    outside the main peak's lobe (down to the local minima on either side) and more than
+    `exclusion_seconds` away. It is 1 - second / peak, clipped to [0, 1]: near 0 when another
+    alignment fits about as well, and near 1 when the peak is unique.
+
+    Returns:
+    - dict: 'lag_frames' (audio frame minus video frame), 'lag_seconds', 'peak_correlation' and 'confidence'.
+    """
+    lags, corr = cross_correlate(video_signal, audio_signal, max_lag=max_lag)
+    if len(corr) == 0:
+        raise ValueError("The signals are too short to overlap at any allowed lag")
+    from scipy.signal import find_peaks
+
+    best = int(np.argmax(corr))
+    peak = float(corr[best])
+
+    # The main lobe runs downhill from the peak to the nearest local minimum on each side
+    slope = np.diff(corr)
+    rising = np.flatnonzero(slope[:best] < 0)
+    falling = np.flatnonzero(slope[best:] > 0)
+    lobe_start = rising[-1] + 1 if len(rising) else 0
+    lobe_end = best + falling[0] if len(falling) else len(corr) - 1
+
+    peaks, _ = find_peaks(corr)
+    others = peaks[((peaks < lobe_start) | (peaks > lobe_end)) & (np.abs(lags[peaks] - lags[best]) > exclusion_seconds * fps)]
+    second = float(corr[others].max()) if len(others) else 0.0
+    confidence = float(np.clip(1 - max(second, 0.0) / peak, 0, 1)) if peak > 0 else 0.0
+    return {
+        'lag_frames': int(lags[best]),
+        'lag_seconds': float(lags[best] / fps),
+        'peak_correlation': peak,
+        'confidence': confidence,
+    }
+
+def event_frame_offset(events_table, lag_frames, num_audio_frames, fps=30):
+    """
+    Converts an audio/video lag into the offset annotate_frames adds to direction frames.
+
+    Event frames come from the pitch stage's time-to-frame mapping, so the offset is the median
+    difference between the event frame at each audio frame's time and the video frame it aligns with.
+    """
+    times = events_table['Time (s)'].values.astype(float)
+    event_frames = events_table['Frame'].values.astype(float)
+    order = np.argsort(times, kind='stable')
+    audio_frames = np.arange(num_audio_frames)
+    video_frames = audio_frames - lag_frames
+    valid = video_frames >= 0
+    mapped = np.interp(audio_frames[valid] / fps, times[order], event_frames[order])
+    return int(round(float(np.median(mapped - video_frames[valid]))))
+
+def estimate_sync(keypoints_path, audio_path, events_path=None, fps=30, max_lag_seconds=None, silence_threshold=0.005, audio=None):
+    """
+    Estimates the audio/video offset of a take by cross-correlating bow speed with the audio energy envelope.
+
+    The bow moves while the instrument sounds and rests in the silences, so the speed of the tracked
+    bow keypoints follows the frame energy from detect_silence, shifted by the misalignment.
+
+    Parameters:
+    - keypoints_path (str): Keypoints table (CSV, .npz or .parquet) from keypoint tracking.
+    - audio_path (str): Audio of the take.
+    - events_path (str, optional): Inferred notes table from the pitch stage; used to express the lag as
+      annotate_frames' frame_offset.
+    - fps (int): Frame rate of the video (and of the energy frames).
+    - max_lag_seconds (float, optional): Largest offset to search.
+    - silence_threshold (float): Threshold passed to detect_silence.
+    - audio (AudioBuffer, optional): Already decoded audio to use instead of loading audio_path.
+
+    Returns:
+    - dict: Lag, correlation and confidence (see estimate_lag), plus 'frame_offset' if events_path is given.
+    """
+    from src.pitch_detection import detect_silence
+
+    with span('av_sync.load') as load_span:
+        keypoints_table = load_table(keypoints_path)
+        load_span.count(keypoints=len(keypoints_table))
+    _, _, frame_energy, _ = detect_silence(audio_path, fps=fps, silence_threshold=silence_threshold, audio=audio)
+
+    with span('av_sync.correlate', frames=len(frame_energy)) as correlate_span:
+        speed = bow_speed(keypoints_table)
+        envelope = np.sqrt(np.maximum(frame_energy, 0))  # Amplitude rather than energy, so loud notes don't dominate
+        max_lag = int(max_lag_seconds * fps) if max_lag_seconds is not None else None
+        result = estimate_lag(speed, envelope, fps=fps, max_lag=max_lag)
+        correlate_span.count(video_frames=len(speed))
+
+    result.update({'fps': fps, 'video_frames': len(speed), 'audio_frames': len(frame_energy)})
+    if events_path is not None:
+        result['frame_offset'] = event_frame_offset(load_table(events_path), result['lag_frames'], len(frame_energy), fps)
+    return result
+
+def save_sync(result, sync_path):
+    with open(sync_path, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"Sync saved to: {sync_path}")
+
+def load_frame_offset(sync_path, default=300, min_confidence=0.3):
+    """
+    Returns the frame_offset for annotate_frames from a sync JSON file.
+
+    Falls back to `default` when the file is missing, has no frame offset, or its confidence is below
+    `min_confidence`.
+    """
+    try:
+        with open(sync_path) as f:
+            result = json.load(f)
+    except FileNotFoundError:
+        return default
+    if 'frame_offset' not in result or result.get('confidence', 0) < min_confidence:
+        print(f"Sync confidence {result.get('confidence', 0):.2f} in {sync_path} is too low; using frame offset {default}")
+        return default
+    return result['frame_offset']
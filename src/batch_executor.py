@@ -0,0 +1,202 @@
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+# Model created once per worker process by the batch initializer
+_worker_state = {}
+
+def worker_model():
+    """Returns the model created by the batch initializer in the current worker process."""
+    return _worker_state.get('model')
+
+def thread_env(num_threads):
+    """
+    Returns the environment variables that cap the intra-op threads of the numeric libraries.
+
+    OpenMP, MKL, OpenBLAS and TensorFlow read these once, when they are loaded, so they must be in the
+    environment before a worker imports numpy or a model backend.
+    """
+    env = {variable: str(num_threads) for variable in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                                                       'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS')}
+    xla_flags = os.environ.get('XLA_FLAGS', '')
+    if num_threads == 1 and '--xla_cpu_multi_thread_eigen' not in xla_flags:
+        # XLA has no CPU thread-count flag; this one turns its thread pool off, so it is only right for one thread
+        env['XLA_FLAGS'] = (xla_flags + ' --xla_cpu_multi_thread_eigen=false').strip()
+    return env
+
+@contextmanager
+def worker_environment(num_threads):
+    """Sets thread_env(num_threads) in this process while worker processes are started, so they inherit it."""
+    if not num_threads:
+        yield
+        return
+    env = thread_env(num_threads)
+    saved = {variable: os.environ.get(variable) for variable in env}
+    os.environ.update(env)
+    try:
+        yield
+    finally:
+        for variable, value in saved.items():
+            if value is None:
+                os.environ.pop(variable, None)
+            else:
+                os.environ[variable] = value
+
+def limit_threads(num_threads):
+    """
+    Caps the intra-op threads of the numeric libraries in the current process.
+
+    Libraries that are already loaded are capped through torch.set_num_threads and, if installed,
+    threadpoolctl; the environment variables only reach libraries loaded after this call.
+    """
+    os.environ.update(thread_env(num_threads))
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(num_threads)
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    threadpool_limits(num_threads)
+
+def _init_worker(init_fn, init_args, threads_per_worker):
+    # The thread environment was inherited from run_batch; this also caps what the worker has loaded already
+    if threads_per_worker:
+        limit_threads(threads_per_worker)
+    _worker_state['model'] = init_fn(*init_args) if init_fn else None
+
+def _run_task(task_fn, item):
+    start = time.perf_counter()
+    try:
+        task_fn(worker_model(), item)
+        return item, None, time.perf_counter() - start
+    except Exception:
+        return item, traceback.format_exc(), time.perf_counter() - start
+
+@contextmanager
+def atomic_output(path):
+    """
+    Yields a temporary path next to `path` and moves it into place only if the block succeeds.
+
+    The temporary file keeps the extension of `path`, so writers that pick a format from the
+    extension behave the same. A failed task never leaves a partial output behind.
+    """
+    directory, name = os.path.split(path)
+    base, extension = os.path.splitext(name)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{base}.", suffix=extension, dir=directory or '.')
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+@contextmanager
+def atomic_outputs_in(directory):
+    """
+    Yields a temporary directory whose files are moved into `directory` only if the block succeeds.
+
+    For stages that name their own output files inside an output directory.
+    """
+    os.makedirs(directory, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=directory)
+    try:
+        yield tmp_dir
+        for name in os.listdir(tmp_dir):
+            os.replace(os.path.join(tmp_dir, name), os.path.join(directory, name))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def run_batch(items, task_fn, init_fn=None, init_args=(), num_workers=None, threads_per_worker=None, mp_context='spawn'):
+    """
+    Processes items on a pool of worker processes, each holding one warm model.
+
+    Every worker calls init_fn(*init_args) once (e.g. to load TAPIR or CREPE) and then runs
+    task_fn(model, item) for each item it receives. A failing item is logged with its traceback and
+    does not stop the batch. If a worker process dies, the pool is rebuilt and the items that were in
+    flight are rerun one at a time, so only the item that kills a worker is recorded as failed.
+    With num_workers=1 everything runs in the current process.
+
+    Parameters:
+    - items (list): Picklable work items, e.g. file names or tuples of paths (logged by first element).
+    - task_fn (callable): Module-level function task_fn(model, item).
+    - init_fn (callable, optional): Module-level function creating the per-worker model.
+    - init_args (tuple): Arguments for init_fn.
+    - num_workers (int, optional): Number of worker processes (default: number of CPUs).
+    - threads_per_worker (int, optional): Intra-op threads per worker (default: CPUs / workers).
+    - mp_context (str): Multiprocessing start method; 'spawn' is safe with JAX, TensorFlow and torch.
+
+    Returns:
+    - list: One dict per item with 'item', 'ok', 'elapsed' and 'error' (traceback or None).
+    """
+    items = list(items)
+    num_workers = max(1, min(num_workers or os.cpu_count(), len(items) or 1))
+    if threads_per_worker is None and num_workers > 1:
+        threads_per_worker = max(os.cpu_count() // num_workers, 1)
+
+    results = []
+    start = time.perf_counter()
+
+    def log(item, error, elapsed):
+        results.append({'item': item, 'ok': error is None, 'elapsed': elapsed, 'error': error})
+        status = 'done' if error is None else 'FAILED'
+        label = item[0] if isinstance(item, tuple) else item
+        print(f"[{len(results)}/{len(items)}] {label}: {status} in {elapsed:.1f}s")
+        if error is not None:
+            print(error)
+
+    if num_workers == 1:
+        _init_worker(init_fn, init_args, threads_per_worker)
+        for item in items:
+            log(*_run_task(task_fn, item))
+    else:
+        pending = deque(items)
+        suspects = deque()  # Items in flight when a worker died; rerun one at a time to find the culprit
+        # Workers re-import the main script (and with it numpy) before their initializer runs, so the thread
+        # limits are put in the environment they start with; pools are rebuilt inside, so they inherit it too
+        with worker_environment(threads_per_worker):
+            while pending or suspects:
+                with ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context(mp_context),
+                                         initializer=_init_worker, initargs=(init_fn, init_args, threads_per_worker)) as executor:
+                    in_flight = {}
+                    try:
+                        while pending or suspects or in_flight:
+                            # Step 1: Keep the workers busy, or run the next suspect alone once the pool drains
+                            if suspects and not in_flight:
+                                item = suspects.popleft()
+                                in_flight[executor.submit(_run_task, task_fn, item)] = (item, True, time.perf_counter())
+                            while not suspects and pending and len(in_flight) < num_workers:
+                                item = pending.popleft()
+                                in_flight[executor.submit(_run_task, task_fn, item)] = (item, False, time.perf_counter())
+
+                            # Step 2: Log finished items
+                            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                result = future.result()
+                                del in_flight[future]
+                                log(*result)
+                    except BrokenProcessPool:
+                        # Step 3: A worker died (e.g. segfault or out of memory) and took the pool down; an item that
+                        # ran alone is the cause, the others are retried on a fresh pool
+                        for future, (item, alone, submitted) in in_flight.items():
+                            if future.done() and not future.cancelled() and future.exception() is None:
+                                log(*future.result())
+                            elif alone:
+                                log(item, 'BrokenProcessPool: the worker process died while processing this item',
+                                    time.perf_counter() - submitted)
+                            else:
+                                suspects.append(item)
+
+    elapsed = time.perf_counter() - start
+    failed = sum(not result['ok'] for result in results)
+    print(f"Batch finished: {len(results) - failed} succeeded, {failed} failed, {elapsed:.1f}s total "
+          f"({len(results) / max(elapsed, 1e-9):.2f} files/s with {num_workers} workers)")
+    return results
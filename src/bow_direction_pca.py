@@ -2,74 +2,196 @@
 
 import pandas as pd
 import numpy as np
-from collections import Counter
-from sklearn.decomposition import PCA
+from src.columnar_io import load_table, save_table, table_columns
+from src.instrumentation import span
 
-def compute_movement_directions(csv_path, output_csv_path, window_size=5):
-    # Load the CSV file
-    df = pd.read_csv(csv_path)
+# Direction labels are handled as small integer codes and only turned into strings on output
+DIRECTION_LABELS = np.array(["Stationary", "Up", "Down"])
+STATIONARY, UP, DOWN = 0, 1, 2
 
-    # Extract X, Y coordinates and frame numbers
-    frames = df['Frame'].values
-    x_coords = df['X'].values
-    y_coords = df['Y'].values
+def principal_projection(coordinates):
+    """
+    Fits PCA to a trajectory and returns the PCA coordinates and the dominant image axis.
 
-    # Combine X and Y into a single array for PCA
-    coordinates = np.column_stack((x_coords, y_coords))
+    Parameters:
+    - coordinates (np.ndarray): Array of shape (num_frames, 2) with X, Y positions.
 
-    # Apply PCA
+    Returns:
+    - pca_coords (np.ndarray): Trajectory in PCA coordinates.
+    - axis (str): 'X' or 'Y', whichever the first principal component is closer to.
+    """
+    from sklearn.decomposition import PCA  # Imported on first use; sklearn is slow to load
     pca = PCA(n_components=2)
     pca_coords = pca.fit_transform(coordinates)
 
-    # Extract the principal component directions
+    # Determine which principal component has the highest variance (X or Y axis)
     principal_directions = pca.components_
+    axis = 'X' if np.abs(principal_directions[0, 0]) > np.abs(principal_directions[0, 1]) else 'Y'
+    return pca_coords, axis
 
-    # Determine which principal component has the highest variance (X or Y axis)
-    if np.abs(principal_directions[0, 0]) > np.abs(principal_directions[0, 1]):
-        axis = 'X'
-        print('X')
-    else:
-        axis = 'Y'
-        print('Y')
-
-    # Project data onto the first principal component
-    projected_data = pca_coords[:, 0]
-
-    # Determine movement direction along the principal axis
-    directions = []
-    for i in range(1, len(projected_data)):
-        if axis == 'X':  
-            if projected_data[i] < projected_data[i - 1]:
-                directions.append("Down")
-            elif projected_data[i] > projected_data[i - 1]:
-                directions.append("Up")
-            else:
-                directions.append("Stationary")
-        elif axis == 'Y':  
-            if projected_data[i] < projected_data[i - 1]:
-                directions.append("Up")
-            elif projected_data[i] > projected_data[i - 1]:
-                directions.append("Down")
-            else:
-                directions.append("Stationary")
-
-    # Apply sliding window smoothing
-    smoothed_directions = []
-    for i in range(len(directions)):
-        start = max(0, i - window_size // 2)
-        end = min(len(directions), i + window_size // 2 + 1)
-        window_directions = directions[start:end]
-        most_common_direction = Counter(window_directions).most_common(1)[0][0]
-        smoothed_directions.append(most_common_direction)
+def direction_codes(projected_data, axis):
+    """
+    Converts a projected trajectory into per-step direction codes.
+
+    Along X, an increasing projection is Up; along Y (image rows grow downwards) it is Down.
+
+    Parameters:
+    - projected_data (np.ndarray): Trajectory projected onto the first principal component.
+    - axis (str): 'X' or 'Y', as returned by principal_projection.
+
+    Returns:
+    - np.ndarray: int8 codes (STATIONARY, UP, DOWN) of length len(projected_data) - 1.
+    """
+    step = np.sign(np.diff(projected_data))
+    if axis == 'Y':
+        step = -step
+    codes = np.full(len(step), STATIONARY, dtype=np.int8)
+    codes[step > 0] = UP
+    codes[step < 0] = DOWN
+    return codes
+
+def majority_smooth(codes, window_size=5, num_labels=len(DIRECTION_LABELS)):
+    """
+    Replaces each code with the most common code in a centered sliding window.
+
+    Window counts come from cumulative sums, so the cost is O(n) whatever the window size. Ties go to
+    the code that appears first in the window, matching Counter.most_common.
+
+    Parameters:
+    - codes (np.ndarray): Integer codes in range(num_labels).
+    - window_size (int): Size of the sliding window.
+    - num_labels (int): Number of distinct codes.
+
+    Returns:
+    - np.ndarray: Smoothed int8 codes.
+    """
+    n = len(codes)
+    idx = np.arange(n)
+    start = np.maximum(idx - window_size // 2, 0)
+    end = np.minimum(idx + window_size // 2 + 1, n)
+
+    scores = np.empty((num_labels, n), dtype=np.int64)
+    for label in range(num_labels):
+        is_label = codes == label
+        cumulative = np.concatenate(([0], np.cumsum(is_label)))
+        counts = cumulative[end] - cumulative[start]
+
+        # Position of the first occurrence at or after each window start (n if none)
+        next_occurrence = np.minimum.accumulate(np.where(is_label, idx, n)[::-1])[::-1]
+        first = next_occurrence[start] if n else start
+
+        # Higher counts always win; among equal counts the earlier first occurrence wins
+        scores[label] = counts * (n + 1) - first
+
+    return np.argmax(scores, axis=0).astype(np.int8)
+
+# Input and output may be CSV, .npz or .parquet tables (see src.columnar_io)
+# Every tracked keypoint gets its own PCA; the directions of `keypoint_index` (default: the first keypoint) are saved
+def compute_movement_directions(csv_path, output_csv_path, window_size=5, keypoint_index=None):
+    # Load the CSV file
+    with span('direction.load') as load_span:
+        # Single-point tables may have no Keypoint Index column
+        columns = ['Frame', 'X', 'Y']
+        if 'Keypoint Index' in table_columns(csv_path):
+            columns.insert(1, 'Keypoint Index')
+        df = load_table(csv_path, columns=columns)
+        load_span.count(frames=len(df))
+
+    # Apply PCA to each keypoint's trajectory, then determine its movement direction along the principal
+    # axis and apply sliding window smoothing
+    with span('direction.pca', frames=len(df)):
+        results = directions_by_keypoint(df, window_size)
+    if not results:
+        raise ValueError(f"No keypoint in {csv_path} has the 2 or more rows needed to compute movement directions")
+    if keypoint_index is None:
+        keypoint_index = min(results)
+    elif keypoint_index not in results:
+        raise ValueError(f"Keypoint {keypoint_index} has fewer than 2 rows in {csv_path}; "
+                         f"keypoints with directions: {sorted(results)}")
+    result = results[keypoint_index]
+    smoothed_codes = result['directions']
+    smoothed_directions = DIRECTION_LABELS[smoothed_codes].tolist()
 
     # Save smoothed directions into a DataFrame
     movement_data = {
-        "Frame Start": frames[:-1],
-        "Frame End": frames[1:],
-        "Direction": smoothed_directions
+        "Frame Start": result['frames'][:-1],
+        "Frame End": result['frames'][1:],
+        "Direction": pd.Categorical.from_codes(smoothed_codes, DIRECTION_LABELS)
     }
     movement_df = pd.DataFrame(movement_data)
 
-    # Save the DataFrame to a CSV file
-    movement_df.to_csv(output_csv_path, index=False)
-    return pca_coords, smoothed_directions
+    # Save the DataFrame to a CSV file (or binary table)
+    with span('direction.write', frames=len(movement_df)):
+        save_table(movement_df, output_csv_path)
+    return result['pca_coords'], smoothed_directions
+
+def directions_by_keypoint(df, window_size=5):
+    """
+    Computes smoothed movement directions for every tracked keypoint in one pass.
+
+    Rows are grouped by 'Keypoint Index' (all rows form one group if the column is missing) and each
+    group keeps its original row order.
+
+    Parameters:
+    - df (pd.DataFrame): Keypoint table with Frame, X, Y and optionally Keypoint Index columns.
+    - window_size (int): Size of the smoothing window.
+
+    Returns:
+    - dict: Keypoint index -> dict with 'frames', 'pca_coords', 'axis' and 'directions' (int8 codes).
+    """
+    frames = df['Frame'].values
+    coordinates = np.column_stack((df['X'].values, df['Y'].values))
+    if 'Keypoint Index' in df:
+        keypoint_indices = df['Keypoint Index'].values
+    else:
+        keypoint_indices = np.zeros(len(df), dtype=int)
+
+    # Split the rows into contiguous per-keypoint groups
+    order = np.argsort(keypoint_indices, kind='stable')
+    boundaries = np.flatnonzero(np.diff(keypoint_indices[order])) + 1
+
+    results = {}
+    for group in np.split(order, boundaries):
+        if len(group) < 2:
+            continue
+        pca_coords, axis = principal_projection(coordinates[group])
+        codes = direction_codes(pca_coords[:, 0], axis)
+        results[keypoint_indices[group[0]].item()] = {
+            'frames': frames[group],
+            'pca_coords': pca_coords,
+            'axis': axis,
+            'directions': majority_smooth(codes, window_size)
+        }
+    return results
+
+def compute_movement_directions_by_keypoint(csv_path, output_csv_path=None, window_size=5):
+    """
+    Computes smoothed movement directions for all keypoints of a keypoints table.
+
+    Parameters:
+    - csv_path (str): Path to the keypoints CSV (or .npz/.parquet) file.
+    - output_csv_path (str, optional): Path to save the directions, with a Keypoint Index column.
+    - window_size (int): Size of the smoothing window.
+
+    Returns:
+    - dict: Keypoint index -> per-keypoint results, as returned by directions_by_keypoint.
+    """
+    with span('direction.load') as load_span:
+        df = load_table(csv_path)
+        load_span.count(frames=len(df))
+    with span('direction.pca', frames=len(df)):
+        results = directions_by_keypoint(df, window_size)
+
+    if output_csv_path:
+        movement_df = pd.concat([
+            pd.DataFrame({
+                "Keypoint Index": keypoint_index,
+                "Frame Start": result['frames'][:-1],
+                "Frame End": result['frames'][1:],
+                "Direction": pd.Categorical.from_codes(result['directions'], DIRECTION_LABELS)
+            })
+            for keypoint_index, result in results.items()
+        ], ignore_index=True)
+        with span('direction.write', frames=len(movement_df)):
+            save_table(movement_df, output_csv_path)
+    return results
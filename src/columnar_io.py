@@ -0,0 +1,128 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Label vocabularies for the stringly-typed columns passed between stages. Labels are stored as
+# small integer codes into these lists; labels not listed here are appended in order of appearance.
+LABEL_VOCABULARIES = {
+    'Direction': ['Stationary', 'Up', 'Down'],
+    'Annotation': ['Stationary', 'Up', 'Down', 'silence'],
+    'Event': ['change', 'sustain', 'silence'],
+}
+LABELS_PREFIX = '__labels__'
+TABLE_EXTENSIONS = ('.csv', '.npz', '.parquet')
+
+def table_path(path_without_extension, table_format='csv'):
+    """Returns the path for a stage output in the given format ('csv', 'npz' or 'parquet')."""
+    return f"{path_without_extension}.{table_format}"
+
+def is_label_column(values):
+    return values.dtype == object or isinstance(values.dtype, (pd.CategoricalDtype, pd.StringDtype))
+
+def label_codes(column, values):
+    """Encodes a label column as the smallest integer codes that fit, with missing values as -1."""
+    labels = list(LABEL_VOCABULARIES.get(column, []))
+    known = set(labels)
+    for label in pd.unique(values.dropna().astype(str)):
+        if label not in known:
+            labels.append(label)
+            known.add(label)
+    codes = pd.Categorical(values.astype(object), categories=labels).codes
+    dtype = np.int8 if len(labels) < 127 else np.int32
+    return codes.astype(dtype), np.array(labels, dtype=str)
+
+def compact_integers(values):
+    """Stores integer columns (frame numbers, keypoint indices) as int32 when they fit."""
+    info = np.iinfo(np.int32)
+    if values.dtype.kind == 'i' and (not len(values) or (values.min() >= info.min and values.max() <= info.max)):
+        return values.astype(np.int32)
+    return values
+
+def _require_pyarrow():
+    """Raises a clear error when Parquet tables are used without pyarrow installed."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError("Parquet tables need pyarrow (pip install pyarrow); use the 'npz' or 'csv' "
+                          "table format without it") from None
+
+def save_table(df, path):
+    """
+    Saves a stage table as CSV, NPZ or Parquet, chosen by the file extension.
+
+    In NPZ files every column is a typed array, integer columns are stored as int32 when they fit,
+    and label columns are stored as integer codes alongside their label vocabulary.
+
+    Parameters:
+    - df (pd.DataFrame): Table to save.
+    - path (str): Output path ending in .csv, .npz or .parquet.
+
+    Returns:
+    - None
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.npz':
+        arrays = {}
+        for column in df.columns:
+            values = df[column]
+            if is_label_column(values):
+                arrays[column], arrays[LABELS_PREFIX + column] = label_codes(column, values)
+            else:
+                arrays[column] = compact_integers(values.to_numpy())
+        np.savez(path, **arrays)
+    elif extension == '.parquet':
+        _require_pyarrow()
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+def table_columns(path):
+    """
+    Lists the columns of a stage table without reading its rows.
+
+    Parameters:
+    - path (str): Path ending in .csv, .npz or .parquet.
+
+    Returns:
+    - list: Column names in file order.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.npz':
+        with np.load(path) as npz:
+            return [name for name in npz.files if not name.startswith(LABELS_PREFIX)]
+    if extension == '.parquet':
+        _require_pyarrow()
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+def load_table(path, columns=None):
+    """
+    Loads a stage table saved by save_table (or any CSV).
+
+    Label columns of NPZ files come back as pandas categoricals, so they compare and map like
+    strings without materializing one string per row.
+
+    Parameters:
+    - path (str): Path ending in .csv, .npz or .parquet.
+    - columns (list, optional): Columns to load; NPZ and Parquet files skip reading the others.
+      NPZ columns are read whole into memory (nothing is memory-mapped).
+
+    Returns:
+    - pd.DataFrame: The loaded table.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.npz':
+        with np.load(path) as npz:
+            names = [name for name in npz.files if not name.startswith(LABELS_PREFIX)]
+            data = {}
+            for name in (columns or names):
+                if LABELS_PREFIX + name in npz.files:
+                    data[name] = pd.Categorical.from_codes(npz[name], categories=npz[LABELS_PREFIX + name])
+                else:
+                    data[name] = npz[name]
+        return pd.DataFrame(data)
+    if extension == '.parquet':
+        _require_pyarrow()
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
@@ -0,0 +1,170 @@
+import cv2
+import numpy as np
+from src.columnar_io import load_table
+from src.instrumentation import span
+from src.visualization import ANNOTATION_CODES, annotation_code_array, draw_annotation, run_frame_pipeline
+
+# Parent joint of each of METRABS' smpl_24 joints (-1 for the pelvis root)
+SMPL24_PARENTS = [-1, 0, 0, 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 9, 9, 12, 13, 14, 16, 17, 18, 19, 20, 21]
+
+def frame_rows(frames, num_frames):
+    """
+    Groups table rows by frame with a compressed sparse row index.
+
+    Parameters:
+    - frames (np.ndarray): Frame number of every row.
+    - num_frames (int): Number of frames in the video.
+
+    Returns:
+    - order (np.ndarray): Row indices sorted by frame (stable, so rows keep their order within a frame).
+    - offsets (np.ndarray): The rows of frame f are order[offsets[f]:offsets[f + 1]].
+    """
+    frames = np.asarray(frames)
+    order = np.argsort(frames, kind='stable')
+    offsets = np.searchsorted(frames[order], np.arange(num_frames + 1), side='left')
+    return order, offsets
+
+def points_layer(keypoints_df, num_frames, color=(0, 255, 0), radius=5):
+    """Layer drawing tracked points (e.g. TAPIR's visible keypoints) as filled circles."""
+    order, offsets = frame_rows(keypoints_df['Frame'].values, num_frames)
+    points = keypoints_df[['X', 'Y']].values[order].astype(int)
+
+    def draw(frame_idx, frame):
+        for x, y in points[offsets[frame_idx]:offsets[frame_idx + 1]]:
+            cv2.circle(frame, (int(x), int(y)), radius, color, -1)
+        return frame
+    return draw
+
+def skeleton_layer(keypoints_df, num_frames, parents=SMPL24_PARENTS, joint_color=(0, 0, 255), bone_color=(255, 128, 0), radius=2):
+    """
+    Layer drawing pose skeletons (e.g. METRABS' smpl_24 keypoints): bones to each joint's parent, then joints.
+
+    Joints are placed by their Keypoint Index, so tables holding a subset of joints (e.g. BOWING_JOINTS)
+    work too; a bone is drawn only when both of its joints are present. Rows of one frame are consecutive
+    poses, as written by the METRABS stage: a new pose starts where the joint index stops increasing.
+    """
+    num_joints = len(parents)
+    order, offsets = frame_rows(keypoints_df['Frame'].values, num_frames)
+    points = keypoints_df[['X', 'Y']].values[order].astype(int)
+    joints = keypoints_df['Keypoint Index'].values[order].astype(int)
+    children = np.array([joint for joint, parent in enumerate(parents) if parent >= 0])
+    parent_joints = np.asarray(parents)[children]
+
+    # Mark the first row of every pose
+    pose_starts = np.ones(len(joints), dtype=bool)
+    pose_starts[1:] = joints[1:] <= joints[:-1]
+    pose_starts[offsets[:-1][offsets[:-1] < len(joints)]] = True
+
+    def draw(frame_idx, frame):
+        rows = slice(offsets[frame_idx], offsets[frame_idx + 1])
+        splits = np.flatnonzero(pose_starts[rows])[1:]
+        for pose_joints, pose_points in zip(np.split(joints[rows], splits), np.split(points[rows], splits)):
+            known = (pose_joints >= 0) & (pose_joints < num_joints)
+            pose = np.zeros((num_joints, 2), dtype=np.int32)
+            present = np.zeros(num_joints, dtype=bool)
+            pose[pose_joints[known]] = pose_points[known]
+            present[pose_joints[known]] = True
+            drawn = present[children] & present[parent_joints]
+            if drawn.any():
+                bones = np.stack((pose[children[drawn]], pose[parent_joints[drawn]]), axis=1)
+                cv2.polylines(frame, bones, False, bone_color, thickness=2)
+            for x, y in pose_points:
+                cv2.circle(frame, (int(x), int(y)), radius, joint_color, -1)
+        return frame
+    return draw
+
+def annotation_layer(annotations_df, num_frames, arrow_start, arrow_length=300, arrows=True, silence=True):
+    """Layer drawing the direction arrow and/or silence marker of each frame's annotation, as annotate_video does."""
+    codes = annotation_code_array(annotations_df, num_frames)
+    if not arrows:
+        codes[codes != ANNOTATION_CODES["silence"]] = 0
+    if not silence:
+        codes[codes == ANNOTATION_CODES["silence"]] = 0
+
+    def draw(frame_idx, frame):
+        return draw_annotation(frame, codes[frame_idx], arrow_start, arrow_length)
+    return draw
+
+def note_layer(annotations_df, num_frames, position, color=(255, 255, 255), font_scale=1.5):
+    """Layer writing each frame's note name (from the annotated table's Note column) as text."""
+    notes = np.full(num_frames, None, dtype=object)
+    first_rows = annotations_df.drop_duplicates('Frame', keep='first')
+    frames = first_rows['Frame'].values
+    valid = (frames == np.floor(frames)) & (frames >= 0) & (frames < num_frames)
+    notes[frames[valid].astype(int)] = first_rows['Note'].values[valid]
+
+    def draw(frame_idx, frame):
+        note = notes[frame_idx]
+        if isinstance(note, str) and note:
+            cv2.putText(frame, note, position, cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, 3, cv2.LINE_AA)
+        return frame
+    return draw
+
+def composite_video(video_path, output_video_path, layer_fns, num_workers=None):
+    """
+    Decodes a video once, applies every overlay layer to each frame and encodes the result once.
+
+    Parameters:
+    - video_path (str): Path to the source video.
+    - output_video_path (str): Path to save the composited video.
+    - layer_fns (list): Functions (num_frames, width, height) -> draw(frame_idx, frame), applied in order.
+    - num_workers (int, optional): Number of drawing threads (default: number of CPUs).
+
+    Returns:
+    - int: Number of frames written.
+    """
+    capture = cv2.VideoCapture(video_path)
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    num_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    writer = cv2.VideoWriter(output_video_path, cv2.VideoWriter_fourcc(*'mp4v'), int(fps), (width, height))
+    layers = [layer_fn(num_frames, width, height) for layer_fn in layer_fns]
+
+    def draw(frame_idx, frame):
+        for layer in layers:
+            frame = layer(frame_idx, frame)
+        return frame
+
+    try:
+        frames_written = run_frame_pipeline(capture, writer, num_frames, draw, num_workers=num_workers, stage='compositor')
+    finally:
+        capture.release()
+        writer.release()
+    print(f"Composited video with {len(layers)} layers saved to: {output_video_path}")
+    return frames_written
+
+def composite_outputs(video_path, output_video_path, points_path=None, pose_path=None, annotations_path=None,
+                      arrows=True, silence=True, notes=True, num_workers=None):
+    """
+    Composites the outputs of the pipeline stages onto the source video in a single pass.
+
+    Parameters:
+    - video_path (str): Path to the source video.
+    - output_video_path (str): Path to save the composited video.
+    - points_path (str, optional): TAPIR keypoints table; drawn as tracked points.
+    - pose_path (str, optional): METRABS keypoints table; drawn as smpl_24 skeletons.
+    - annotations_path (str, optional): Annotated frames table from the sync stage; drawn as direction
+      arrows, silence markers and note names as selected by arrows/silence/notes.
+    - num_workers (int, optional): Number of drawing threads (default: number of CPUs).
+
+    Returns:
+    - int: Number of frames written.
+    """
+    layer_fns = []
+    with span('compositor.load_layers'):
+        if pose_path:
+            pose_df = load_table(pose_path, columns=['Frame', 'Keypoint Index', 'X', 'Y'])
+            layer_fns.append(lambda num_frames, width, height: skeleton_layer(pose_df, num_frames))
+        if points_path:
+            points_df = load_table(points_path, columns=['Frame', 'Keypoint Index', 'X', 'Y'])
+            layer_fns.append(lambda num_frames, width, height: points_layer(points_df, num_frames))
+        if annotations_path:
+            annotations_df = load_table(annotations_path)
+            if arrows or silence:
+                layer_fns.append(lambda num_frames, width, height: annotation_layer(
+                    annotations_df, num_frames, (width - 150, height // 2), arrows=arrows, silence=silence))
+            if notes and 'Note' in annotations_df.columns:
+                layer_fns.append(lambda num_frames, width, height: note_layer(annotations_df, num_frames, (30, 60)))
+    return composite_video(video_path, output_video_path, layer_fns, num_workers=num_workers)
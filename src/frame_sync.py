@@ -1,68 +1,77 @@
+import numpy as np
 import pandas as pd
+from src.av_sync import load_frame_offset
+from src.columnar_io import load_table, save_table
+from src.instrumentation import span
 
-def annotate_frames(events_csv_path, frames_csv_path, output_csv_path):
+def annotate_frames(events_csv_path, frames_csv_path, output_csv_path, frame_offset=300):
     """
     Annotates frames based on events and frame range data, handling silences and directions.
 
+    Events are matched to direction ranges with a sorted interval join: event frames are sorted once
+    and each range's matches are located with binary search, so the work is O((frames + events) log events).
+
     Parameters:
-    - events_csv_path (str): Path to the events CSV file.
-    - frames_csv_path (str): Path to the frames CSV file.
-    - output_csv_path (str): Path to save the annotated CSV file.
+    - events_csv_path (str): Path to the events CSV (or .npz/.parquet) file.
+    - frames_csv_path (str): Path to the frames CSV (or .npz/.parquet) file.
+    - output_csv_path (str): Path to save the annotated CSV (or .npz/.parquet) file.
+    - frame_offset (int or str): Offset added to direction frames to align them with event frames, or the
+      path of a sync JSON file from src.av_sync (falling back to 300 if missing or low-confidence).
 
     Returns:
     - None
     """
+    if isinstance(frame_offset, str):
+        frame_offset = load_frame_offset(frame_offset)
+
     # Read the CSV files
-    events_df = pd.read_csv(events_csv_path)  # File with Time (s), Note, Event, Frame
-    frames_df = pd.read_csv(frames_csv_path)  # File with Frame Start, Frame End, Direction
+    with span('sync.load') as load_span:
+        events_df = load_table(events_csv_path)  # File with Time (s), Note, Event, Frame
+        frames_df = load_table(frames_csv_path)  # File with Frame Start, Frame End, Direction
+        load_span.count(events=len(events_df), ranges=len(frames_df))
+
+    with span('sync.join', events=len(events_df), ranges=len(frames_df)):
+        # Shift the direction ranges into the event frame numbering
+        frame_starts = frames_df['Frame Start'].values + frame_offset
+        frame_ends = frames_df['Frame End'].values + frame_offset
+
+        # Identify consecutive silence sequences
+        is_silence = (events_df['Event'].str.lower() == 'silence').values
+        silence_group = np.cumsum(np.concatenate(([True], is_silence[1:] != is_silence[:-1])))[:len(is_silence)]
 
-    # Add 300 to all numbers in Frame Start and Frame End columns
-    frames_df['Frame Start'] += 300
-    frames_df['Frame End'] += 300
+        # Events belonging to groups with 6 or more consecutive silences are annotated as silence
+        group_silences = np.bincount(silence_group, weights=is_silence)
+        in_valid_silence = group_silences[silence_group] >= 6
 
-    # Add a 'SilenceGroup' column to identify consecutive silence sequences
-    events_df['IsSilence'] = events_df['Event'].str.lower() == 'silence'
+        # Sorted interval join: for each range, find the events with start <= Frame <= end
+        event_frames = events_df['Frame'].values
+        order = np.argsort(event_frames, kind='stable')
+        sorted_frames = event_frames[order]
+        lo = np.searchsorted(sorted_frames, frame_starts, side='left')
+        hi = np.searchsorted(sorted_frames, frame_ends, side='right')
+        counts = np.maximum(hi - lo, 0)
 
-    # Use a helper column to identify consecutive silence sequences
-    events_df['SilenceGroup'] = (events_df['IsSilence'] != events_df['IsSilence'].shift()).cumsum()
+        # Expand each range into its matching positions in the sorted events
+        range_idx = np.repeat(np.arange(len(frames_df)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        event_idx = order[np.repeat(lo, counts) + offsets]
 
-    # Find groups with 6 or more consecutive silences
-    silence_groups = events_df.groupby('SilenceGroup')['IsSilence'].sum()
-    valid_silence_groups = silence_groups[silence_groups >= 6].index
+        # Keep the original event order within each range
+        pair_order = np.lexsort((event_idx, range_idx))
+        range_idx, event_idx = range_idx[pair_order], event_idx[pair_order]
 
-    # Filter and annotate based only on `frames_df`
-    annotations = []
-    for _, frame_row in frames_df.iterrows():
-        frame_start, frame_end, direction = frame_row['Frame Start'], frame_row['Frame End'], frame_row['Direction']
-        
-        # Check if any event falls within the frame range
-        matching_events = events_df[
-            (events_df['Frame'] >= frame_start) & (events_df['Frame'] <= frame_end)
-        ]
-        
-        for _, event_row in matching_events.iterrows():
-            frame = event_row['Frame']
-            event = event_row['Event']
-            
-            # Annotate as silence if it belongs to a valid silence group
-            if event_row['SilenceGroup'] in valid_silence_groups:
-                annotation = 'silence'
-            else:
-                annotation = direction  # Use the direction from `frames_df`
-            
-            annotations.append({
-                'Frame': frame,
-                'Time (s)': event_row['Time (s)'],
-                'Note': event_row['Note'],
-                'Event': event,
-                'Annotation': annotation
-            })
+        directions = frames_df['Direction'].values[range_idx]
+        annotations = np.where(in_valid_silence[event_idx], 'silence', directions.astype(object))
 
-    # Convert results to DataFrame
-    annotated_frames_df = pd.DataFrame(annotations)
-    annotated_frames_df['Frame'] = annotated_frames_df['Frame'] - 300  # Subtract 300 from Frame values
-    annotated_frames_df['Frame'] = annotated_frames_df['Frame'].astype(int)  # Ensure Frame is an integer
+        annotated_frames_df = pd.DataFrame({
+            'Frame': (event_frames[event_idx] - frame_offset).astype(int),
+            'Time (s)': events_df['Time (s)'].values[event_idx],
+            'Note': events_df['Note'].values[event_idx],
+            'Event': events_df['Event'].values[event_idx],
+            'Annotation': annotations
+        })
 
     # Save the annotated DataFrame to CSV
-    annotated_frames_df.to_csv(output_csv_path, index=False)
+    with span('sync.write', events=len(annotated_frames_df)):
+        save_table(annotated_frames_df, output_csv_path)
     print(f"Annotated frames saved to: {output_csv_path}")
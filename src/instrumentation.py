@@ -0,0 +1,164 @@
+import atexit
+import json
+import os
+import resource
+import threading
+import time
+
+class _NullSpan:
+    """Span returned while instrumentation is disabled; entering and counting do nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def count(self, **counts):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    def __init__(self, recorder, name, counts):
+        self.recorder = recorder
+        self.name = name
+        self.counts = counts
+
+    def __enter__(self):
+        self.rss_start = current_rss_mb()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder._record(self.name, self.start, time.perf_counter(), self.counts, self.rss_start, current_rss_mb())
+        return False
+
+    def count(self, **counts):
+        """Adds item counts (frames, keypoints, samples, ...) discovered while the span runs."""
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+def peak_rss_mb():
+    """Peak resident set size of the process so far in MB (ru_maxrss is in KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+_PAGE_MB = os.sysconf('SC_PAGE_SIZE') / (1 << 20) if hasattr(os, 'sysconf') else 0
+
+def current_rss_mb():
+    """Current resident set size of the process in MB, from /proc/self/statm (None where it is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_MB
+    except (OSError, ValueError, IndexError):
+        return None
+
+class Recorder:
+    """
+    Collects timing spans, item counts and memory use for pipeline stages.
+
+    Each span records the current RSS when it starts and ends; the difference is the memory the
+    span's step added (or freed). Spans running at the same time on other threads share the process,
+    so their deltas overlap. The process-wide peak RSS is reported once, in the summary.
+
+    While disabled, span() returns a shared no-op object, so instrumented code costs one
+    attribute check per span.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.metrics_path = None
+        self.trace_path = None
+        self._events = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def enable(self, metrics_path=None, trace_path=None):
+        """
+        Starts recording. Metrics go to `metrics_path` as JSON and, optionally, every span to
+        `trace_path` in Chrome trace format (chrome://tracing, Perfetto). A '{pid}' placeholder
+        in either path is replaced by the process id, for runs with worker processes.
+        """
+        pid = str(os.getpid())
+        self.metrics_path = metrics_path.replace('{pid}', pid) if metrics_path else None
+        self.trace_path = trace_path.replace('{pid}', pid) if trace_path else None
+        self._events = []
+        self._origin = time.perf_counter()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name, **counts):
+        """Returns a context manager timing `name`, with optional item counts."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, counts)
+
+    def _record(self, name, start, end, counts, rss_start=None, rss_end=None):
+        event = (name, start, end, counts, threading.get_ident(), rss_start, rss_end)
+        with self._lock:
+            self._events.append(event)
+
+    def summary(self):
+        """Aggregates the recorded spans by name."""
+        with self._lock:
+            events = list(self._events)
+        spans = {}
+        for name, start, end, counts, _, rss_start, rss_end in events:
+            entry = spans.setdefault(name, {'calls': 0, 'total_s': 0.0, 'max_s': 0.0, 'counts': {},
+                                            'max_rss_delta_mb': None, 'max_rss_end_mb': None})
+            duration = end - start
+            entry['calls'] += 1
+            entry['total_s'] += duration
+            entry['max_s'] = max(entry['max_s'], duration)
+            if rss_start is not None and rss_end is not None:
+                # Largest growth over one call, and the largest RSS a call left behind
+                delta = rss_end - rss_start
+                if entry['max_rss_delta_mb'] is None or delta > entry['max_rss_delta_mb']:
+                    entry['max_rss_delta_mb'] = delta
+                if entry['max_rss_end_mb'] is None or rss_end > entry['max_rss_end_mb']:
+                    entry['max_rss_end_mb'] = rss_end
+            for key, value in counts.items():
+                entry['counts'][key] = entry['counts'].get(key, 0) + value
+        for entry in spans.values():
+            entry['mean_s'] = entry['total_s'] / entry['calls']
+            entry['items_per_s'] = {key: value / entry['total_s'] for key, value in entry['counts'].items() if entry['total_s'] > 0}
+        return {
+            'wall_s': time.perf_counter() - self._origin,
+            'peak_rss_mb': peak_rss_mb(),
+            'spans': spans,
+        }
+
+    def write(self):
+        """Writes the metrics JSON and Chrome trace files configured in enable()."""
+        if not self.enabled:
+            return
+        if self.metrics_path:
+            with open(self.metrics_path, 'w') as f:
+                json.dump(self.summary(), f, indent=2)
+            print(f"Run metrics saved to: {self.metrics_path}")
+        if self.trace_path:
+            with self._lock:
+                events = list(self._events)
+            pid = os.getpid()
+            trace = [{
+                'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                'ts': (start - self._origin) * 1e6, 'dur': (end - start) * 1e6,
+                'args': dict(counts, rss_start_mb=rss_start, rss_end_mb=rss_end)
+            } for name, start, end, counts, tid, rss_start, rss_end in events]
+            with open(self.trace_path, 'w') as f:
+                json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+            print(f"Chrome trace saved to: {self.trace_path}")
+
+# Process-wide recorder used by the src/ modules
+recorder = Recorder()
+span = recorder.span
+enable = recorder.enable
+disable = recorder.disable
+write = recorder.write
+
+# Instrumentation can be switched on without code changes by setting BOW_METRICS and/or BOW_TRACE
+if os.environ.get('BOW_METRICS') or os.environ.get('BOW_TRACE'):
+    enable(os.environ.get('BOW_METRICS'), os.environ.get('BOW_TRACE'))
+    atexit.register(write)
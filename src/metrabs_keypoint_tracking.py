@@ -1,11 +1,16 @@
-import tensorflow as tf
 import os
 import cv2
 import numpy as np
-import csv
+import pandas as pd
+import queue
+import threading
+import time
+from src.columnar_io import save_table
+from src.instrumentation import span
 
 # Step 1: Download the Metrabs model
 def download_model(model_type):
+    import tensorflow as tf
     server_prefix = 'https://omnomnom.vision.rwth-aachen.de/data/metrabs'
     model_zippath = tf.keras.utils.get_file(
         origin=f'{server_prefix}/{model_type}_20211019.zip',
@@ -13,14 +18,43 @@ def download_model(model_type):
     model_path = os.path.join(os.path.dirname(model_zippath), model_type)
     return model_path
 
-# Load the Metrabs model
-def load_model(model_type='metrabs_mob3l_y4t'):
-    model_path = download_model(model_type)
-    model = tf.saved_model.load(model_path)
+# Load the Metrabs model, from the local model store (src.model_store) if store_dir is given
+def load_model(model_type='metrabs_mob3l_y4t', store_dir=None, offline=False, sha256=None):
+    import tensorflow as tf
+    with span('metrabs.load_model'):
+        if store_dir:
+            from src.model_store import metrabs_model_dir
+            model_path = metrabs_model_dir(model_type, store_dir, offline=offline, sha256=sha256)
+        else:
+            model_path = download_model(model_type)
+        model = tf.saved_model.load(model_path)
     return model
 
+# smpl_24 joints of the bowing (right) arm: elbow, wrist and hand
+BOWING_JOINTS = (19, 21, 23)
+
+def pose_rows(frame_idx, poses2d, joint_ids=None):
+    """Returns (Frame, Keypoint Index, X, Y) rows for every joint of every pose detected in a frame."""
+    num_poses, num_joints = poses2d.shape[:2]
+    return np.column_stack((
+        np.full(num_poses * num_joints, frame_idx),
+        np.tile(np.arange(num_joints) if joint_ids is None else np.asarray(joint_ids), num_poses),
+        poses2d.reshape(-1, 2)))
+
+def keypoints_table(rows):
+    """Concatenates pose rows into the Frame/Keypoint Index/X/Y table."""
+    rows = np.concatenate(rows) if rows else np.zeros((0, 4))
+    return pd.DataFrame({
+        'Frame': rows[:, 0].astype(int),
+        'Keypoint Index': rows[:, 1].astype(int),
+        'X': rows[:, 2],
+        'Y': rows[:, 3]
+    })
+
 # Step 2: Process video and detect keypoints
 def process_video(model, video_path, output_video_path, csv_output_path):
+    import tensorflow as tf
+
     # Open the video
     cap = cv2.VideoCapture(video_path)
 
@@ -29,45 +63,384 @@ def process_video(model, video_path, output_video_path, csv_output_path):
     frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
-    # Initialize the output video and CSV
+    # Initialize the output video (none if the overlay is left to src.compositor)
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_video_path, fourcc, fps, (frame_width, frame_height))
+    out = cv2.VideoWriter(output_video_path, fourcc, fps, (frame_width, frame_height)) if output_video_path else None
 
-    # Write header for CSV file
-    with open(csv_output_path, 'w', newline='') as csvfile:
-        csvwriter = csv.writer(csvfile)
-        csvwriter.writerow(['Frame', 'Keypoint Index', 'X', 'Y'])  # Header row
+    # Keypoints are collected as arrays and saved in one go at the end
+    rows = []
 
+    start_time = time.perf_counter()
     frame_count = 0
     while cap.isOpened():
-        ret, frame = cap.read()
+        with span('metrabs.decode', frames=1):
+            ret, frame = cap.read()
         if not ret:
             break
 
         # Convert frame to tensor and perform pose detection
-        image = tf.convert_to_tensor(frame)
-        pred = model.detect_poses(image, skeleton='smpl_24')
-
-        # Annotate the frame with pose results
-        annotated_frame = frame.copy()
-
-        # Save keypoints to CSV and annotate the frame
-        with open(csv_output_path, 'a', newline='') as csvfile:
-            csvwriter = csv.writer(csvfile)
-            for pose_index, pose2d in enumerate(pred['poses2d'].numpy()):
-                for keypoint_index, (x, y) in enumerate(pose2d):  # Each joint is (x, y)
-                    # Save to CSV: Frame, Keypoint Index, X, Y
-                    csvwriter.writerow([frame_count, keypoint_index, x, y])
-                    # Annotate the keypoint on the frame
-                    cv2.circle(annotated_frame, (int(x), int(y)), 2, (0, 0, 255), -1)
-
-        # Write the annotated frame to the output video
-        out.write(annotated_frame)
+        with span('metrabs.inference', frames=1):
+            image = tf.convert_to_tensor(frame)
+            pred = model.detect_poses(image, skeleton='smpl_24')
+            poses2d = pred['poses2d'].numpy()
+
+        # Collect keypoints
+        rows.append(pose_rows(frame_count, poses2d))
+
+        if out is not None:
+            with span('metrabs.draw', frames=1):
+                # Annotate the frame with pose results
+                annotated_frame = frame.copy()
+                for pose2d in poses2d:
+                    for x, y in pose2d:  # Each joint is (x, y)
+                        cv2.circle(annotated_frame, (int(x), int(y)), 2, (0, 0, 255), -1)
+
+            # Write the annotated frame to the output video
+            with span('metrabs.encode', frames=1):
+                out.write(annotated_frame)
         frame_count += 1
 
-    # Release video and file objects
+    # Release video objects and save the keypoints (CSV, or a binary table for .npz/.parquet paths)
+    cap.release()
+    if out is not None:
+        out.release()
+    with span('metrabs.write_keypoints') as write_span:
+        table = keypoints_table(rows)
+        save_table(table, csv_output_path)
+        write_span.count(keypoints=len(table))
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Processed {frame_count} frames at {frame_count / max(elapsed, 1e-9):.2f} frames/s")
+    if output_video_path:
+        print(f"Output video saved at: {output_video_path}")
+    print(f"Keypoints CSV saved at: {csv_output_path}")
+
+def _match_poses(reference, poses):
+    """Reorders `poses` so each one lines up with the reference pose nearest to it (greedy, by centroid)."""
+    distances = np.linalg.norm(reference.mean(axis=1)[:, None] - poses.mean(axis=1)[None], axis=2)
+    order = []
+    for i in range(len(reference)):
+        candidates = [j for j in np.argsort(distances[i]) if j not in order]
+        order.append(candidates[0])
+    return poses[order]
+
+def fill_poses(start_key, end_key, between_frames, fill='linear'):
+    """
+    Estimates the poses of the frames between two keyframes whose poses were detected by the model.
+
+    'linear' interpolates every joint between the two detections. 'flow' propagates the joints from
+    the first keyframe with Lucas-Kanade optical flow and spreads the remaining drift to the second
+    detection linearly over the gap. When the keyframes have different numbers of poses, each frame
+    takes the poses of its nearer keyframe.
+
+    Parameters:
+    - start_key, end_key (tuple): (frame_idx, gray frame, poses) of the keyframes; poses of shape (num_poses, num_joints, 2).
+    - between_frames (list): (frame_idx, gray frame) of the frames in between, in order.
+    - fill (str): 'linear' or 'flow'.
+
+    Returns:
+    - list: Poses of each frame in between.
+    """
+    start_idx, start_gray, start_poses = start_key
+    end_idx, end_gray, end_poses = end_key
+    weights = [(frame_idx - start_idx) / (end_idx - start_idx) for frame_idx, _ in between_frames]
+    if len(start_poses) == 0 or start_poses.shape != end_poses.shape:
+        return [start_poses if weight < 0.5 else end_poses for weight in weights]
+
+    end_poses = _match_poses(start_poses, end_poses)
+    if fill == 'linear':
+        return [(1 - weight) * start_poses + weight * end_poses for weight in weights]
+
+    # Track the joints frame to frame; joints the flow loses keep their last position
+    points = start_poses.reshape(-1, 1, 2).astype(np.float32)
+    previous_gray = start_gray
+    tracked = []
+    for _, gray in between_frames + [(end_idx, end_gray)]:
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(previous_gray, gray, points, None, winSize=(21, 21), maxLevel=3)
+        points = np.where(status[:, :, None] == 1, next_points, points)
+        tracked.append(points.reshape(start_poses.shape))
+        previous_gray = gray
+    drift = end_poses - tracked[-1]
+    return [positions + weight * drift for positions, weight in zip(tracked[:-1], weights)]
+
+def process_video_keyframes(model, video_path, output_video_path, csv_output_path, keyframe_interval=5,
+                            motion_threshold=None, fill='linear', joints=None):
+    """
+    Runs METRABS only on keyframes and fills the frames in between, writing a full per-frame keypoint table.
+
+    A keyframe is taken every `keyframe_interval` frames, and earlier when the frame has changed from
+    the last keyframe by more than `motion_threshold` (mean absolute difference in grey levels of
+    64-pixel-wide thumbnails). The last frame is always a keyframe. Frames in between are filled by
+    fill_poses.
+
+    Parameters:
+    - model: Loaded Metrabs model.
+    - video_path (str): Path to the input video.
+    - output_video_path (str): Path to save the annotated video (None to skip it).
+    - csv_output_path (str): Path to save the keypoints CSV (or .npz/.parquet table).
+    - keyframe_interval (int): Largest number of frames between model calls.
+    - motion_threshold (float, optional): Motion that triggers an early keyframe (None for fixed intervals).
+    - fill (str): 'linear' interpolation or 'flow' (optical-flow propagation).
+    - joints (list, optional): smpl_24 joint indices to keep, e.g. BOWING_JOINTS (default: all 24).
+
+    Returns:
+    - dict: Frame and keyframe counts, elapsed time and throughput.
+    """
+    import tensorflow as tf
+    if fill not in ('linear', 'flow'):
+        raise ValueError(f"fill must be 'linear' or 'flow', got '{fill}'")
+
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    out = cv2.VideoWriter(output_video_path, fourcc, fps, (frame_width, frame_height)) if output_video_path else None
+    thumbnail_size = (64, max(int(64 * frame_height / max(frame_width, 1)), 1))
+
+    rows = []
+    num_keyframes = 0
+
+    def detect(frame):
+        with span('metrabs.inference', frames=1):
+            pred = model.detect_poses(tf.convert_to_tensor(frame), skeleton='smpl_24')
+            poses2d = pred['poses2d'].numpy()
+        return poses2d if joints is None else poses2d[:, list(joints)]
+
+    def emit(frame_idx, frame, poses2d):
+        rows.append(pose_rows(frame_idx, poses2d, joints))
+        if out is not None:
+            with span('metrabs.draw', frames=1):
+                for pose2d in poses2d:
+                    for x, y in pose2d:
+                        cv2.circle(frame, (int(x), int(y)), 2, (0, 0, 255), -1)
+            with span('metrabs.encode', frames=1):
+                out.write(frame)
+
+    def close_gap(key, pending, frame_idx, frame, gray):
+        # Detect the new keyframe, fill the frames before it and write them all in order
+        poses2d = detect(frame)
+        with span('metrabs.fill', frames=len(pending)):
+            filled = fill_poses(key[:3], (frame_idx, gray, poses2d),
+                                [(idx, pending_gray) for idx, _, pending_gray in pending], fill)
+        for (idx, pending_frame, _), pending_poses in zip(pending, filled):
+            emit(idx, pending_frame, pending_poses)
+        emit(frame_idx, frame, poses2d)
+        return (frame_idx, gray, poses2d, cv2.resize(gray, thumbnail_size, interpolation=cv2.INTER_AREA))
+
+    start_time = time.perf_counter()
+    key, pending = None, []  # Last keyframe as (frame_idx, gray, poses, thumbnail), and the frames after it
+    frame_idx = 0
+    while True:
+        with span('metrabs.decode', frames=1):
+            ret, frame = cap.read()
+        if not ret:
+            break
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        if key is None:
+            poses2d = detect(frame)
+            emit(frame_idx, frame, poses2d)
+            key = (frame_idx, gray, poses2d, cv2.resize(gray, thumbnail_size, interpolation=cv2.INTER_AREA))
+            num_keyframes += 1
+        else:
+            is_keyframe = frame_idx - key[0] >= keyframe_interval
+            if not is_keyframe and motion_threshold is not None:
+                thumbnail = cv2.resize(gray, thumbnail_size, interpolation=cv2.INTER_AREA)
+                is_keyframe = float(np.mean(cv2.absdiff(thumbnail, key[3]))) > motion_threshold
+            if is_keyframe:
+                key = close_gap(key, pending, frame_idx, frame, gray)
+                pending = []
+                num_keyframes += 1
+            else:
+                pending.append((frame_idx, frame, gray))
+        frame_idx += 1
+
+    # The last frame closes the final gap
+    if pending:
+        last_idx, last_frame, last_gray = pending.pop()
+        close_gap(key, pending, last_idx, last_frame, last_gray)
+        num_keyframes += 1
+
     cap.release()
-    out.release()
+    if out is not None:
+        out.release()
+    with span('metrabs.write_keypoints') as write_span:
+        table = keypoints_table(rows)
+        save_table(table, csv_output_path)
+        write_span.count(keypoints=len(table))
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Processed {frame_idx} frames with {num_keyframes} model calls at {frame_idx / max(elapsed, 1e-9):.2f} frames/s")
+    if output_video_path:
+        print(f"Output video saved at: {output_video_path}")
+    print(f"Keypoints CSV saved at: {csv_output_path}")
+    return {'frames': frame_idx, 'keyframes': num_keyframes, 'seconds': elapsed,
+            'frames_per_second': frame_idx / max(elapsed, 1e-9)}
+
+def _put(q, item, consumer):
+    """Puts an item on a bounded queue without blocking forever if its consumer thread has died."""
+    while True:
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            if not consumer.is_alive():
+                raise RuntimeError(f"{consumer.name} thread stopped unexpectedly")
+
+def _run_thread(target, errors, name):
+    """Starts a daemon thread that records any exception it raises in `errors`."""
+    def run():
+        try:
+            target()
+        except BaseException as e:
+            errors.append(e)
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
+
+# Batched variant of process_video: frames are prefetched on a reader thread, sent to the model
+# several at a time, and annotated/encoded on a writer thread while the next batch runs
+def process_video_batched(model, video_path, output_video_path, csv_output_path, batch_size=8, queue_size=32):
+    """
+    Detects poses in batches with prefetched decoding and background annotation/encoding.
+
+    Parameters:
+    - model: Loaded Metrabs model.
+    - video_path (str): Path to the input video.
+    - output_video_path (str): Path to save the annotated video (None to skip it, e.g. when src.compositor draws the poses).
+    - csv_output_path (str): Path to save the keypoints CSV (or .npz/.parquet table).
+    - batch_size (int): Number of frames sent to the model in one call.
+    - queue_size (int): Maximum number of frames (or batches) waiting between threads.
+
+    Returns:
+    - float: Throughput in frames per second.
+    """
+    import tensorflow as tf
+
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    out = cv2.VideoWriter(output_video_path, fourcc, fps, (frame_width, frame_height)) if output_video_path else None
+
+    frame_queue = queue.Queue(maxsize=queue_size)
+    result_queue = queue.Queue(maxsize=max(queue_size // batch_size, 1))
+    errors = []
+    stop_reading = threading.Event()  # Set when inference stops taking frames, normally or on an error
+
+    def put_frame(frame):
+        """Waits for room in the frame queue, giving up once inference has stopped."""
+        while not stop_reading.is_set():
+            try:
+                frame_queue.put(frame, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read_frames():
+        try:
+            while not stop_reading.is_set():
+                with span('metrabs.decode', frames=1):
+                    ret, frame = cap.read()
+                if not ret:
+                    break
+                if not put_frame(frame):
+                    break
+        finally:
+            put_frame(None)
+
+    # CSV rows are appended batch by batch with the same writer as save_table; binary tables are saved once at the end
+    is_csv = csv_output_path.lower().endswith('.csv')
+    all_rows = []
+
+    def write_frames():
+        csvfile = open(csv_output_path, 'w', newline='') if is_csv else None
+        try:
+            if is_csv:
+                keypoints_table([]).to_csv(csvfile, index=False)
+            while True:
+                item = result_queue.get()
+                if item is None:
+                    break
+                first_frame, frames, batch_poses = item
+
+                # Collect the batch's keypoints as one array and write them in bulk
+                rows = [pose_rows(first_frame + offset, poses2d) for offset, poses2d in enumerate(batch_poses)]
+                if out is not None:
+                    with span('metrabs.draw', frames=len(frames)):
+                        for frame, poses2d in zip(frames, batch_poses):
+                            for pose2d in poses2d:
+                                for x, y in pose2d:
+                                    cv2.circle(frame, (int(x), int(y)), 2, (0, 0, 255), -1)
+                    with span('metrabs.encode', frames=len(frames)):
+                        for frame in frames:
+                            out.write(frame)
+                if is_csv:
+                    with span('metrabs.write_keypoints') as write_span:
+                        batch_table = keypoints_table(rows)
+                        batch_table.to_csv(csvfile, header=False, index=False)
+                        write_span.count(keypoints=len(batch_table))
+                else:
+                    all_rows.extend(rows)
+        finally:
+            if csvfile:
+                csvfile.close()
+
+    start_time = time.perf_counter()
+    reader = _run_thread(read_frames, errors, 'reader')
+    writer = _run_thread(write_frames, errors, 'writer')
+
+    frame_count = 0
+    done = False
+    try:
+        while not done:
+            frames = []
+            while len(frames) < batch_size:
+                frame = frame_queue.get()
+                if frame is None:
+                    done = True
+                    break
+                frames.append(frame)
+            if not frames:
+                break
+
+            with span('metrabs.inference', frames=len(frames)):
+                pred = model.detect_poses_batched(tf.stack(frames), skeleton='smpl_24')
+                batch_poses = [pred['poses2d'][i].numpy() for i in range(len(frames))]
+            _put(result_queue, (frame_count, frames, batch_poses), writer)
+            frame_count += len(frames)
+    finally:
+        if writer.is_alive():
+            _put(result_queue, None, writer)
+        writer.join()
+        # Stop the reader and empty its queue so it can finish, and release the capture only once it has
+        stop_reading.set()
+        while True:
+            try:
+                frame_queue.get_nowait()
+            except queue.Empty:
+                break
+        reader.join()
+        cap.release()
+        if out is not None:
+            out.release()
+
+    if errors:
+        raise errors[0]
+    if not is_csv:
+        with span('metrabs.write_keypoints') as write_span:
+            table = keypoints_table(all_rows)
+            save_table(table, csv_output_path)
+            write_span.count(keypoints=len(table))
 
-    print(f"Output video saved at: {output_video_path}")
+    elapsed = time.perf_counter() - start_time
+    frames_per_second = frame_count / max(elapsed, 1e-9)
+    print(f"Processed {frame_count} frames at {frames_per_second:.2f} frames/s")
+    if output_video_path:
+        print(f"Output video saved at: {output_video_path}")
     print(f"Keypoints CSV saved at: {csv_output_path}")
+    return frames_per_second
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+# Local directory holding converted and downloaded models, so runs work offline
+DEFAULT_STORE_DIR = os.environ.get('BOW_MODEL_STORE', 'models')
+MANIFEST_NAME = 'manifest.json'
+VERIFIED_NAME = '.verified.json'
+METRABS_SERVER = 'https://omnomnom.vision.rwth-aachen.de/data/metrabs'
+
+# Pinned SHA-256 of the METRABS release archives, by model type. A download is extracted only if it matches,
+# so add the checksum of a trusted copy of an archive here (or pass sha256=) before fetching it into the store.
+METRABS_SHA256 = {}
+
+def sha256_file(path, block_size=1 << 20):
+    """Returns the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_stamp(path):
+    """Returns [size, mtime_ns] of a file, used to skip re-hashing files that have not changed."""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def _file_entries(model_dir):
+    """Checksums and sizes of every file under model_dir, keyed by relative path."""
+    entries = {}
+    for root, _, files in os.walk(model_dir):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            rel_path = os.path.relpath(path, model_dir)
+            if rel_path in (MANIFEST_NAME, VERIFIED_NAME):
+                continue
+            entries[rel_path] = {'sha256': sha256_file(path), 'size': os.path.getsize(path)}
+    return entries
+
+def write_manifest(model_dir, **info):
+    """Writes the manifest with a checksum for every file of the model, plus any extra info."""
+    manifest = dict(info, files=_file_entries(model_dir))
+    with open(os.path.join(model_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def read_manifest(model_dir):
+    with open(os.path.join(model_dir, MANIFEST_NAME)) as f:
+        return json.load(f)
+
+def verify(model_dir):
+    """
+    Checks every file of a stored model against the checksums in its manifest.
+
+    Hashing gigabytes on every start would undo the point of warm loading, so a file is only re-hashed
+    when its size or modification time differs from when it was last verified.
+
+    Parameters:
+    - model_dir (str): Directory of the stored model.
+
+    Returns:
+    - dict: The model's manifest.
+    """
+    if not os.path.exists(os.path.join(model_dir, MANIFEST_NAME)):
+        raise FileNotFoundError(f"No model manifest in {model_dir}; convert or fetch the model into the store first")
+    manifest = read_manifest(model_dir)
+
+    verified_path = os.path.join(model_dir, VERIFIED_NAME)
+    try:
+        with open(verified_path) as f:
+            verified = json.load(f)
+    except (OSError, ValueError):
+        verified = {}
+
+    stamps = {}
+    for rel_path, entry in manifest['files'].items():
+        path = os.path.join(model_dir, rel_path)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Model file missing from store: {path}")
+        stat = os.stat(path)
+        stamp = [stat.st_size, stat.st_mtime_ns, entry['sha256']]
+        if verified.get(rel_path) != stamp:
+            if stat.st_size != entry['size'] or sha256_file(path) != entry['sha256']:
+                raise ValueError(f"Checksum mismatch for {path}; the stored model is corrupt or was modified")
+        stamps[rel_path] = stamp
+
+    if stamps != verified:
+        try:
+            with open(verified_path, 'w') as f:
+                json.dump(stamps, f)
+        except OSError:
+            pass  # A read-only store is verified again next time
+    return manifest
+
+def _flatten(tree, prefix=()):
+    """Yields (key path, array) pairs of a nested dict of arrays."""
+    for key in sorted(tree):
+        value = tree[key]
+        if isinstance(value, dict):
+            yield from _flatten(value, prefix + (key,))
+        else:
+            yield prefix + (key,), np.asarray(value)
+
+def convert_tapir_checkpoint(checkpoint_path, model_dir):
+    """
+    Converts a pickled TAPIR .npy checkpoint into one plain .npy file per array plus a manifest.
+
+    The converted layout loads without pickle and can be memory-mapped, so worker processes share the
+    weights through the page cache instead of each unpickling a private copy.
+
+    Parameters:
+    - checkpoint_path (str): Path to the original tapir_checkpoint_*.npy file.
+    - model_dir (str): Directory to create in the store.
+
+    Returns:
+    - str: model_dir.
+    """
+    ckpt_state = np.load(checkpoint_path, allow_pickle=True).item()
+    tmp_dir = f"{model_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(os.path.join(tmp_dir, 'arrays'))
+
+    arrays = []
+    for i, (key_path, array) in enumerate(_flatten({'params': ckpt_state['params'], 'state': ckpt_state['state']})):
+        file_name = os.path.join('arrays', f"{i:05d}.npy")
+        np.save(os.path.join(tmp_dir, file_name), np.ascontiguousarray(array), allow_pickle=False)
+        arrays.append({'path': list(key_path), 'file': file_name, 'shape': list(array.shape), 'dtype': array.dtype.str})
+
+    write_manifest(tmp_dir, model='tapir', source=os.path.basename(checkpoint_path),
+                   source_sha256=sha256_file(checkpoint_path), source_stamp=file_stamp(checkpoint_path), arrays=arrays)
+    shutil.rmtree(model_dir, ignore_errors=True)
+    os.replace(tmp_dir, model_dir)
+    print(f"Converted {checkpoint_path} to {model_dir} ({len(arrays)} arrays)")
+    return model_dir
+
+def load_tapir_params(model_dir, mmap=True):
+    """
+    Loads TAPIR params and state from a converted model directory.
+
+    Parameters:
+    - model_dir (str): Directory written by convert_tapir_checkpoint.
+    - mmap (bool): Memory-map the arrays (read-only) instead of reading them into private memory.
+
+    Returns:
+    - params (dict), state (dict): Nested dicts of arrays, as in the original checkpoint.
+    """
+    manifest = verify(model_dir)
+    tree = {'params': {}, 'state': {}}
+    for entry in manifest['arrays']:
+        node = tree
+        for key in entry['path'][:-1]:
+            node = node.setdefault(key, {})
+        node[entry['path'][-1]] = np.load(os.path.join(model_dir, entry['file']), mmap_mode='r' if mmap else None,
+                                          allow_pickle=False)
+    return tree['params'], tree['state']
+
+def tapir_model_dir(checkpoint_path, store_dir=DEFAULT_STORE_DIR):
+    """
+    Returns the store directory for a TAPIR checkpoint, converting the checkpoint on first use.
+
+    A store entry is reused only if it was converted from a file with the same checksum. As in verify,
+    the checkpoint is only hashed when its size or modification time differs from the manifest's stamp.
+    """
+    model_dir = os.path.join(store_dir, os.path.splitext(os.path.basename(checkpoint_path))[0])
+    if os.path.exists(os.path.join(model_dir, MANIFEST_NAME)):
+        manifest = verify(model_dir)
+        if not os.path.exists(checkpoint_path) or manifest.get('source_stamp') == file_stamp(checkpoint_path):
+            return model_dir
+        if manifest.get('source_sha256') == sha256_file(checkpoint_path):
+            # Same contents with a new stamp (e.g. copied or touched); record it so the next start skips hashing
+            manifest['source_stamp'] = file_stamp(checkpoint_path)
+            try:
+                with open(os.path.join(model_dir, MANIFEST_NAME), 'w') as f:
+                    json.dump(manifest, f, indent=2)
+            except OSError:
+                pass  # A read-only store hashes the checkpoint again next time
+            return model_dir
+    if not os.path.exists(checkpoint_path):
+        raise FileNotFoundError(f"TAPIR checkpoint not found: {checkpoint_path}")
+    os.makedirs(store_dir, exist_ok=True)
+    return convert_tapir_checkpoint(checkpoint_path, model_dir)
+
+def metrabs_model_dir(model_type, store_dir=DEFAULT_STORE_DIR, offline=False, sha256=None):
+    """
+    Returns the store directory of a METRABS SavedModel, downloading it only if it is not stored yet.
+
+    The downloaded archive is checked against its pinned checksum before it is extracted.
+
+    Parameters:
+    - model_type (str): METRABS model name, e.g. 'metrabs_mob3l_y4t'.
+    - store_dir (str): Model store directory.
+    - offline (bool): Never download; raise if the model is not in the store.
+    - sha256 (str, optional): Expected SHA-256 of the archive (default: METRABS_SHA256[model_type]).
+
+    Returns:
+    - str: Path of the verified SavedModel directory.
+    """
+    model_dir = os.path.join(store_dir, model_type)
+    if os.path.exists(os.path.join(model_dir, MANIFEST_NAME)):
+        verify(model_dir)
+        return model_dir
+    if offline:
+        raise FileNotFoundError(f"METRABS model {model_type} is not in the store at {store_dir} and offline=True")
+    sha256 = sha256 or METRABS_SHA256.get(model_type)
+    if not sha256:
+        raise ValueError(f"No pinned SHA-256 for the METRABS archive {model_type}_20211019.zip; add it to "
+                         f"METRABS_SHA256 (or pass sha256=) before downloading")
+
+    import tensorflow as tf
+    os.makedirs(store_dir, exist_ok=True)
+    zip_path = tf.keras.utils.get_file(origin=f'{METRABS_SERVER}/{model_type}_20211019.zip', extract=False,
+                                       cache_dir=os.path.abspath(store_dir), cache_subdir='downloads')
+    try:
+        actual_sha256 = sha256_file(zip_path)
+        if actual_sha256 != sha256.lower():
+            raise ValueError(f"Checksum mismatch for the downloaded {zip_path}: expected {sha256}, got {actual_sha256}")
+        extract_dir = f"{model_dir}.tmp"
+        shutil.rmtree(extract_dir, ignore_errors=True)
+        shutil.unpack_archive(zip_path, extract_dir)
+        shutil.rmtree(model_dir, ignore_errors=True)
+        shutil.move(os.path.join(extract_dir, model_type), model_dir)
+        shutil.rmtree(extract_dir, ignore_errors=True)
+    finally:
+        os.remove(zip_path)
+    write_manifest(model_dir, model='metrabs', source=f'{model_type}_20211019.zip', source_sha256=sha256.lower())
+    print(f"Stored METRABS model {model_type} in {model_dir}")
+    return model_dir
@@ -0,0 +1,332 @@
+import time
+from collections import deque
+import cv2
+import numpy as np
+import pandas as pd
+from src.bow_direction_pca import DIRECTION_LABELS, STATIONARY, UP, DOWN
+from src.instrumentation import span
+
+def camera_frames(device=0):
+    """
+    Yields (frame, capture_time) pairs from a live camera until it stops delivering frames.
+
+    Parameters:
+    - device (int or str): OpenCV capture device index or stream URL.
+    """
+    capture = cv2.VideoCapture(device)
+    try:
+        while True:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            yield frame, time.perf_counter()
+    finally:
+        capture.release()
+
+def realtime_frames(video_path, fps=None):
+    """
+    Yields (frame, capture_time) pairs from a video file, paced as if it came from a live camera.
+
+    A frame is never released before its due time; if processing falls behind, frames are yielded
+    as fast as they decode and their capture time stays the due time, so the lag shows up as latency.
+
+    Parameters:
+    - video_path (str): Path to the video file.
+    - fps (float, optional): Playback rate (default: the file's frame rate).
+    """
+    capture = cv2.VideoCapture(video_path)
+    fps = fps or capture.get(cv2.CAP_PROP_FPS) or 30
+    start = time.perf_counter()
+    frame_idx = 0
+    try:
+        while True:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            due = start + frame_idx / fps
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            yield frame, due
+            frame_idx += 1
+    finally:
+        capture.release()
+
+class PointTracker:
+    """
+    Follows one image point from frame to frame with pyramidal Lucas-Kanade optical flow.
+
+    The point is tracked through a small cluster of corner features around it and moves by their
+    median displacement, which is robust to a few features slipping. The cluster is re-seeded around
+    the current position when too few features survive.
+    """
+
+    def __init__(self, point, scale=0.5, radius=20, max_features=20, min_features=4):
+        self.point = np.array(point, dtype=np.float32)  # (x, y) in full-resolution pixels
+        self.scale = scale
+        self.radius = radius
+        self.max_features = max_features
+        self.min_features = min_features
+        self.lost = False
+        self._prev_gray = None
+        self._features = None
+        self._lk_params = dict(winSize=(21, 21), maxLevel=3,
+                               criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+
+    def _gray(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        if self.scale != 1:
+            gray = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return gray
+
+    def _seed(self, gray):
+        """Picks corner features within `radius` of the point, falling back to the point itself."""
+        center = self.point * self.scale
+        mask = np.zeros(gray.shape, dtype=np.uint8)
+        cv2.circle(mask, (int(center[0]), int(center[1])), max(int(self.radius * self.scale), 2), 255, -1)
+        features = cv2.goodFeaturesToTrack(gray, self.max_features, 0.01, 2, mask=mask)
+        if features is None:
+            features = center.reshape(1, 1, 2)
+        self._features = features.astype(np.float32)
+
+    def update(self, frame):
+        """
+        Moves the point to its position in `frame`.
+
+        Returns:
+        - np.ndarray: The (x, y) position in full-resolution pixels.
+        """
+        gray = self._gray(frame)
+        if self._prev_gray is None:
+            self._seed(gray)
+        else:
+            tracked, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, self._features, None, **self._lk_params)
+            good = status.reshape(-1) == 1
+            self.lost = not good.any()
+            if not self.lost:
+                displacement = np.median((tracked - self._features).reshape(-1, 2)[good], axis=0)
+                self.point += displacement / self.scale
+                self._features = tracked[good].reshape(-1, 1, 2)
+            if good.sum() < self.min_features:
+                self._seed(gray)
+        self._prev_gray = gray
+        return self.point.copy()
+
+class SlidingPCA:
+    """
+    Principal axis of the last `window` positions, updated in O(1) per frame from running sums.
+
+    The axis is oriented so that its larger component is positive, the convention scikit-learn's PCA
+    uses for the offline trajectory, so 'Up' and 'Down' mean the same thing in both modes.
+    """
+
+    def __init__(self, window=300):
+        self.window = window
+        self._points = deque()
+        self._sums = np.zeros(5)  # x, y, xx, xy, yy
+
+    def add(self, point):
+        x, y = float(point[0]), float(point[1])
+        terms = np.array([x, y, x * x, x * y, y * y])
+        self._points.append(terms)
+        self._sums += terms
+        if len(self._points) > self.window:
+            self._sums -= self._points.popleft()
+
+    def axis(self):
+        """
+        Returns the unit principal axis and the image axis it is closer to.
+
+        Returns:
+        - vector (np.ndarray or None): Unit (x, y) vector, or None until the window has any spread.
+        - axis (str): 'X' or 'Y', as in principal_projection.
+        """
+        n = len(self._points)
+        if n < 2:
+            return None, 'X'
+        sx, sy, sxx, sxy, syy = self._sums / n
+        cov_xx, cov_xy, cov_yy = sxx - sx * sx, sxy - sx * sy, syy - sy * sy
+        if cov_xx + cov_yy <= 1e-9:
+            return None, 'X'
+
+        # Leading eigenvector of the 2x2 covariance matrix in closed form
+        angle = 0.5 * np.arctan2(2 * cov_xy, cov_xx - cov_yy)
+        vector = np.array([np.cos(angle), np.sin(angle)])
+        if vector[np.argmax(np.abs(vector))] < 0:
+            vector = -vector
+        return vector, 'X' if abs(vector[0]) > abs(vector[1]) else 'Y'
+
+class TrailingMajority:
+    """
+    Majority smoothing with a bounded look-ahead of `latency_frames`.
+
+    The label for frame k is released once frame k + latency_frames has arrived, as the most common
+    code in the window of `window_size` codes ending there. Ties go to the code seen first in the
+    window, as in majority_smooth. With latency_frames = window_size // 2 the window is centered and
+    matches the offline smoothing; with 0 it only looks back.
+
+    window_size must be odd: majority_smooth votes over window_size // 2 codes on each side of a frame,
+    i.e. window_size + 1 codes for an even size, so an even online window could never match it.
+    """
+
+    def __init__(self, window_size=5, latency_frames=2):
+        if window_size % 2 == 0:
+            raise ValueError(f"window_size must be odd to match majority_smooth, got {window_size}")
+        if not 0 <= latency_frames < window_size:
+            raise ValueError(f"latency_frames must be between 0 and {window_size - 1}, got {latency_frames}")
+        self.window_size = window_size
+        self.latency_frames = latency_frames
+        self._codes = deque(maxlen=window_size)
+        self._pushed = 0
+
+    def push(self, code):
+        """Adds the newest code and returns the smoothed code released by it (None while filling up)."""
+        self._codes.append(code)
+        self._pushed += 1
+        if len(self._codes) <= self.latency_frames:
+            return None
+        return self._majority()
+
+    def _majority(self):
+        counts = np.bincount(np.array(self._codes), minlength=len(DIRECTION_LABELS))
+        best = counts.max()
+        for code in self._codes:
+            if counts[code] == best:
+                return code
+
+    def flush(self):
+        """Releases the codes still held back for look-ahead once the stream has ended."""
+        released = []
+        look_back = self.window_size - 1 - self.latency_frames
+        for frame_idx in range(max(self._pushed - self.latency_frames, 0), self._pushed):
+            # Drop codes that fall before this frame's window; the window end stays at the last code
+            while self._codes and self._pushed - len(self._codes) < frame_idx - look_back:
+                self._codes.popleft()
+            released.append(self._majority())
+        return released
+
+class OnlineBowDirection:
+    """
+    Estimates the bow direction frame by frame from a live stream.
+
+    Each frame moves the tracked bow point, updates the sliding principal axis and turns the step
+    along that axis into Up/Down/Stationary, which is released after `latency_frames` frames of
+    look-ahead smoothing.
+
+    Parameters:
+    - point (tuple): Initial (x, y) pixel position of the bow point in the first frame.
+    - window_size (int): Size of the majority smoothing window (odd).
+    - latency_frames (int): Frames of look-ahead before a label is released.
+    - pca_window (int): Number of recent positions the principal axis is fitted to.
+    - min_step (float): Steps along the axis shorter than this (pixels) count as Stationary.
+    - track_scale (float): Scale at which frames are tracked (smaller is faster).
+    """
+
+    def __init__(self, point, window_size=5, latency_frames=2, pca_window=300, min_step=0.5, track_scale=0.5):
+        self.tracker = PointTracker(point, scale=track_scale)
+        self.pca = SlidingPCA(pca_window)
+        self.smoother = TrailingMajority(window_size, latency_frames)
+        self.min_step = min_step
+        self._prev_point = None
+        self._frame_idx = -1
+        self._pending = deque()  # (frame index, capture time, x, y) awaiting release
+
+    def update(self, frame, capture_time=None):
+        """
+        Processes one frame.
+
+        Returns:
+        - tuple or None: (frame index, direction, x, y, capture time) of the released frame, if any.
+        """
+        with span('online.frame', frames=1):
+            capture_time = time.perf_counter() if capture_time is None else capture_time
+            self._frame_idx += 1
+            point = self.tracker.update(frame)
+            self.pca.add(point)
+
+            # Direction of the step from the previous frame, along the current principal axis
+            code = STATIONARY
+            vector, axis = self.pca.axis()
+            if self._prev_point is not None and vector is not None:
+                step = float(np.dot(point - self._prev_point, vector))
+                if axis == 'Y':
+                    step = -step
+                if step > self.min_step:
+                    code = UP
+                elif step < -self.min_step:
+                    code = DOWN
+            self._prev_point = point
+
+            self._pending.append((self._frame_idx, capture_time, point[0], point[1]))
+            smoothed = self.smoother.push(code)
+            if smoothed is None:
+                return None
+            frame_idx, released_time, x, y = self._pending.popleft()
+            return frame_idx, DIRECTION_LABELS[smoothed], x, y, released_time
+
+    def flush(self):
+        """Releases the frames still held back once the stream has ended."""
+        released = []
+        for code in self.smoother.flush():
+            frame_idx, capture_time, x, y = self._pending.popleft()
+            released.append((frame_idx, DIRECTION_LABELS[code], x, y, capture_time))
+        return released
+
+def latency_summary(latencies_ms, processing_ms, fps):
+    """Summarizes per-frame latency and processing times and whether processing keeps up with `fps`."""
+    latencies_ms, processing_ms = np.asarray(latencies_ms), np.asarray(processing_ms)
+    if not len(processing_ms):
+        return {'frames': 0}
+    return {
+        'frames': len(processing_ms),
+        'latency_mean_ms': float(latencies_ms.mean()),
+        'latency_p95_ms': float(np.percentile(latencies_ms, 95)),
+        'latency_max_ms': float(latencies_ms.max()),
+        'processing_mean_ms': float(processing_ms.mean()),
+        'processing_p95_ms': float(np.percentile(processing_ms, 95)),
+        'keeps_up': bool(np.percentile(processing_ms, 95) < 1000 / fps),
+    }
+
+def run_online(frames, point, fps=30, window_size=5, latency_frames=2, pca_window=300, min_step=0.5,
+               track_scale=0.5, on_direction=None):
+    """
+    Runs online bow direction estimation over a frame stream.
+
+    Latency is measured per frame from its capture time to the release of its label, so it includes
+    the look-ahead wait (about latency_frames / fps) as well as the processing time.
+
+    Parameters:
+    - frames (iterable): (frame, capture_time) pairs, e.g. from camera_frames or realtime_frames.
+    - point (tuple): Initial (x, y) pixel position of the bow point.
+    - fps (float): Frame rate of the stream, used to judge whether processing keeps up.
+    - window_size, latency_frames, pca_window, min_step, track_scale: See OnlineBowDirection.
+    - on_direction (callable, optional): on_direction(frame, frame_idx, direction) for each released label;
+      `frame` is the newest frame, so live feedback can be drawn on what is on screen now.
+
+    Returns:
+    - pd.DataFrame: One row per frame with Frame, Direction, X, Y, Latency (ms) and Processing (ms).
+    - dict: Latency summary, as returned by latency_summary.
+    """
+    estimator = OnlineBowDirection(point, window_size, latency_frames, pca_window, min_step, track_scale)
+    rows, processing_ms = [], []
+    frame = None
+
+    def release(result, frame):
+        frame_idx, direction, x, y, capture_time = result
+        rows.append((frame_idx, direction, x, y, (time.perf_counter() - capture_time) * 1000))
+        if on_direction:
+            on_direction(frame, frame_idx, direction)
+
+    for frame, capture_time in frames:
+        start = time.perf_counter()
+        result = estimator.update(frame, capture_time)
+        processing_ms.append((time.perf_counter() - start) * 1000)
+        if result is not None:
+            release(result, frame)
+    for result in estimator.flush():
+        release(result, frame)
+
+    table = pd.DataFrame(rows, columns=['Frame', 'Direction', 'X', 'Y', 'Latency (ms)'])
+    table['Processing (ms)'] = np.array(processing_ms)[table['Frame'].values] if rows else []
+    summary = latency_summary(table['Latency (ms)'].values, processing_ms, fps)
+    return table, summary
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+class Stage:
+    """
+    One step of the pipeline.
+
+    Parameters:
+    - name (str): Unique stage name, also used for its cache manifest.
+    - run (callable): Called as run(**params) to produce the outputs.
+    - inputs (list): Files the stage reads; their contents are part of the cache key.
+    - outputs (list): Files the stage writes.
+    - params (dict): JSON-serializable parameters passed to `run` and hashed into the cache key.
+    - deps (list): Names of stages that must finish first (typically the ones producing `inputs`).
+    """
+
+    def __init__(self, name, run, inputs=(), outputs=(), params=None, deps=()):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = dict(params or {})
+        self.deps = list(deps)
+
+def file_digest(path, block_size=1 << 20):
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class Pipeline:
+    """
+    Runs stages as a DAG, skipping those whose cached outputs are still valid.
+
+    A stage's cache key hashes its name, parameters and the contents of its input files. Inputs
+    produced upstream are hashed only after the upstream stage has finished, so a rerun upstream
+    that produces identical files does not invalidate anything downstream. Independent stages run
+    concurrently on a thread pool.
+
+    Parameters:
+    - stages (list): Stage objects.
+    - cache_dir (str): Directory holding one JSON manifest per stage.
+    - max_workers (int): Maximum number of stages running at once.
+    """
+
+    def __init__(self, stages, cache_dir, max_workers=2):
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Stage names must be unique")
+        for stage in stages:
+            for dep in stage.deps:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+        self._check_acyclic()
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+
+    def _check_acyclic(self):
+        state = {}  # name -> 'visiting' or 'done'
+
+        def visit(name, path):
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise ValueError(f"Cycle in pipeline: {' -> '.join(path + [name])}")
+            state[name] = 'visiting'
+            for dep in self.stages[name].deps:
+                visit(dep, path + [name])
+            state[name] = 'done'
+
+        for name in self.stages:
+            visit(name, [])
+
+    def cache_key(self, stage):
+        """Hashes the stage's name, parameters and input file contents."""
+        digest = hashlib.sha256()
+        digest.update(stage.name.encode())
+        digest.update(json.dumps(stage.params, sort_keys=True, default=str).encode())
+        for path in stage.inputs:
+            digest.update(path.encode())
+            digest.update(file_digest(path).encode())
+        return digest.hexdigest()
+
+    def _manifest_path(self, stage):
+        return os.path.join(self.cache_dir, f"{stage.name}.json")
+
+    def is_up_to_date(self, stage, key):
+        manifest_path = self._manifest_path(stage)
+        if not os.path.exists(manifest_path):
+            return False
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        return manifest.get('key') == key and all(os.path.exists(path) for path in stage.outputs)
+
+    def _run_stage(self, stage):
+        key = self.cache_key(stage)
+        if self.is_up_to_date(stage, key):
+            print(f"[{stage.name}] up to date, skipping")
+            return 'skipped'
+
+        print(f"[{stage.name}] running")
+        start = time.perf_counter()
+        stage.run(**stage.params)
+        elapsed = time.perf_counter() - start
+
+        missing = [path for path in stage.outputs if not os.path.exists(path)]
+        if missing:
+            raise RuntimeError(f"Stage '{stage.name}' did not produce: {', '.join(missing)}")
+
+        with open(self._manifest_path(stage), 'w') as f:
+            json.dump({'key': key, 'outputs': stage.outputs, 'params': stage.params, 'elapsed': elapsed},
+                      f, indent=2, default=str)
+        print(f"[{stage.name}] finished in {elapsed:.1f}s")
+        return 'ran'
+
+    def run(self):
+        """
+        Runs every stage whose cache is stale, in dependency order.
+
+        Returns:
+        - dict: Stage name -> 'ran', 'skipped', 'failed' or 'blocked' (an upstream stage failed).
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        status = {}
+        errors = []
+        remaining = dict(self.stages)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while remaining or running:
+                # Start every stage whose dependencies are resolved
+                for name, stage in list(remaining.items()):
+                    dep_status = [status.get(dep) for dep in stage.deps]
+                    if any(s in ('failed', 'blocked') for s in dep_status):
+                        status[name] = 'blocked'
+                        del remaining[name]
+                    elif all(s in ('ran', 'skipped') for s in dep_status):
+                        running[executor.submit(self._run_stage, stage)] = name
+                        del remaining[name]
+
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        status[name] = future.result()
+                    except Exception as e:
+                        status[name] = 'failed'
+                        errors.append((name, e))
+                        print(f"[{name}] failed: {e}")
+
+        if errors:
+            name, error = errors[0]
+            raise RuntimeError(f"Pipeline stage '{name}' failed") from error
+        return status
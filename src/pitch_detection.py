@@ -2,72 +2,158 @@
 import os
 import numpy as np
 import pandas as pd
-import librosa
-import crepe
-import matplotlib.pyplot as plt
-from scipy.io import wavfile
+from src.audio_frontend import CREPE_SAMPLE_RATE, AudioBuffer
+from src.columnar_io import save_table, table_path
+from src.instrumentation import span
+from src.plotting import new_figure, save_figure, submit_plot
 
 # Utility function to map frequency (Hz) to musical note
 def hz_to_note_name(hz):
     if hz is None or np.isnan(hz):
         return None
+    import librosa
     note_num = int(round(12 * np.log2(hz / 440.0))) + 69  # Convert to MIDI number
     return librosa.midi_to_note(note_num)
 
 # Function to draw the fundamental pitch curve
 def draw_fundamental_curve(time, frequency, confidence, proj, algo, output_dir):
-    plt.figure(figsize=(14, 5))
-    plt.plot(time, frequency, label='Frequency (pitch)', color='blue', linewidth=1.5)
-    plt.fill_between(time, 0, confidence, color='gray', alpha=0.5, label='Confidence')
-    plt.xlabel('Time (s)')
-    plt.ylabel('Frequency (Hz)')
-    plt.title(f'Pitch Curve - {algo.upper()}')
-    plt.legend(loc='upper right')
-    plt.grid(True)
-
-    # Save plot as .jpg file
-    output_path = f"{output_dir}/{proj}_pitch_curve_{algo}.jpg"
-    plt.savefig(output_path)
-    plt.close()
+    with span('pitch.plot', frames=len(time)):
+        fig = new_figure(figsize=(14, 5))
+        ax = fig.subplots()
+        ax.plot(time, frequency, label='Frequency (pitch)', color='blue', linewidth=1.5)
+        ax.fill_between(time, 0, confidence, color='gray', alpha=0.5, label='Confidence')
+        ax.set_xlabel('Time (s)')
+        ax.set_ylabel('Frequency (Hz)')
+        ax.set_title(f'Pitch Curve - {algo.upper()}')
+        ax.legend(loc='upper right')
+        ax.grid(True)
+
+        # Save plot as .jpg file
+        output_path = f"{output_dir}/{proj}_pitch_curve_{algo}.jpg"
+        save_figure(fig, output_path)
     print(f"Pitch curve saved as: {output_path}")
 
+# Approximate playable frequency range (Hz) of the instrument
+def instrument_frequency_range(instrument):
+    if instrument == 'cello':
+        return 65, 1047  # Approx range for cello
+    return 196, 3136  # Approx range for violin
+
+# Model capacities each CREPE backend provides
+CREPE_MODELS = {'torch': ('tiny', 'full'), 'tensorflow': ('tiny', 'small', 'medium', 'large', 'full')}
+
+# Numeric precisions of the torchcrepe CPU path
+CREPE_PRECISIONS = ('fp32', 'int8', 'bf16')
+
+# Load torchcrepe weights into its module-level cache, e.g. once per batch worker,
+# so that the first file processed doesn't pay for loading the model
+# On CPU, precision='int8' applies dynamic int8 quantization to the model's linear layers and precision='bf16'
+# runs the whole network in bfloat16 (fast on CPUs with native bf16 support); num_threads sets torch's intra-op threads
+# CREPE's only linear layer is the final classifier; its six convolutions, where nearly all the time goes, stay fp32,
+# so 'int8' is not expected to be faster than fp32. Use 'bf16' for speed; compare_precision measures both
+def load_torchcrepe_model(model='full', precision='fp32', num_threads=None):
+    import torchcrepe
+    import torch
+    if precision not in CREPE_PRECISIONS:
+        raise ValueError(f"precision must be one of {CREPE_PRECISIONS}, got '{precision}'")
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+    device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+    torchcrepe.load.model(device, model)
+    if precision == 'fp32' or device != 'cpu':
+        return
+
+    # torchcrepe.predict reuses torchcrepe.infer.model as long as the capacity matches, so the
+    # reduced-precision copy replaces it in place
+    crepe_model = torchcrepe.infer.model.eval()
+    if precision == 'int8':
+        crepe_model = torch.ao.quantization.quantize_dynamic(crepe_model, {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        class Bfloat16Crepe(torch.nn.Module):
+            """Runs CREPE in bfloat16 and hands float32 probabilities back to torchcrepe's decoder."""
+
+            def __init__(self, module):
+                super().__init__()
+                self.module = module.to(torch.bfloat16)
+
+            def forward(self, x, embed=False):
+                return self.module(x.to(torch.bfloat16), embed=embed).float()
+
+        crepe_model = Bfloat16Crepe(crepe_model)
+    torchcrepe.infer.model = crepe_model
+
 # Pitch detection with CREPE model (either torch or tensorflow backend)
-def pitch_detect_crepe(crepe_backend, proj, frame_start, frame_end, total_time, instrument='cello', audio_path='wavs/background.wav', output_dir='output'):
+# Pass `audio` (an AudioBuffer from src.audio_frontend) to reuse already decoded audio instead of loading audio_path
+# The pitch curve is plotted on the background plotting thread after the table is saved; pass plot=False to skip it
+# `model` selects the CREPE capacity (see CREPE_MODELS). With silence_gate=True (torch backend), CREPE only runs on
+# voiced spans found by the energy-based silence detector, and silent frames get NaN pitch
+def pitch_detect_crepe(crepe_backend, proj, frame_start, frame_end, total_time, instrument='cello', audio_path='wavs/background.wav', output_dir='output', audio=None, output_format='csv', plot=True, model='full', silence_gate=False, silence_threshold=0.005, gate_padding=3, return_silence=False):
+    if crepe_backend in CREPE_MODELS and model not in CREPE_MODELS[crepe_backend]:
+        raise ValueError(f"The {crepe_backend} CREPE backend supports models {CREPE_MODELS[crepe_backend]}, got '{model}'")
+    if silence_gate and crepe_backend != 'torch':
+        raise ValueError("silence_gate is only supported with the torch CREPE backend")
+
+    silence = None
     if crepe_backend == 'torch':
         import torchcrepe
         import torch
-        y, sr = librosa.load(audio_path, mono=True)
+        with span('pitch.load_audio') as load_span:
+            if audio is not None:
+                y, sr = audio.at_rate(CREPE_SAMPLE_RATE)
+            else:
+                import librosa
+                y, sr = librosa.load(audio_path, mono=True)
+            load_span.count(samples=len(y))
         audio_1channel = torch.tensor(y).reshape(1, -1)
         sample_num = audio_1channel.shape[1]
 
         # Define frequency range based on the instrument
-        if instrument == 'cello':
-            min_freq, max_freq = 65, 1047  # Approx range for cello
+        min_freq, max_freq = instrument_frequency_range(instrument)
+
+        device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+        if silence_gate:
+            # With decoded audio, the gate finds silence at the native rate, exactly as the note stage does,
+            # so the note stage can reuse it (return_silence=True) instead of detecting it again
+            if audio is not None:
+                silence = detect_silence(None, silence_threshold=silence_threshold, audio=audio)
+            frequency, confidence, silence = crepe_silence_gated(y, sr, model, min_freq, max_freq, device,
+                                                                 silence_threshold=silence_threshold,
+                                                                 padding=gate_padding, silence=silence)
         else:
-            min_freq, max_freq = 196, 3136  # Approx range for violin
-
-        frequency, confidence = torchcrepe.predict(
-            audio_1channel,
-            sr,
-            hop_length=int(sr / 30.),
-            return_periodicity=True,
-            model='full',
-            fmin=min_freq,
-            fmax=max_freq,
-            batch_size=2048,
-            device='cuda:0' if torch.cuda.is_available() else 'cpu'
-        )
-
-        # Reshape results for further processing
-        frequency = frequency.detach().cpu().numpy().reshape(-1,)
-        confidence = confidence.detach().cpu().numpy().reshape(-1,)
+            with span('pitch.crepe', samples=sample_num) as crepe_span:
+                frequency, confidence = torchcrepe.predict(
+                    audio_1channel,
+                    sr,
+                    hop_length=int(sr / 30.),
+                    return_periodicity=True,
+                    model=model,
+                    fmin=min_freq,
+                    fmax=max_freq,
+                    batch_size=2048,
+                    device=device
+                )
+
+                # Reshape results for further processing
+                frequency = frequency.detach().cpu().numpy().reshape(-1,)
+                confidence = confidence.detach().cpu().numpy().reshape(-1,)
+                crepe_span.count(frames=len(frequency))
         time = np.linspace(0, sample_num / sr, len(frequency))
 
     elif crepe_backend == 'tensorflow':
-        sr, y = wavfile.read(audio_path)
-        time, frequency, confidence, activation = crepe.predict(
-            y, sr, viterbi=True, step_size=100 / 3, model_capacity='full', center=True
-        )
+        import crepe
+        from scipy.io import wavfile
+        with span('pitch.load_audio') as load_span:
+            if audio is not None:
+                y, sr = audio.at_rate()
+            else:
+                sr, y = wavfile.read(audio_path)
+            load_span.count(samples=len(y))
+        with span('pitch.crepe', samples=len(y)) as crepe_span:
+            time, frequency, confidence, activation = crepe.predict(
+                y, sr, viterbi=True, step_size=100 / 3, model_capacity=model, center=True
+            )
+            crepe_span.count(frames=len(frequency))
 
     else:
         print('Please specify crepe_backend as either "torch" or "tensorflow"')
@@ -76,51 +162,303 @@ def pitch_detect_crepe(crepe_backend, proj, frame_start, frame_end, total_time,
     # Map time to frame numbers
     frames = frame_start + (time / total_time) * (frame_end - frame_start)
 
+    # Save the pitch results as CSV with the updated time stamps
+    pitch_results = np.stack((time, frequency, confidence, frames), axis=1)
+    output_csv_path = table_path(f"{output_dir}/{proj}_pitch_frequencies", output_format)
+    with span('pitch.write', frames=len(pitch_results)):
+        save_table(pd.DataFrame(pitch_results, columns=["Time (s)", "Frequency (Hz)", "Confidence", "Frame"]), output_csv_path)
+    print(f"Pitch frequencies saved as: {output_csv_path}")
 
     # Plot and save the pitch curve
-    draw_fundamental_curve(time, frequency, confidence, proj, 'crepe', output_dir)
+    if plot:
+        submit_plot(draw_fundamental_curve, time, frequency, confidence, proj, 'crepe', output_dir)
 
-    # Save the pitch results as CSV with the updated time stamps
-    pitch_results = np.stack((time, frequency, confidence, frames), axis=1)
+    # The silence gate's detect_silence result (None without the gate), for infer_note_positions_with_silence
+    if return_silence:
+        return pitch_results, silence
+    return pitch_results
+
+# torchcrepe's frame grid: audio is analysed at 16 kHz with the hop rounded down on that grid
+def crepe_frame_grid(num_samples, sr, fps=30):
+    """
+    Returns the hop length, frame period, frame count and context frames of a torchcrepe run.
+
+    Parameters:
+    - num_samples (int): Length of the audio in samples.
+    - sr (int): Sample rate of the audio.
+    - fps (int): Frames per second of the pitch track (the hop is sr / fps samples).
+
+    Returns:
+    - hop_length (int): Hop in samples at sr, as passed to torchcrepe.
+    - frame_period (float): Seconds between frame centers.
+    - num_frames (int): Number of frames a run over the whole audio produces.
+    - context_frames (int): Frames of audio needed on each side for CREPE's analysis window.
+    """
+    import torchcrepe
+    hop_length = int(sr / fps)
+    hop_16k = int(hop_length * torchcrepe.SAMPLE_RATE / sr)
+    frame_period = hop_16k / torchcrepe.SAMPLE_RATE
+    num_frames = 1 + int(num_samples * torchcrepe.SAMPLE_RATE / sr) // hop_16k
+    context_frames = int(np.ceil(torchcrepe.WINDOW_SIZE / 2 / hop_16k)) + 1
+    return hop_length, frame_period, num_frames, context_frames
+
+def predict_frame_range(read, sr, total_samples, first, last, model, fmin, fmax, device):
+    """
+    Runs torchcrepe on frames [first, last) of the whole-recording frame grid.
+
+    The audio is read with context frames on both sides and only the frames centered inside the range
+    are kept, so the results line up with a run over the whole recording.
+
+    Parameters:
+    - read (callable): read(start, end) -> float32 mono samples [start, end) at sr.
+    - sr (int): Sample rate of the audio.
+    - total_samples (int): Length of the whole recording in samples.
+    - first, last (int): Frame range on the grid of crepe_frame_grid.
+    - model (str): torchcrepe model capacity, 'tiny' or 'full'.
+    - fmin, fmax (float): Frequency range in Hz.
+    - device (str): Torch device.
+
+    Returns:
+    - frame_idx (np.ndarray): Grid indices of the returned frames.
+    - frequency (np.ndarray), confidence (np.ndarray): Pitch and periodicity of those frames.
+    """
+    import torchcrepe
+    import torch
+    hop_length, frame_period, _, context_frames = crepe_frame_grid(total_samples, sr)
+
+    # Read the range with context frames on both sides
+    read_first = max(first - context_frames, 0)
+    read_start = int(round(read_first * frame_period * sr))
+    read_end = min(int(round((last - 1 + context_frames) * frame_period * sr)), total_samples)
+    y = read(read_start, read_end)
+
+    with span('pitch.crepe', samples=len(y), frames=last - first):
+        frequency, confidence = torchcrepe.predict(
+            torch.tensor(y).reshape(1, -1),
+            sr,
+            hop_length=hop_length,
+            return_periodicity=True,
+            model=model,
+            fmin=fmin,
+            fmax=fmax,
+            batch_size=2048,
+            device=device
+        )
+        frequency = frequency.detach().cpu().numpy().reshape(-1,)
+        confidence = confidence.detach().cpu().numpy().reshape(-1,)
+
+    # Keep the frames centered inside the range
+    keep = slice(first - read_first, min(last - read_first, len(frequency)))
+    return read_first + np.arange(len(frequency))[keep], frequency[keep], confidence[keep]
+
+# Streaming pitch detection with the torch CREPE backend for recordings too long to hold in memory
+def pitch_detect_crepe_streaming(proj, frame_start, frame_end, total_time, instrument='cello', audio_path='wavs/background.wav', output_dir='output', block_seconds=60, model='full', silence_threshold=0.005):
+    """
+    Runs torchcrepe and note inference block by block, appending each block's results to the pitch
+    and inferred notes CSVs.
+
+    Audio is read from disk in blocks of `block_seconds` plus enough context on each side for
+    CREPE's analysis window, so memory stays flat regardless of recording length. Frames lie on
+    torchcrepe's hop grid at 30 frames per second, and only frames centered inside a block are kept.
+    A first, cheap pass computes the frame energies, since silence is relative to the loudest frame;
+    notes are then inferred as in infer_note_positions_with_silence.
+
+    Parameters:
+    - proj (str): Project name used for output file names.
+    - frame_start, frame_end (int): Video frames spanned by the recording.
+    - total_time (float): Duration of the recording in seconds.
+    - instrument (str): 'cello' or 'violin', selects the frequency range.
+    - audio_path (str): Path to the .wav audio file.
+    - output_dir (str): Directory for the pitch CSV.
+    - block_seconds (float): Length of audio processed per block.
+    - model (str): torchcrepe model capacity, 'tiny' or 'full'.
+    - silence_threshold (float): Threshold for silence detection, as in detect_silence.
+
+    Returns:
+    - str: Path to the pitch frequencies CSV.
+    - str: Path to the inferred notes CSV.
+    """
+    import soundfile as sf
+    import torch
+
+    min_freq, max_freq = instrument_frequency_range(instrument)
+    device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
     output_csv_path = f"{output_dir}/{proj}_pitch_frequencies.csv"
-    pd.DataFrame(pitch_results, columns=["Time (s)", "Frequency (Hz)", "Confidence", "Frame"]).to_csv(output_csv_path, index=False)
+    columns = ["Time (s)", "Frequency (Hz)", "Confidence", "Frame"]
+    pd.DataFrame(columns=columns).to_csv(output_csv_path, index=False)
+    notes_csv_path = f"{output_dir}/{proj}_inferred_notes_with_silence.csv"
+    notes_columns = ["Frame", "Time (s)", "Note", "Event"]
+    pd.DataFrame(columns=notes_columns).to_csv(notes_csv_path, index=False)
+
+    with sf.SoundFile(audio_path) as audio_file:
+        frame_energy = stream_frame_energy(audio_file, block_seconds=block_seconds)
+        silence_frames = frame_energy / np.max(frame_energy) < silence_threshold
+        previous_note = None
+
+        sr = audio_file.samplerate
+        total_samples = audio_file.frames
+        _, frame_period, num_frames, _ = crepe_frame_grid(total_samples, sr)
+        frames_per_block = max(int(block_seconds / frame_period), 1)
+
+        def read(start, end):
+            with span('pitch.load_audio', samples=end - start):
+                audio_file.seek(start)
+                return audio_file.read(end - start, dtype='float32', always_2d=True).mean(axis=1)
+
+        for first in range(0, num_frames, frames_per_block):
+            last = min(first + frames_per_block, num_frames)
+            frame_idx, frequency, confidence = predict_frame_range(read, sr, total_samples, first, last,
+                                                                   model, min_freq, max_freq, device)
+            time = frame_idx * frame_period
+            frames = frame_start + (time / total_time) * (frame_end - frame_start)
+
+            block_results = np.stack((time, frequency, confidence, frames), axis=1)
+            with span('pitch.write', frames=len(block_results)):
+                pd.DataFrame(block_results, columns=columns).to_csv(output_csv_path, mode='a', header=False, index=False)
+            block_notes, previous_note = infer_notes(block_results, silence_frames, first, previous_note)
+            with span('pitch.write', frames=len(block_notes)):
+                pd.DataFrame(block_notes, columns=notes_columns).to_csv(notes_csv_path, mode='a', header=False, index=False)
+            print(f"{proj}: {last}/{num_frames} pitch frames ({100 * last / num_frames:.0f}%)")
+
     print(f"Pitch frequencies saved as: {output_csv_path}")
+    print(f"Inferred notes saved as: {notes_csv_path}")
+    return output_csv_path, notes_csv_path
 
-    return pitch_results
+def voiced_spans(voiced, padding=3, min_gap=0):
+    """
+    Returns (first, last) frame ranges covering the voiced frames, each widened by `padding` frames.
+
+    Spans separated by fewer than `min_gap` frames are merged, since the context each separate CREPE
+    call reads would cost more than running through the gap.
+    """
+    voiced = np.asarray(voiced, dtype=bool)
+    n = len(voiced)
+    if padding:
+        cumulative = np.concatenate(([0], np.cumsum(voiced)))
+        idx = np.arange(n)
+        voiced = cumulative[np.minimum(idx + padding + 1, n)] - cumulative[np.maximum(idx - padding, 0)] > 0
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], voiced.astype(np.int8), [0]))))
+    spans = []
+    for first, last in zip(edges[::2], edges[1::2]):
+        if spans and first - spans[-1][1] < min_gap:
+            spans[-1] = (spans[-1][0], last)
+        else:
+            spans.append((first, last))
+    return [(int(first), int(last)) for first, last in spans]
 
-def detect_silence(audio_path, fps=30, silence_threshold=0.005):
+def crepe_silence_gated(y, sr, model, fmin, fmax, device, silence_threshold=0.005, padding=3, silence=None):
+    """
+    Runs torchcrepe only on the voiced parts of a recording, found first with detect_silence.
+
+    The output has the same frame grid as a run over the whole recording; silent frames get NaN
+    frequency and zero confidence.
+
+    Parameters:
+    - y (np.ndarray): float32 mono samples.
+    - sr (int): Sample rate.
+    - model, fmin, fmax, device: As for predict_frame_range.
+    - silence_threshold (float): Energy threshold of detect_silence.
+    - padding (int): Frames added on both sides of every voiced span.
+    - silence (tuple, optional): detect_silence result to gate with (default: detected from y).
+
+    Returns:
+    - frequency (np.ndarray), confidence (np.ndarray): One value per frame of the grid.
+    - silence (tuple): The detect_silence result used.
+    """
+    _, _, num_frames, context_frames = crepe_frame_grid(len(y), sr)
+
+    # Pitch rows and silence frames are matched by index, as infer_note_positions_with_silence does, so every
+    # frame it treats as voiced has a pitch
+    with span('pitch.silence_gate', samples=len(y)):
+        if silence is None:
+            silence = detect_silence(None, silence_threshold=silence_threshold, audio=AudioBuffer(y, sr))
+        silence_frames = silence[1]
+        silence_idx = np.minimum(np.arange(num_frames), len(silence_frames) - 1)
+        spans = voiced_spans(~silence_frames[silence_idx], padding, min_gap=2 * context_frames)
+
+    frequency = np.full(num_frames, np.nan, dtype=np.float32)
+    confidence = np.zeros(num_frames, dtype=np.float32)
+    for first, last in spans:
+        frame_idx, span_frequency, span_confidence = predict_frame_range(
+            lambda start, end: y[start:end], sr, len(y), first, last, model, fmin, fmax, device)
+        frequency[frame_idx] = span_frequency
+        confidence[frame_idx] = span_confidence
+
+    voiced_frames = sum(last - first for first, last in spans)
+    print(f"Silence gate: CREPE ran on {voiced_frames}/{num_frames} frames in {len(spans)} spans")
+    return frequency, confidence, silence
+
+def spectral_energy(frames):
+    """
+    Returns the one-sided spectral energy of each row of `frames` (the samples of one video frame).
+
+    By Parseval's theorem the one-sided (rfft) spectral energy is (N * sum(x^2) + |X_0|^2 + |X_N/2|^2) / 2,
+    where the DC and Nyquist bins are plain sums, so the spectrum itself never needs to be computed.
+    """
+    frame_length = frames.shape[1]
+    energy = frame_length * np.einsum('ij,ij->i', frames, frames, dtype=np.float64)
+    energy += frames.sum(axis=1, dtype=np.float64) ** 2
+    if frame_length % 2 == 0:
+        nyquist = frames[:, ::2].sum(axis=1, dtype=np.float64) - frames[:, 1::2].sum(axis=1, dtype=np.float64)
+        energy += nyquist ** 2
+    return energy / 2
+
+def stream_frame_energy(audio_file, fps=30, block_seconds=60):
+    """
+    Computes detect_silence's per-frame energy (before normalization) block by block from an open sf.SoundFile.
+
+    Only one block of samples is held at a time; the result has one value per video frame.
+    """
+    frame_length = int(audio_file.samplerate / fps)
+    num_frames = audio_file.frames // frame_length
+    frames_per_block = max(int(block_seconds * fps), 1)
+    energy = np.empty(num_frames)
+    for first in range(0, num_frames, frames_per_block):
+        last = min(first + frames_per_block, num_frames)
+        with span('silence.energy', samples=(last - first) * frame_length):
+            audio_file.seek(first * frame_length)
+            samples = audio_file.read((last - first) * frame_length, dtype='float32', always_2d=True).mean(axis=1)
+            energy[first:last] = spectral_energy(samples.reshape(-1, frame_length))
+    return energy
+
+def detect_silence(audio_path, fps=30, silence_threshold=0.005, audio=None):
     """
-    Detects periods of silence in an audio file using Fourier Transform.
+    Detects periods of silence in an audio file from the energy of each video frame's samples.
 
     Parameters:
     - audio_path: Path to the .wav audio file.
     - fps: Frames per second (default: 30).
     - silence_threshold: Threshold for silence detection (default: 0.01).
+    - audio: Optional AudioBuffer to use instead of loading audio_path.
 
     Returns:
     - silent_intervals: List of tuples representing silent intervals (start_time, end_time).
     - silence_frames: List of silent frames.
     """
-    # Load audio
-    signal, sr = librosa.load(audio_path, sr=None)
-    frame_length = int(sr / fps)  # Frame length for 30 FPS
-    hop_length = frame_length     # Non-overlapping frames for 30 FPS
+    import librosa
 
-    # Frame the signal
-    frames = librosa.util.frame(signal, frame_length=frame_length, hop_length=hop_length).T
+    # Load audio
+    with span('silence.load_audio') as load_span:
+        if audio is not None:
+            signal, sr = audio.at_rate()
+        else:
+            signal, sr = librosa.load(audio_path, sr=None)
+        load_span.count(samples=len(signal))
+    with span('silence.energy', samples=len(signal)):
+        frame_length = int(sr / fps)  # Frame length for 30 FPS
+        hop_length = frame_length     # Non-overlapping frames for 30 FPS
 
-    # Compute the FFT for each frame
-    fft_frames = np.fft.rfft(frames, axis=1)
-    magnitude = np.abs(fft_frames)  # Magnitude spectrum
+        # Frame the signal
+        frames = librosa.util.frame(signal, frame_length=frame_length, hop_length=hop_length).T
 
-    # Compute energy of each frame
-    frame_energy = np.sum(magnitude**2, axis=1)
+        # Compute energy of each frame
+        frame_energy = spectral_energy(frames)
 
-    # Normalize energy
-    frame_energy /= np.max(frame_energy)
+        # Normalize energy
+        frame_energy /= np.max(frame_energy)
 
-    # Identify silence based on the threshold
-    silence_frames = frame_energy < silence_threshold
+        # Identify silence based on the threshold
+        silence_frames = frame_energy < silence_threshold
 
     # Convert silence frames to time intervals
     times = librosa.frames_to_time(np.arange(len(silence_frames)), sr=sr, hop_length=hop_length)
@@ -141,16 +479,34 @@ def detect_silence(audio_path, fps=30, silence_threshold=0.005):
     return silent_intervals, silence_frames, frame_energy, times
 
 # Updated infer_note_positions_with_silence using energy-based silence detection
-def infer_note_positions_with_silence(pitch_results, audio_path):
-    # Detect silence intervals
-    silent_intervals, silence_frames, frame_energy, times = detect_silence(audio_path)
+def infer_note_positions_with_silence(pitch_results, audio_path, audio=None, silence_threshold=0.005, silence=None):
+    # Detect silence intervals, unless the silence gate already did (silence is its detect_silence result)
+    if silence is None:
+        silence = detect_silence(audio_path, silence_threshold=silence_threshold, audio=audio)
+    silent_intervals, silence_frames, frame_energy, times = silence
+    inferred_notes, _ = infer_notes(pitch_results, silence_frames)
+    return inferred_notes
 
+def infer_notes(pitch_results, silence_frames, first_row=0, previous_note=None):
+    """
+    Labels pitch rows as note changes, sustains or silences.
+
+    Parameters:
+    - pitch_results (np.ndarray): Rows of (time, frequency, confidence, frame).
+    - silence_frames (np.ndarray): Silence flag of every frame of the recording, matched to rows by index.
+    - first_row (int): Index of the first row in the whole recording, when labelling one block at a time.
+    - previous_note (str, optional): Last note of the previous block.
+
+    Returns:
+    - list: (frame, time, note, event) tuples.
+    - str: Last note, to pass on to the next block.
+    """
     inferred_notes = []
-    previous_note = None
 
-    for idx, (time, freq, prob, frame) in enumerate(pitch_results):
+    for idx, (time, freq, prob, frame) in enumerate(pitch_results, start=first_row):
         # Check for silence (no bow contact) using silence detection
-        if silence_frames[idx]:
+        # CREPE's hop is slightly shorter than 1/30 s, so the last pitch rows reuse the last silence frame
+        if silence_frames[min(idx, len(silence_frames) - 1)]:
             inferred_notes.append((frame, time, None, "silence"))
         else:
             # Convert frequency to musical note if probability of voicing is high enough
@@ -163,46 +519,106 @@ def infer_note_positions_with_silence(pitch_results, audio_path):
             else:
                 inferred_notes.append((frame, time, current_note, "sustain"))
 
-    return inferred_notes
+    return inferred_notes, previous_note
 
 # Plot function for note positions, changes, and no bow contact events
 def plot_note_positions_with_silence(inferred_notes, proj, output_dir):
-    times = [item[1] for item in inferred_notes]
-    notes = [item[2] if item[2] is not None else 'Rest' for item in inferred_notes]
-    events = [item[3] for item in inferred_notes]
-
-    plt.figure(figsize=(14, 5))
-
-    # Map notes to y-axis positions for plotting
-    unique_notes = sorted(set(notes))  # Get unique notes including 'Rest'
-    note_to_y = {note: i for i, note in enumerate(unique_notes)}
-    y_values = [note_to_y[note] for note in notes]
-
-    # Plot the note positions with markers for changes, sustains, and no bow contact
-    for i, event in enumerate(events):
-        if event == "change":
-            plt.plot(times[i], y_values[i], marker='o', markersize=8, color='green', label="Change" if i == 0 else "")
-        elif event == "sustain":
-            plt.plot(times[i], y_values[i], marker='x', markersize=5, color='red', label="Sustain" if i == 0 else "")
-        elif event == "silence":
-            plt.plot(times[i], y_values[i], marker='s', markersize=8, color='gray', label="No Bow Contact" if i == 0 else "")
-
-    plt.yticks(ticks=list(range(len(unique_notes))), labels=unique_notes)
-    plt.xlabel("Time (s)")
-    plt.ylabel("Note")
-    plt.title("Inferred Note-Playing Positions with Silence Events")
-    plt.legend(loc="upper right")
-    plt.grid(True)
-
-    # Save plot as .jpg in specified path
-    output_path = os.path.join(output_dir, f"{proj}_note_positions_with_silence.jpg")
-    plt.savefig(output_path)
-    plt.close()
+    times = np.array([item[1] for item in inferred_notes], dtype=float)
+    notes = np.array([item[2] if item[2] is not None else 'Rest' for item in inferred_notes], dtype=object)
+    events = np.array([item[3] for item in inferred_notes], dtype=object)
+
+    with span('pitch.plot_notes', frames=len(times)):
+        fig = new_figure(figsize=(14, 5))
+        ax = fig.subplots()
+
+        # Map notes to y-axis positions for plotting (unique notes including 'Rest', sorted)
+        unique_notes, y_values = np.unique(notes.astype(str), return_inverse=True)
+
+        # One scatter per event type instead of one artist per frame
+        markers = [
+            ("change", 'o', 64, 'green', "Change"),
+            ("sustain", 'x', 25, 'red', "Sustain"),
+            ("silence", 's', 64, 'gray', "No Bow Contact"),
+        ]
+        for event, marker, size, color, label in markers:
+            mask = events == event
+            if mask.any():
+                ax.scatter(times[mask], y_values[mask], marker=marker, s=size, color=color, label=label)
+
+        ax.set_yticks(range(len(unique_notes)), labels=unique_notes)
+        ax.set_xlabel("Time (s)")
+        ax.set_ylabel("Note")
+        ax.set_title("Inferred Note-Playing Positions with Silence Events")
+        ax.legend(loc="upper right")
+        ax.grid(True)
+
+        # Save plot as .jpg in specified path
+        output_path = os.path.join(output_dir, f"{proj}_note_positions_with_silence.jpg")
+        save_figure(fig, output_path)
     print(f"Note positions plot saved as: {output_path}")
 
-# Save inferred notes to CSV
-def save_inferred_notes_to_csv(inferred_notes, proj, output_dir):
+# Save inferred notes to CSV (or a binary table with output_format='npz'/'parquet')
+def save_inferred_notes_to_csv(inferred_notes, proj, output_dir, output_format='csv'):
     df_inferred = pd.DataFrame(inferred_notes, columns=["Frame", "Time (s)", "Note", "Event"])
-    output_csv_path = os.path.join(output_dir, f"{proj}_inferred_notes_with_silence.csv")
-    df_inferred.to_csv(output_csv_path, index=False)
+    output_csv_path = table_path(os.path.join(output_dir, f"{proj}_inferred_notes_with_silence"), output_format)
+    save_table(df_inferred, output_csv_path)
     print(f"Inferred notes saved as: {output_csv_path}")
+
+def note_agreement(reference_notes, candidate_notes):
+    """
+    Compares the per-frame notes of two inferred note sequences, e.g. a faster pitch setting against the full run.
+
+    Parameters:
+    - reference_notes (list): (frame, time, note, event) tuples, as from infer_note_positions_with_silence.
+    - candidate_notes (list): The same for the run being checked, on the same frame grid.
+
+    Returns:
+    - dict: 'frames' compared, 'agreement' (fraction of frames with the same note or rest) and
+      'note_agreement' (the same over frames where the reference has a note).
+    """
+    num_frames = min(len(reference_notes), len(candidate_notes))
+    reference = np.array([item[2] for item in reference_notes[:num_frames]], dtype=object)
+    candidate = np.array([item[2] for item in candidate_notes[:num_frames]], dtype=object)
+    same = reference == candidate
+    has_note = reference != None  # noqa: E711 (elementwise comparison)
+    return {
+        'frames': num_frames,
+        'agreement': float(same.mean()) if num_frames else 1.0,
+        'note_agreement': float(same[has_note].mean()) if has_note.any() else 1.0,
+    }
+
+def compare_precision(audio, precision, model='full', num_threads=None, instrument='cello', silence_gate=False):
+    """
+    Times a reduced-precision CREPE run against the fp32 run on the same audio and compares their notes.
+
+    Notes come from hz_to_note_name via infer_note_positions_with_silence and are compared per frame
+    with note_agreement. The fp32 model is loaded again afterwards.
+
+    Parameters:
+    - audio (AudioBuffer): Decoded audio of a representative recording.
+    - precision (str): 'int8' or 'bf16' (see load_torchcrepe_model).
+    - model (str): torchcrepe model capacity.
+    - num_threads (int, optional): Torch intra-op threads for both runs.
+    - instrument (str): 'cello' or 'violin'.
+    - silence_gate (bool): Run both with the silence gate of pitch_detect_crepe.
+
+    Returns:
+    - dict: 'fp32_seconds', 'seconds', 'speedup' and the note_agreement results.
+    """
+    import tempfile
+    import time
+
+    timings, notes = {}, {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for run_precision in ('fp32', precision):
+            load_torchcrepe_model(model, run_precision, num_threads)
+            start = time.perf_counter()
+            pitch_results, silence = pitch_detect_crepe('torch', f"check_{run_precision}", 0, 1, 1, instrument=instrument,
+                                                        output_dir=tmp_dir, audio=audio, plot=False, model=model,
+                                                        silence_gate=silence_gate, return_silence=True)
+            timings[run_precision] = time.perf_counter() - start
+            notes[run_precision] = infer_note_positions_with_silence(pitch_results, None, audio=audio, silence=silence)
+    load_torchcrepe_model(model, 'fp32', num_threads)
+
+    return dict(note_agreement(notes['fp32'], notes[precision]), fp32_seconds=timings['fp32'],
+                seconds=timings[precision], speedup=timings['fp32'] / timings[precision])
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# Figures are rendered by a single background thread so that plotting never delays the table outputs
+_executor = None
+_pending = []
+_lock = threading.Lock()
+
+def new_figure(figsize):
+    """
+    Creates a figure on the headless Agg canvas.
+
+    Figures are built with the object-oriented API rather than pyplot, so they hold no global state
+    and can be rendered off the main thread.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+def save_figure(fig, path, **kwargs):
+    """Saves a figure through a temporary file next to `path`, so readers never see a partial image."""
+    directory, name = os.path.split(path)
+    base, extension = os.path.splitext(name)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{base}.", suffix=extension, dir=directory or '.')
+    os.close(fd)
+    try:
+        fig.savefig(tmp_path, format=extension.lstrip('.') or None, **kwargs)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _run_plot(plot_fn, args, kwargs):
+    try:
+        plot_fn(*args, **kwargs)
+        return True
+    except Exception:
+        print(f"Plot {plot_fn.__name__} failed:\n{traceback.format_exc()}")
+        return False
+
+def submit_plot(plot_fn, *args, background=True, **kwargs):
+    """
+    Runs plot_fn(*args, **kwargs) on the background plotting thread, or inline with background=False.
+
+    Failures are printed and do not propagate, since a missing figure should not fail the stage whose
+    results it shows. Call wait_for_plots() before relying on the figures; pending plots are also
+    finished before the process exits.
+
+    Returns:
+    - concurrent.futures.Future or None: Future resolving to True if the plot was saved (None when inline).
+    """
+    global _executor
+    if not background:
+        _run_plot(plot_fn, args, kwargs)
+        return None
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='plotting')
+        future = _executor.submit(_run_plot, plot_fn, args, kwargs)
+        _pending.append(future)
+    return future
+
+def wait_for_plots():
+    """
+    Blocks until every submitted plot has finished.
+
+    Returns:
+    - int: Number of plots that failed.
+    """
+    with _lock:
+        pending = list(_pending)
+        _pending.clear()
+    return sum(not future.result() for future in pending)
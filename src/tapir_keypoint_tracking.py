@@ -1,22 +1,147 @@
-import functools
-import jax
-import mediapy as media
+import os
+import time
 import numpy as np
-import csv
+import pandas as pd
 import cv2  # Import OpenCV for drawing
-from tapnet.models import tapir_model
-from tapnet.utils import transforms, model_utils
+from src.columnar_io import save_table
+from src.instrumentation import span
+from src.video_frontend import frame_count, iter_frames, probe_video, read_video_resized
 
 MODEL_TYPE = 'tapir'  # 'tapir' or 'bootstapir'
 
+# Videos are padded up to one of these frame counts so a handful of compiled executables cover every video
+FRAME_BUCKETS = (32, 64, 128, 256, 512, 1024)
+LONG_BUCKET_STEP = 256  # Beyond the largest bucket, frame counts are padded to a multiple of this
+QUERY_BUCKET = 8  # Query points are padded up to a multiple of this
+
+# Rough peak memory of one 256x256 frame in a TAPIR call (input, feature pyramid and backbone activations),
+# used to size batches of clips
+BYTES_PER_FRAME = 24 << 20
+MAX_BATCH_SIZE = 16
+
+def available_memory():
+    """
+    Returns the memory available for new allocations, in bytes.
+
+    Reads MemAvailable from /proc/meminfo, which counts reclaimable page cache; the free page count
+    from sysconf (used where /proc is missing) leaves it out and reads far too low on a busy machine.
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+def auto_batch_size(num_frames, memory_fraction=0.5, max_batch_size=MAX_BATCH_SIZE):
+    """
+    Returns how many clips of `num_frames` (padded) frames fit in one TAPIR call.
+
+    Parameters:
+    - num_frames (int): Padded frame count of every clip in the batch.
+    - memory_fraction (float): Share of the currently available memory the batch may use.
+    - max_batch_size (int): Upper limit, beyond which batching no longer improves throughput.
+
+    Returns:
+    - int: Batch size, at least 1, rounded down to a power of two so batch_bucket never pads past the budget.
+    """
+    budget = available_memory() * memory_fraction
+    batch_size = int(max(1, min(max_batch_size, budget // (num_frames * BYTES_PER_FRAME))))
+    return 1 << (batch_size.bit_length() - 1)
+
+def batch_bucket(batch_size):
+    """Returns the padded batch size (a power of two), so partial batches reuse compiled executables."""
+    return 1 << max(batch_size - 1, 0).bit_length()
+
+def group_clips(lengths, batch_size=None):
+    """
+    Splits clips into batches of one frame bucket each, shortest clips first.
+
+    Parameters:
+    - lengths (list): Frame count of every clip.
+    - batch_size (int, optional): Clips per batch (default: chosen from the available memory per bucket).
+
+    Returns:
+    - list: Lists of clip indices, one per batch.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    groups = []
+    start = 0
+    while start < len(order):
+        # Clips are sorted by length, so the group's first clip has the smallest bucket; clips that need a
+        # bigger bucket start the next group, and the bucket sets how many clips fit
+        group_bucket = bucket_size(lengths[order[start]])
+        group_size = batch_size or auto_batch_size(group_bucket)
+        group = []
+        for i in order[start:start + group_size]:
+            if bucket_size(lengths[i]) != group_bucket:
+                break
+            group.append(i)
+        groups.append(group)
+        start += len(group)
+    return groups
+
+def enable_compilation_cache(cache_dir):
+    """Enables JAX's on-disk compilation cache so a fresh process can skip compiling."""
+    import jax
+    os.makedirs(cache_dir, exist_ok=True)
+    jax.config.update('jax_compilation_cache_dir', cache_dir)
+    jax.config.update('jax_persistent_cache_min_compile_time_secs', 0)
+
+def bucket_size(num_frames):
+    """Returns the padded frame count for a video; beyond the largest bucket, a multiple of LONG_BUCKET_STEP."""
+    for bucket in FRAME_BUCKETS:
+        if num_frames <= bucket:
+            return bucket
+    return -(-num_frames // LONG_BUCKET_STEP) * LONG_BUCKET_STEP
+
+def visible_keypoints_table(tracks, visibles, first_frame=0, keypoint_indices=None):
+    """
+    Builds the Frame/Keypoint Index/X/Y table of visible points in one go from masked arrays.
+
+    Parameters:
+    - tracks (np.ndarray): Positions of shape (num_frames, num_keypoints, 2) as (x, y).
+    - visibles (np.ndarray): Visibility of shape (num_frames, num_keypoints).
+    - first_frame (int): Frame number of the first row of the arrays.
+    - keypoint_indices (np.ndarray, optional): Keypoint index of each column (default: 0..num_keypoints-1).
+
+    Returns:
+    - pd.DataFrame: One row per visible point, ordered by frame then keypoint.
+    """
+    frame_idx, kp_idx = np.nonzero(visibles)
+    return pd.DataFrame({
+        'Frame': frame_idx + first_frame,
+        'Keypoint Index': kp_idx if keypoint_indices is None else np.asarray(keypoint_indices)[kp_idx],
+        'X': tracks[frame_idx, kp_idx, 0],
+        'Y': tracks[frame_idx, kp_idx, 1]
+    })
+
 class TapirKeypointTracking:
-    def __init__(self, checkpoint_path):
+    # checkpoint_path is either the original pickled .npy checkpoint or a directory converted into the
+    # model store (src.model_store), whose arrays are memory-mapped instead of unpickled
+    def __init__(self, checkpoint_path, compilation_cache_dir=None, model_type=MODEL_TYPE):
+        # Compiled inference executables, keyed by padded input shape
+        self._compiled = {}
+        self._compilation_cache_dir = compilation_cache_dir
+        if compilation_cache_dir:
+            enable_compilation_cache(compilation_cache_dir)
+
+        # JAX and tapnet are imported here, not at module level, so that importing this module stays cheap
+        from tapnet.models import tapir_model
+
         # Load the TAPIR model
-        ckpt_state = np.load(checkpoint_path, allow_pickle=True).item()
-        params, state = ckpt_state['params'], ckpt_state['state']
+        with span('tapir.load_checkpoint'):
+            if os.path.isdir(checkpoint_path):
+                from src.model_store import load_tapir_params
+                params, state = load_tapir_params(checkpoint_path)
+            else:
+                ckpt_state = np.load(checkpoint_path, allow_pickle=True).item()
+                params, state = ckpt_state['params'], ckpt_state['state']
 
         kwargs = dict(bilinear_interp_with_depthwise_conv=False, pyramid_level=0)
-        if MODEL_TYPE == 'bootstapir':
+        if model_type == 'bootstapir':
             kwargs.update(dict(
                 pyramid_level=1,
                 extra_convs=True,
@@ -27,30 +152,175 @@ class TapirKeypointTracking:
 
     def inference(self, frames, query_points):
         """Inference on one video."""
+        tracks, visibles = self.inference_batch(frames[None], query_points[None])  # Add batch dimension
+        return tracks[0], visibles[0]
+
+    def inference_batch(self, frames, query_points):
+        """Inference on a batch of videos of equal shape, each with the same number of query points."""
+        from tapnet.utils import model_utils
         frames = model_utils.preprocess_frames(frames)
         query_points = query_points.astype(np.float32)
-        frames, query_points = frames[None], query_points[None]  # Add batch dimension
         outputs = self.tapir(video=frames, query_points=query_points, is_training=False, query_chunk_size=32)
         tracks, occlusions, expected_dist = outputs['tracks'], outputs['occlusion'], outputs['expected_dist']
         visibles = model_utils.postprocess_occlusions(occlusions, expected_dist)
-        return tracks[0], visibles[0]
+        return tracks, visibles
 
-    def track_keypoints(self, video_path, keypoints, output_video_path, keypoints_file_path):
-        # Load the video
-        video = media.read_video(video_path)
+    def run_inference(self, frames, query_points):
+        """
+        Runs inference with the video and queries padded to bucket sizes, reusing compiled executables.
 
-        # Get original video dimensions
-        orig_height, orig_width = video.shape[1:3]
-        print(f"Original video dimensions: {orig_height}x{orig_width}")
+        Padding repeats the last frame and the first query; the padded frames and queries are sliced
+        off the outputs, so results keep the original shapes.
+
+        Parameters:
+        - frames (np.ndarray): Video frames of shape (num_frames, 256, 256, 3).
+        - query_points (np.ndarray): Query points as (frame, y, x).
+
+        Returns:
+        - tracks (np.ndarray): Tracks of shape (num_queries, num_frames, 2).
+        - visibles (np.ndarray): Visibility of shape (num_queries, num_frames).
+        - stats (dict): Padded frame count, compile time in seconds and cache status.
+        """
+        num_frames, num_queries = frames.shape[0], query_points.shape[0]
+        query_points = np.asarray(query_points, dtype=np.float32)
+
+        # TAPIR has no input mask, so the padding is made as neutral as possible instead: repeated last
+        # frames look like a still tail of the video, and repeated queries are tracked independently of the
+        # real ones. The outputs of padded frames and queries are dropped below.
+        frame_pad = bucket_size(num_frames) - num_frames
+        query_pad = -num_queries % QUERY_BUCKET
+        padded_frames = np.concatenate([frames, np.repeat(frames[-1:], frame_pad, axis=0)])
+        padded_queries = np.concatenate([query_points, np.repeat(query_points[:1], query_pad, axis=0)])
+
+        compiled, compile_time, cache_status = self._compiled_for(self.inference, padded_frames, padded_queries)
+        with span('tapir.inference', frames=num_frames, keypoints=num_queries):
+            tracks, visibles = compiled(padded_frames, padded_queries)
+            # Drop the outputs of the padded queries and frames
+            tracks = np.array(tracks)[:num_queries, :num_frames]
+            visibles = np.array(visibles)[:num_queries, :num_frames]
+        stats = {'bucket': padded_frames.shape[0], 'compile_time': compile_time, 'cache': cache_status}
+        return tracks, visibles, stats
+
+    def _compiled_for(self, fn, frames, query_points):
+        """Returns the compiled executable of fn for these input shapes, with its compile time and cache status."""
+        import jax
+        key = (fn.__name__, frames.shape, frames.dtype.str, query_points.shape)
+        if key in self._compiled:
+            return self._compiled[key], 0.0, 'memory hit'
+
+        entries_before = self._count_disk_cache_entries()
+        start = time.perf_counter()
+        with span('tapir.compile', frames=frames.shape[-4]):
+            self._compiled[key] = jax.jit(fn).lower(frames, query_points).compile()
+        compile_time = time.perf_counter() - start
+        # The disk cache only grows when XLA actually compiled something new
+        if self._compilation_cache_dir and self._count_disk_cache_entries() == entries_before:
+            cache_status = 'disk hit'
+        else:
+            cache_status = 'miss'
+        return self._compiled[key], compile_time, cache_status
+
+    def track_batch(self, clips, batch_size=None):
+        """
+        Tracks many short clips with batched TAPIR calls instead of one call per clip.
+
+        Clips are sorted by length and grouped, so each group is padded to a common frame bucket with
+        little waste. Within a group, every clip is padded to the same frame and query counts (repeating
+        its last frame and first query), and the batch itself is padded to a power of two by repeating
+        the first clip, so a few compiled executables cover every group. Outputs are sliced back to
+        each clip's own shapes.
+
+        Parameters:
+        - clips (list): (frames, query_points) pairs; frames of shape (num_frames, 256, 256, 3) and
+          query points as (frame, y, x).
+        - batch_size (int, optional): Clips per call (default: chosen from the available memory).
+
+        Returns:
+        - list: (tracks, visibles) per clip, in input order, shaped as from run_inference.
+        - list: Stats of every batched call (clips, padded frame count, batch size, compile time, cache status).
+        """
+        clips = [(frames, np.asarray(query_points, dtype=np.float32)) for frames, query_points in clips]
+        results = [None] * len(clips)
+        all_stats = []
 
-        # Downsample the video to reduce computational load
-        downsampled_video = media.resize_video(video, (256, 256))
+        for group in group_clips([len(frames) for frames, _ in clips], batch_size):
+            group_bucket = bucket_size(len(clips[group[0]][0]))
+            num_queries = max(len(clips[i][1]) for i in group)
+            query_bucket = -(-num_queries // QUERY_BUCKET) * QUERY_BUCKET
+            padded_frames, padded_queries = [], []
+            for i in group:
+                frames, query_points = clips[i]
+                padded_frames.append(np.concatenate([frames, np.repeat(frames[-1:], group_bucket - len(frames), axis=0)]))
+                padded_queries.append(np.concatenate([query_points, np.repeat(query_points[:1], query_bucket - len(query_points), axis=0)]))
+            batch_pad = batch_bucket(len(group)) - len(group)
+            padded_frames = np.stack(padded_frames + padded_frames[:1] * batch_pad)
+            padded_queries = np.stack(padded_queries + padded_queries[:1] * batch_pad)
+
+            compiled, compile_time, cache_status = self._compiled_for(self.inference_batch, padded_frames, padded_queries)
+            with span('tapir.inference', frames=sum(len(clips[i][0]) for i in group), clips=len(group)):
+                tracks, visibles = compiled(padded_frames, padded_queries)
+                tracks, visibles = np.array(tracks), np.array(visibles)
+            # Keep each clip's own queries and frames; outputs for padding (and for the repeated clips padding
+            # the batch) are dropped, as in run_inference
+            for b, i in enumerate(group):
+                num_frames, num_clip_queries = len(clips[i][0]), len(clips[i][1])
+                results[i] = (tracks[b, :num_clip_queries, :num_frames], visibles[b, :num_clip_queries, :num_frames])
+            all_stats.append({'clips': len(group), 'bucket': group_bucket, 'batch': padded_frames.shape[0],
+                              'compile_time': compile_time, 'cache': cache_status})
+        return results, all_stats
+
+    def _count_disk_cache_entries(self):
+        if not self._compilation_cache_dir or not os.path.isdir(self._compilation_cache_dir):
+            return 0
+        return len(os.listdir(self._compilation_cache_dir))
+
+    def track_keypoints(self, video_path, keypoints, output_video_path, keypoints_file_path):
+        # Decode the video straight at the 256x256 inference resolution to reduce computational load
+        downsampled_video = self._decode_downsampled(video_path)
 
         # Perform inference
-        inference = jax.jit(self.inference)
-        tracks, visibles = inference(downsampled_video, keypoints)
-        tracks = np.array(tracks)
-        visibles = np.array(visibles)
+        tracks, visibles, stats = self.run_inference(downsampled_video, keypoints)
+        print(f"Inference compile: {stats['cache']}, {stats['compile_time']:.2f}s (bucket of {stats['bucket']} frames)")
+
+        self._write_outputs(video_path, tracks, visibles, len(downsampled_video), output_video_path, keypoints_file_path)
+
+    def track_keypoints_batch(self, jobs, batch_size=None):
+        """
+        Tracks keypoints in many short videos with batched TAPIR calls (see track_batch).
+
+        Parameters:
+        - jobs (list): (video_path, keypoints, output_video_path, keypoints_file_path) per video, as for track_keypoints.
+        - batch_size (int, optional): Videos per TAPIR call (default: chosen from the available memory).
+        """
+        # Group by the frame counts in the headers, then decode each group only when it runs, so at most
+        # one batch of videos is held in memory. track_batch regroups by the decoded lengths, in case a
+        # header count was off.
+        for group in group_clips([frame_count(video_path) for video_path, _, _, _ in jobs], batch_size):
+            group_jobs = [jobs[i] for i in group]
+            downsampled_videos = [self._decode_downsampled(video_path) for video_path, _, _, _ in group_jobs]
+            results, all_stats = self.track_batch([(video, keypoints) for video, (_, keypoints, _, _) in zip(downsampled_videos, group_jobs)],
+                                                  batch_size=batch_size)
+            for stats in all_stats:
+                print(f"Batched inference: {stats['clips']} clips, batch of {stats['batch']} x {stats['bucket']} frames, "
+                      f"compile: {stats['cache']}, {stats['compile_time']:.2f}s")
+
+            for (video_path, _, output_video_path, keypoints_file_path), video, (tracks, visibles) in zip(group_jobs, downsampled_videos, results):
+                self._write_outputs(video_path, tracks, visibles, len(video), output_video_path, keypoints_file_path)
+
+    def _decode_downsampled(self, video_path):
+        with span('tapir.decode') as decode_span:
+            downsampled_video = read_video_resized(video_path, (256, 256))
+            decode_span.count(frames=len(downsampled_video))
+        return downsampled_video
+
+    def _write_outputs(self, video_path, tracks, visibles, num_frames, output_video_path, keypoints_file_path):
+        """Draws the tracks on the full-resolution video (unless output_video_path is None) and saves the visible keypoints table."""
+        import mediapy as media
+        from tapnet.utils import transforms
+
+        # Get original video dimensions
+        orig_height, orig_width, _ = probe_video(video_path)
+        print(f"Original video dimensions: {orig_height}x{orig_width}")
 
         # Swap the first two axes (from (10, 302, 2) to (302, 10, 2))
         tracks = np.swapaxes(tracks, 0, 1)
@@ -59,31 +329,172 @@ class TapirKeypointTracking:
         # Convert tracked points back to the original video dimensions
         tracks_orig_dims = transforms.convert_grid_coordinates(tracks, (256, 256), (orig_width, orig_height))
 
-        # Prepare to draw the keypoints on the video frames
-        output_frames = video.copy()  # Make a copy of the video frames for modification
+        # Decode the full-resolution frames a second time, one at a time, drawing the keypoints in place
+        # as each frame streams into the writer, so the full video is never held in memory.
+        # Without an output video path the overlay is left to src.compositor
+        if output_video_path:
+            with media.VideoWriter(output_video_path, shape=(orig_height, orig_width), fps=10) as video_writer:
+                for frame_idx, frame in enumerate(iter_frames(video_path)):
+                    if frame_idx >= num_frames:
+                        break
+                    with span('tapir.draw', frames=1):
+                        for x, y in tracks_orig_dims[frame_idx][visibles[frame_idx]]:
+                            # Draw a small circle on the keypoint (OpenCV)
+                            cv2.circle(frame, (int(x), int(y)), radius=5, color=(0, 255, 0), thickness=-1)
+                    with span('tapir.encode', frames=1):
+                        video_writer.add_image(frame)
+            print(f"Output video saved as: {output_video_path}")
 
-        # Draw the keypoints on the frames using OpenCV
-        for frame_idx in range(tracks_orig_dims.shape[0]):
-            for kp_idx in range(tracks_orig_dims.shape[1]):
-                if visibles[frame_idx, kp_idx]:
-                    x, y = tracks_orig_dims[frame_idx, kp_idx]
-                    # Draw a small circle on the keypoint (OpenCV)
-                    output_frames[frame_idx] = cv2.circle(output_frames[frame_idx], (int(x), int(y)), radius=5, color=(0, 255, 0), thickness=-1)
+        # Save visible keypoints in bulk from the visibility-masked arrays (CSV, or a binary table for .npz/.parquet paths)
+        with span('tapir.write_keypoints') as write_span:
+            keypoints_table = visible_keypoints_table(tracks_orig_dims, visibles)
+            save_table(keypoints_table, keypoints_file_path)
+            write_span.count(keypoints=len(keypoints_table))
 
-        # Save the modified video with keypoints plotted
-        media.write_video(output_video_path, output_frames, fps=10)
-        print(f"Output video saved as: {output_video_path}")
+        print(f"Visible keypoints saved to: {keypoints_file_path}")
+
+    def track_keypoints_chunked(self, video_path, keypoints, output_video_path, keypoints_file_path, chunk_size=64, overlap=8):
+        """
+        Tracks keypoints through a long video in overlapping chunks so memory stays bounded.
+
+        Frames are decoded in windows of `chunk_size`. Each chunk after the first starts `overlap`
+        frames before the end of the previous one and is queried with the positions tracked in that
+        shared region, so only one chunk of frames is held in memory regardless of video length.
+        Overlay frames and CSV rows are written as each chunk finishes; for .npz/.parquet keypoint
+        paths the (small) keypoint table is saved once at the end.
 
-        # Save visible keypoints to a CSV file
-        with open(keypoints_file_path, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['Frame', 'Keypoint Index', 'X', 'Y'])
+        Unlike track_keypoints, which tracks every point both forwards and backwards from its query
+        frame, a point here only starts in the chunk containing its query frame, so frames from
+        earlier chunks have no rows for it. Use query frames near the start of the video (frame 0
+        for points chosen on the first frame, as the scripts do) to get complete tracks.
 
-            num_frames, num_keypoints = tracks_orig_dims.shape[0], tracks_orig_dims.shape[1]
-            for frame_idx in range(num_frames):
-                for kp_idx in range(num_keypoints):
-                    if visibles[frame_idx, kp_idx]:
-                        x, y = tracks_orig_dims[frame_idx, kp_idx]
-                        writer.writerow([frame_idx, kp_idx, x, y])
+        Parameters:
+        - video_path (str): Path to the input video.
+        - keypoints (np.ndarray): Query points as (frame, y, x) in 256x256 coordinates.
+        - output_video_path (str): Path to save the video with keypoints drawn.
+        - keypoints_file_path (str): Path to save the visible keypoints CSV.
+        - chunk_size (int): Number of frames decoded and tracked at once.
+        - overlap (int): Number of frames shared between consecutive chunks.
 
+        Returns:
+        - None
+        """
+        if not 0 < overlap < chunk_size:
+            raise ValueError(f"overlap must be between 1 and {chunk_size - 1}, got {overlap}")
+        import mediapy as media
+
+        keypoints = np.asarray(keypoints, dtype=np.float32)
+        query_frames = keypoints[:, 0].astype(int)
+        queries = keypoints.copy()  # Current query per point as (global frame, y, x)
+        started = np.zeros(len(keypoints), dtype=bool)
+        compile_stats = []
+
+        # CSV rows are appended chunk by chunk; other formats are saved once at the end
+        is_csv = keypoints_file_path.lower().endswith('.csv')
+        tables = []
+        def save_rows(table):
+            if is_csv:
+                table.to_csv(keypoints_file_path, mode='a', header=False, index=False)
+            else:
+                tables.append(table)
+        if is_csv:
+            pd.DataFrame(columns=['Frame', 'Keypoint Index', 'X', 'Y']).to_csv(keypoints_file_path, index=False)
+
+        with media.VideoReader(video_path) as reader, \
+                media.VideoWriter(output_video_path, shape=reader.shape, fps=10) as video_writer:
+            orig_height, orig_width = reader.shape
+            print(f"Original video dimensions: {orig_height}x{orig_width}")
+
+            chunk, chunk_start, emitted = [], 0, 0
+            frames = iter(reader)
+            while True:
+                # Decoding is timed separately from the tracking done per chunk
+                with span('tapir.decode', frames=1):
+                    frame = next(frames, None)
+                if frame is None:
+                    break
+                chunk.append(frame)
+                if len(chunk) == chunk_size:
+                    emitted = self._track_chunk(compile_stats, chunk, chunk_start, emitted, keypoints, query_frames,
+                                                queries, started, overlap, video_writer, save_rows)
+                    chunk_start += chunk_size - overlap
+                    chunk = chunk[-overlap:]
+
+            # Track whatever is left after the last full chunk
+            if chunk_start + len(chunk) > emitted:
+                self._track_chunk(compile_stats, chunk, chunk_start, emitted, keypoints, query_frames,
+                                  queries, started, overlap, video_writer, save_rows)
+
+        if not is_csv:
+            # A video without frames leaves no tables; still save an empty table with the usual columns
+            if not tables:
+                tables.append(visible_keypoints_table(np.zeros((0, len(keypoints), 2), dtype=np.float32),
+                                                      np.zeros((0, len(keypoints)), dtype=bool)))
+            save_table(pd.concat(tables, ignore_index=True), keypoints_file_path)
+
+        misses = sum(stats['cache'] != 'memory hit' for stats in compile_stats)
+        compile_time = sum(stats['compile_time'] for stats in compile_stats)
+        print(f"Inference compile: {misses} of {len(compile_stats)} chunks compiled or loaded, {compile_time:.2f}s total")
+        print(f"Output video saved as: {output_video_path}")
         print(f"Visible keypoints saved to: {keypoints_file_path}")
+
+    def _track_chunk(self, compile_stats, chunk, chunk_start, emitted, keypoints, query_frames, queries, started, overlap, video_writer, save_rows):
+        """
+        Tracks one chunk, writes its new frames and rows, and carries the queries forward.
+
+        Points whose query frame lies beyond this chunk are not tracked yet, and tracking only runs
+        forward from earlier chunks, so a point never gets rows for chunks before its query frame.
+        """
+        import mediapy as media
+        from tapnet.utils import transforms
+        video = np.stack(chunk)  # Writable copy of the chunk for drawing
+        num_frames = video.shape[0]
+        orig_height, orig_width = video.shape[1:3]
+
+        # Points whose query frame has been reached start from their original query
+        newly_started = ~started & (query_frames < chunk_start + num_frames)
+        queries[newly_started] = keypoints[newly_started]
+        started |= newly_started
+        active = np.nonzero(started)[0]
+
+        if len(active):
+            local_queries = queries[active].copy()
+            local_queries[:, 0] -= chunk_start
+
+            with span('tapir.resize', frames=num_frames):
+                downsampled_video = media.resize_video(video, (256, 256))
+            tracks, visibles, stats = self.run_inference(downsampled_video, local_queries)
+            compile_stats.append(stats)
+            tracks_orig_dims = transforms.convert_grid_coordinates(tracks, (256, 256), (orig_width, orig_height))
+        else:
+            tracks = tracks_orig_dims = np.zeros((0, num_frames, 2), dtype=np.float32)
+            visibles = np.zeros((0, num_frames), dtype=bool)
+
+        # Draw and save only the frames that the previous chunk has not already written
+        first_new = emitted - chunk_start
+        with span('tapir.draw', frames=num_frames - first_new):
+            for frame_idx in range(first_new, num_frames):
+                for i in range(len(active)):
+                    if visibles[i, frame_idx]:
+                        x, y = tracks_orig_dims[i, frame_idx]
+                        video[frame_idx] = cv2.circle(video[frame_idx], (int(x), int(y)), radius=5, color=(0, 255, 0), thickness=-1)
+        with span('tapir.encode', frames=num_frames - first_new):
+            for frame_idx in range(first_new, num_frames):
+                video_writer.add_image(video[frame_idx])
+        with span('tapir.write_keypoints') as write_span:
+            rows = visible_keypoints_table(np.swapaxes(tracks_orig_dims, 0, 1)[first_new:],
+                                           np.swapaxes(visibles, 0, 1)[first_new:],
+                                           first_frame=emitted, keypoint_indices=active)
+            save_rows(rows)
+            write_span.count(keypoints=len(rows))
+
+        # Carry each point forward from its last visible position inside the overlap region,
+        # which the next chunk shares; fall back to the predicted position on the last frame
+        overlap_start = max(num_frames - overlap, 0)
+        for i, kp_idx in enumerate(active):
+            overlap_visible = np.nonzero(visibles[i, overlap_start:])[0]
+            frame_idx = overlap_start + overlap_visible[-1] if len(overlap_visible) else num_frames - 1
+            x, y = tracks[i, frame_idx]
+            queries[kp_idx] = (chunk_start + frame_idx, y, x)
+
+        return chunk_start + num_frames
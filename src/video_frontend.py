@@ -0,0 +1,109 @@
+import shutil
+import subprocess
+import cv2
+import numpy as np
+
+def has_ffmpeg():
+    return shutil.which('ffmpeg') is not None
+
+def probe_video(video_path):
+    """
+    Returns the frame size and rate of a video.
+
+    Returns:
+    - height (int), width (int): Frame size in pixels.
+    - fps (float): Frame rate.
+    """
+    capture = cv2.VideoCapture(video_path)
+    try:
+        if not capture.isOpened():
+            raise RuntimeError(f"Could not open video {video_path}")
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = capture.get(cv2.CAP_PROP_FPS)
+    finally:
+        capture.release()
+    return height, width, fps
+
+def frame_count(video_path):
+    """Returns the frame count from the video header (may be approximate for some containers)."""
+    capture = cv2.VideoCapture(video_path)
+    try:
+        if not capture.isOpened():
+            raise RuntimeError(f"Could not open video {video_path}")
+        return int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        capture.release()
+
+def _ffmpeg_command(video_path, size):
+    command = ['ffmpeg', '-v', 'error', '-i', video_path]
+    if size is not None:
+        # Lanczos, like mediapy.resize_video, applied by the decoder before frames leave ffmpeg
+        command += ['-vf', f'scale={size[1]}:{size[0]}:flags=lanczos']
+    return command + ['-f', 'rawvideo', '-pix_fmt', 'rgb24', '-']
+
+def read_video_resized(video_path, size):
+    """
+    Decodes a whole video straight to a smaller size, e.g. TAPIR's 256x256 inference resolution.
+
+    ffmpeg scales each frame while decoding and pipes raw RGB, so the full-resolution video is never
+    held in memory. Without ffmpeg, OpenCV decodes and resizes frame by frame (INTER_AREA).
+
+    Parameters:
+    - video_path (str): Path to the video.
+    - size (tuple): Output (height, width).
+
+    Returns:
+    - np.ndarray: uint8 RGB frames of shape (num_frames, height, width, 3).
+    """
+    height, width = size
+    if has_ffmpeg():
+        result = subprocess.run(_ffmpeg_command(video_path, size), capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Failed to decode {video_path}: {result.stderr.decode(errors='replace').strip()}")
+        return np.frombuffer(result.stdout, dtype=np.uint8).reshape(-1, height, width, 3)
+
+    frames = []
+    for frame in iter_frames(video_path):
+        frames.append(cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA))
+    return np.stack(frames) if frames else np.zeros((0, height, width, 3), dtype=np.uint8)
+
+def iter_frames(video_path):
+    """
+    Yields the full-resolution RGB frames of a video one at a time.
+
+    Every frame is yielded in the same writable buffer, so callers can draw on it in place and must
+    copy it if they keep it past the next iteration.
+
+    Parameters:
+    - video_path (str): Path to the video.
+    """
+    height, width, _ = probe_video(video_path)
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+
+    if has_ffmpeg():
+        process = subprocess.Popen(_ffmpeg_command(video_path, None), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        finished = False
+        try:
+            while process.stdout.readinto(memoryview(frame).cast('B')) == frame.nbytes:
+                yield frame
+            finished = True
+        finally:
+            if not finished:
+                process.kill()  # The caller stopped early
+            process.stdout.close()
+            stderr = process.stderr.read().decode(errors='replace').strip()
+            process.stderr.close()
+            returncode = process.wait()
+        if returncode != 0:
+            raise RuntimeError(f"Failed to decode {video_path}: {stderr}")
+        return
+
+    capture = cv2.VideoCapture(video_path)
+    bgr = np.empty_like(frame)
+    try:
+        while capture.read(bgr)[0]:
+            cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=frame)
+            yield frame
+    finally:
+        capture.release()
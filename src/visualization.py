@@ -1,20 +1,294 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import cv2
+import numpy as np
 import pandas as pd
+from src.columnar_io import load_table
+from src.instrumentation import span
 
-def annotate_video(base_video_path, movement_csv_path, output_video_path):
+# Per-frame annotation codes; 0 means the frame has no annotation
+ANNOTATION_CODES = {"Up": 1, "Down": 2, "silence": 3}
+
+def annotation_code_array(movement_df, total_frames):
+    """
+    Builds a dense array mapping each frame index to its annotation code.
+
+    As with a per-frame lookup, only the first row for a frame is used and frames outside
+    [0, total_frames) are ignored.
+
+    Parameters:
+    - movement_df (pd.DataFrame): Annotations with Frame and Annotation columns.
+    - total_frames (int): Number of frames in the video.
+
+    Returns:
+    - np.ndarray: int8 array of length total_frames.
+    """
+    codes = np.zeros(total_frames, dtype=np.int8)
+    first_rows = movement_df.drop_duplicates('Frame', keep='first')
+    frames = first_rows['Frame'].values
+    labels = first_rows['Annotation'].astype(object).map(ANNOTATION_CODES).fillna(0).values.astype(np.int8)
+
+    valid = (frames == np.floor(frames)) & (frames >= 0) & (frames < total_frames)
+    codes[frames[valid].astype(int)] = labels[valid]
+    return codes
+
+def draw_annotation(frame, code, arrow_start, arrow_length):
+    """Draws the direction arrow or silence marker for one annotation code onto the frame in place."""
+    if code == ANNOTATION_CODES["Up"]:
+        color = (0, 255, 0)  # Green for upward movement
+        arrow_end = (arrow_start[0], arrow_start[1] - arrow_length)
+        # Draw the arrow for upward movement
+        cv2.arrowedLine(frame, arrow_start, arrow_end, color, thickness=3, tipLength=0.4)
+    elif code == ANNOTATION_CODES["Down"]:
+        color = (0, 0, 255)  # Red for downward movement
+        arrow_end = (arrow_start[0], arrow_start[1] + arrow_length)
+        # Draw the arrow for downward movement
+        cv2.arrowedLine(frame, arrow_start, arrow_end, color, thickness=3, tipLength=0.4)
+    elif code == ANNOTATION_CODES["silence"]:
+        color = (255, 255, 0)  # Yellow for silence
+        # Draw a line for silence
+        cv2.line(
+            frame,
+            (arrow_start[0], arrow_start[1] - 150),  # Start of the line
+            (arrow_start[0], arrow_start[1] + 150),  # End of the line
+            color,
+            thickness=3
+        )
+    return frame
+
+def run_frame_pipeline(capture, writer, num_frames, draw, num_workers=None, queue_size=32, stage='visualization'):
+    """
+    Decodes, draws and encodes frames as a bounded producer/consumer pipeline.
+
+    A decoder thread reads frames and submits them to a pool of drawing threads (OpenCV releases
+    the GIL while drawing); the calling thread encodes the drawn frames in their original order.
+    At most `queue_size` frames are in flight at any time.
+
+    Parameters:
+    - capture (cv2.VideoCapture): Opened input video.
+    - writer (cv2.VideoWriter): Opened output video.
+    - num_frames (int): Maximum number of frames to process.
+    - draw (callable): draw(frame_idx, frame) -> frame, called on the drawing threads.
+    - num_workers (int, optional): Number of drawing threads (default: number of CPUs).
+    - queue_size (int): Maximum number of frames waiting between stages.
+    - stage (str): Prefix of the decode/draw/encode instrumentation spans.
+
+    Returns:
+    - int: Number of frames written.
+    """
+    pending = queue.Queue(maxsize=queue_size)
+    errors = []
+    stop = threading.Event()  # Set once the encoder stops taking frames, normally or on an error
+    decode_span, draw_span, encode_span = f'{stage}.decode', f'{stage}.draw', f'{stage}.encode'
+
+    def timed_draw(frame_idx, frame):
+        with span(draw_span, frames=1):
+            return draw(frame_idx, frame)
+
+    def put(item):
+        """Waits for room in the queue, giving up once the encoder has stopped."""
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    with ThreadPoolExecutor(max_workers=num_workers or os.cpu_count()) as executor:
+        def decode():
+            try:
+                frame_idx = 0
+                while frame_idx < num_frames and not stop.is_set():
+                    with span(decode_span, frames=1):
+                        ret, frame = capture.read()
+                    if not ret:
+                        break
+                    if not put(executor.submit(timed_draw, frame_idx, frame)):
+                        break
+                    frame_idx += 1
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                put(None)
+
+        decoder = threading.Thread(target=decode, name='decoder', daemon=True)
+        decoder.start()
+
+        # The decoder is stopped and joined before the executor shuts down, so it never submits to a closed pool
+        frames_written = 0
+        try:
+            while True:
+                future = pending.get()
+                if future is None:
+                    break
+                frame = future.result()
+                with span(encode_span, frames=1):
+                    writer.write(frame)
+                frames_written += 1
+        finally:
+            stop.set()
+            decoder.join()
+
+    if errors:
+        raise errors[0]
+    return frames_written
+
+def frame_ranges(ranges, fps, num_frames, unit='frames'):
+    """
+    Converts clip ranges to half-open [start, end) frame ranges clipped to the video.
+
+    Parameters:
+    - ranges (list): (start, end) pairs, or a single pair.
+    - fps (float): Frame rate of the video.
+    - num_frames (int): Number of frames in the video.
+    - unit (str): 'frames' or 'seconds'.
+
+    Returns:
+    - list: (start_frame, end_frame) pairs, in the input order.
+    """
+    if len(ranges) == 2 and np.isscalar(ranges[0]):
+        ranges = [ranges]
+    scale = fps if unit == 'seconds' else 1
+    clipped = []
+    for start, end in ranges:
+        start = min(max(int(round(start * scale)), 0), num_frames)
+        end = min(max(int(round(end * scale)), start), num_frames)
+        clipped.append((start, end))
+    return clipped
+
+def bow_change_ranges(movement_df, fps, seconds=10, max_clips=None):
+    """
+    Returns frame ranges of `seconds` centered on each change of bow direction (Up to Down or back).
+
+    Overlapping ranges are merged, so a passage of quick bow changes becomes one clip.
+    """
+    rows = movement_df[movement_df['Annotation'].isin(['Up', 'Down'])].drop_duplicates('Frame')
+    labels, frames = rows['Annotation'].values, rows['Frame'].values.astype(int)
+    changes = frames[1:][labels[1:] != labels[:-1]]
+    half = int(seconds * fps / 2)
+    ranges = []
+    for frame in changes:
+        start, end = max(int(frame) - half, 0), int(frame) + half
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges[:max_clips] if max_clips else ranges
+
+def render_ranges(capture, writers, ranges, draw, max_skip=None, num_workers=None, stage='visualization'):
+    """
+    Renders several frame ranges of one video in a single decoder session.
+
+    Ranges are visited in order of their start frame. Short gaps are skipped with grab(), which
+    decodes without converting frames; longer gaps (and backward jumps) seek with CAP_PROP_POS_FRAMES,
+    which starts decoding at the nearest keyframe, so frames outside the ranges are not drawn or encoded.
+
+    Parameters:
+    - capture (cv2.VideoCapture): Opened input video.
+    - writers (list): One opened cv2.VideoWriter per range.
+    - ranges (list): (start_frame, end_frame) pairs, half-open.
+    - draw (callable): draw(frame_idx, frame) -> frame, with frame_idx in the numbering of the whole video.
+    - max_skip (int, optional): Largest gap skipped by decoding through it (default: one second of frames).
+    - num_workers (int, optional): Number of drawing threads (default: number of CPUs).
+    - stage (str): Prefix of the instrumentation spans.
+
+    Returns:
+    - list: Number of frames written for each range.
+    """
+    if max_skip is None:
+        max_skip = int(capture.get(cv2.CAP_PROP_FPS) or 30)
+    frames_written = [0] * len(ranges)
+    position = 0
+    for i in sorted(range(len(ranges)), key=lambda i: ranges[i][0]):
+        start, end = ranges[i]
+        if start < position or start - position > max_skip:
+            with span(f'{stage}.seek', frames=1):
+                capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+        else:
+            with span(f'{stage}.skip', frames=start - position):
+                for _ in range(start - position):
+                    capture.grab()
+
+        def draw_in_range(frame_idx, frame, start=start):
+            return draw(start + frame_idx, frame)
+        frames_written[i] = run_frame_pipeline(capture, writers[i], end - start, draw_in_range,
+                                               num_workers=num_workers, stage=stage)
+        position = start + frames_written[i]
+    return frames_written
+
+def _annotation_drawer(movement_df, total_frames, frame_width, frame_height):
+    # Arrow position on the mid-right part of the frame
+    arrow_start = (frame_width - 150, frame_height // 2)
+    arrow_length = 300
+
+    # Look up every frame's annotation once instead of filtering the DataFrame per frame
+    codes = annotation_code_array(movement_df, total_frames)
+
+    def draw(frame_idx, frame):
+        return draw_annotation(frame, codes[frame_idx], arrow_start, arrow_length)
+    return draw
+
+def annotate_clips(base_video_path, movement_csv_path, ranges, output_video_paths, unit='frames', num_workers=None):
+    """
+    Renders annotated clips of a video, decoding only the requested ranges in one decoder session.
+
+    Parameters:
+    - base_video_path (str): Path to the input video.
+    - movement_csv_path (str): Path to the CSV (or .npz/.parquet) file containing movement annotations.
+    - ranges (list): (start, end) pairs in `unit`, one per clip; end is exclusive.
+    - output_video_paths (list): Path of each clip.
+    - unit (str): 'frames' or 'seconds'.
+    - num_workers (int, optional): Number of drawing threads (default: number of CPUs).
+
+    Returns:
+    - list: Number of frames written to each clip.
+    """
+    with span('visualization.load_annotations'):
+        movement_df = load_table(movement_csv_path, columns=['Frame', 'Annotation'])
+
+    base_video = cv2.VideoCapture(base_video_path)
+    fps = base_video.get(cv2.CAP_PROP_FPS)
+    frame_width = int(base_video.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(base_video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total_frames = int(base_video.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    ranges = frame_ranges(ranges, fps, total_frames, unit)
+    if len(ranges) != len(output_video_paths):
+        raise ValueError(f"Got {len(ranges)} ranges but {len(output_video_paths)} output paths")
+
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    writers = [cv2.VideoWriter(path, fourcc, int(fps), (frame_width, frame_height)) for path in output_video_paths]
+    draw = _annotation_drawer(movement_df, total_frames, frame_width, frame_height)
+    try:
+        frames_written = render_ranges(base_video, writers, ranges, draw, num_workers=num_workers)
+    finally:
+        base_video.release()
+        for writer in writers:
+            writer.release()
+
+    for path, (start, end) in zip(output_video_paths, ranges):
+        print(f"Clip of frames {start}-{end} saved to: {path}")
+    return frames_written
+
+def annotate_video(base_video_path, movement_csv_path, output_video_path, num_workers=None):
     """
     Annotates the video with movement directions based on the provided CSV file.
 
     Parameters:
     - base_video_path (str): Path to the input video.
-    - movement_csv_path (str): Path to the CSV file containing movement annotations.
+    - movement_csv_path (str): Path to the CSV (or .npz/.parquet) file containing movement annotations.
     - output_video_path (str): Path to save the annotated video.
+    - num_workers (int, optional): Number of drawing threads (default: number of CPUs).
 
     Returns:
     - None
     """
     # Load movement direction data
-    movement_df = pd.read_csv(movement_csv_path)
+    with span('visualization.load_annotations'):
+        movement_df = load_table(movement_csv_path, columns=['Frame', 'Annotation'])
 
     # Open base video
     base_video = cv2.VideoCapture(base_video_path)
@@ -27,62 +301,14 @@ def annotate_video(base_video_path, movement_csv_path, output_video_path):
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
     out = cv2.VideoWriter(output_video_path, fourcc, fps, (frame_width, frame_height))
 
-    # Arrow position on the mid-right part of the frame
-    arrow_start = (frame_width - 150, frame_height // 2)
-    arrow_length = 300
+    draw = _annotation_drawer(movement_df, total_frames, frame_width, frame_height)
 
     # Process each frame
-    frame_idx = 0
-    while frame_idx < total_frames:
-        ret, base_frame = base_video.read()
-        if not ret:
-            break
-
-        # Get the movement direction for the current frame
-        movement = movement_df[movement_df['Frame'] == frame_idx]
-        if not movement.empty:
-            direction = movement.iloc[0]['Annotation']
-            if direction == "Up":
-                color = (0, 255, 0)  # Green for upward movement
-                arrow_end = (arrow_start[0], arrow_start[1] - arrow_length)
-                # Draw the arrow for upward movement
-                cv2.arrowedLine(
-                    base_frame,
-                    arrow_start,
-                    arrow_end,
-                    color,
-                    thickness=3,
-                    tipLength=0.4
-                )
-            elif direction == "Down":
-                color = (0, 0, 255)  # Red for downward movement
-                arrow_end = (arrow_start[0], arrow_start[1] + arrow_length)
-                # Draw the arrow for downward movement
-                cv2.arrowedLine(
-                    base_frame,
-                    arrow_start,
-                    arrow_end,
-                    color,
-                    thickness=3,
-                    tipLength=0.4
-                )
-            elif direction == "silence":
-                color = (255, 255, 0)  # Yellow for silence
-                # Draw a horizontal line for silence
-                cv2.line(
-                    base_frame,
-                    (arrow_start[0], arrow_start[1] - 150),  # Start of the line
-                    (arrow_start[0], arrow_start[1] + 150),  # End of the line
-                    color,
-                    thickness=3
-                )
-
-        # Write the annotated frame to the output video
-        out.write(base_frame)
-        frame_idx += 1
-
-    # Release resources
-    base_video.release()
-    out.release()
+    try:
+        run_frame_pipeline(base_video, out, total_frames, draw, num_workers=num_workers)
+    finally:
+        # Release resources
+        base_video.release()
+        out.release()
 
     print(f"Combined video with direction arrows saved to: {output_video_path}")
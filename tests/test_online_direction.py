@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from src.bow_direction_pca import DIRECTION_LABELS, majority_smooth
+from src.online_direction import TrailingMajority
+
+def smooth_online(codes, window_size, latency_frames):
+    smoother = TrailingMajority(window_size, latency_frames)
+    released = [smoother.push(code) for code in codes]
+    return [code for code in released if code is not None] + smoother.flush()
+
+@pytest.mark.parametrize('window_size', [1, 3, 5, 7, 9])
+@pytest.mark.parametrize('length', [1, 2, 4, 10, 200])
+def test_centered_window_matches_majority_smooth(window_size, length):
+    rng = np.random.default_rng(window_size * 1000 + length)
+    codes = rng.integers(0, len(DIRECTION_LABELS), length).astype(np.int8)
+    online = smooth_online(codes, window_size, window_size // 2)
+    np.testing.assert_array_equal(online, majority_smooth(codes, window_size))
+
+def test_runs_of_codes_match_majority_smooth():
+    # Long runs with short flickers, as in real bow strokes
+    rng = np.random.default_rng(0)
+    codes = np.repeat(rng.integers(0, len(DIRECTION_LABELS), 60), rng.integers(1, 12, 60)).astype(np.int8)
+    online = smooth_online(codes, 5, 2)
+    np.testing.assert_array_equal(online, majority_smooth(codes, 5))
+
+def test_even_window_is_rejected():
+    with pytest.raises(ValueError):
+        TrailingMajority(4, 2)